@@ -0,0 +1,226 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.python.org/3/library/asyncio-future.html und
+# https://www.postgresql.org/docs/current/using-explain.html erstellt.
+# Zulassungskontrolle für die generierten Abfragen: Jedes Statement braucht vor der Ausführung einen Platz, damit
+# wenige Nutzer mit mehrjährigen Aggregationen die Datenbank nicht für alle auslasten. Es gibt eine globale Grenze
+# gleichzeitiger Statements, eine Grenze pro Nutzer und eine für teure Statements. Die Kostenklasse (cheap, medium,
+# expensive) kommt aus der Kostenschätzung des Planers (EXPLAIN). Wartende Statements werden nach Klasse, laufenden
+# Statements ihres Nutzers und Ankunft sortiert: günstige Abfragen überholen teure, Nutzer mit weniger laufenden
+# Abfragen kommen zuerst. Pro ADMISSION_AGING Sekunden Wartezeit steigt ein Statement eine Klasse auf, damit teure
+# Abfragen nicht verhungern. Die Warteschlange ist begrenzt (ADMISSION_MAX_QUEUE) und ein Statement wartet höchstens
+# ADMISSION_QUEUE_TIMEOUT Sekunden. Wartende Statements halten ihre Verbindung aus dem Pool (EXPLAIN und
+# Session-Einstellungen sind schon gelaufen), ADMISSION_MAX_CONCURRENT + ADMISSION_MAX_QUEUE sollte daher unter
+# DB_POOL_SIZE + DB_MAX_OVERFLOW bleiben.
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+from agent import metrics, progress
+
+logger = logging.getLogger(__name__)
+
+enabled = os.getenv("ADMISSION", "1") == "1"
+# Gleichzeitige Statements insgesamt, pro Nutzer und der Klasse expensive (0 = keine Grenze pro Nutzer bzw. Klasse)
+max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "6"))
+max_per_user = int(os.getenv("ADMISSION_MAX_PER_USER", "2"))
+max_expensive = int(os.getenv("ADMISSION_MAX_EXPENSIVE", "2"))
+# Länge der Warteschlange, maximale Wartezeit und Wartezeit pro Aufstieg um eine Klasse in Sekunden (0 = kein Aufstieg)
+max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "12"))
+queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "60"))
+aging = float(os.getenv("ADMISSION_AGING", "10"))
+# Grenzen der Kostenklassen (Total Cost des Plans): darunter cheap, ab expensive_cost expensive
+cheap_cost = float(os.getenv("ADMISSION_CHEAP_COST", "1e5"))
+expensive_cost = float(os.getenv("ADMISSION_EXPENSIVE_COST", "1e7"))
+cost_classes = ("cheap", "medium", "expensive")
+# Läufe ohne Nutzer (Benchmarks, Validierung) teilen sich nur die globale Grenze
+anonymous = "none"
+
+
+class Rejected(Exception):
+    """
+    Das Statement wurde nicht zugelassen (Warteschlange voll oder Wartezeit überschritten). Die Datenbank ist
+    ausgelastet, eine umgeschriebene Abfrage hilft hier nicht.
+    """
+
+
+def current_user() -> str:
+    """
+    Nutzer des aktuellen Graph-Laufs (configurable user_id, sonst session_id), sonst "none".
+    """
+    config = var_child_runnable_config.get() or {}
+    configurable = config.get("configurable") or {}
+    return str(configurable.get("user_id") or configurable.get("session_id") or anonymous)
+
+
+def cost_class(cost: Optional[float]) -> str:
+    """
+    Kostenklasse eines Statements aus der Schätzung des Planers (ohne Plan medium).
+    """
+    if cost is None:
+        return "medium"
+    if cost < cheap_cost:
+        return "cheap"
+    return "expensive" if cost >= expensive_cost else "medium"
+
+
+class Ticket:
+    """
+    Ein Statement in der Warteschlange bzw. mit einem Platz.
+    """
+
+    def __init__(self, user: str, cost_class: str, seq: int):
+        self.user = user
+        self.cost_class = cost_class
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.future = asyncio.get_running_loop().create_future()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+class Scheduler:
+    """
+    Vergibt Plätze für Statements nach den Grenzen und der Priorität der wartenden Statements.
+    """
+
+    def __init__(self, max_concurrent: int = max_concurrent, max_per_user: int = max_per_user, max_expensive: int = max_expensive,
+                 max_queue: int = max_queue, aging: float = aging):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_expensive = max_expensive
+        self.max_queue = max_queue
+        self.aging = aging
+        self.running = {c: 0 for c in cost_classes}
+        self.users = {}
+        self.waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _allowed(self, ticket: Ticket) -> bool:
+        if sum(self.running.values()) >= self.max_concurrent:
+            return False
+        if self.max_per_user and ticket.user != anonymous and self.users.get(ticket.user, 0) >= self.max_per_user:
+            return False
+        return not (ticket.cost_class == "expensive" and self.max_expensive and self.running["expensive"] >= self.max_expensive)
+
+    def _priority(self, ticket: Ticket, now: float) -> tuple:
+        rank = cost_classes.index(ticket.cost_class)
+        if self.aging > 0:
+            rank = max(0, rank - int((now - ticket.enqueued) / self.aging))
+        return rank, self.users.get(ticket.user, 0), ticket.seq
+
+    def _dispatch(self) -> list:
+        # Freie Plätze an die wartenden Statements mit der höchsten Priorität vergeben (unter self._lock)
+        granted = []
+        now = time.monotonic()
+        while True:
+            candidates = [t for t in self.waiting if self._allowed(t)]
+            if not candidates:
+                break
+            ticket = min(candidates, key=lambda t: self._priority(t, now))
+            self.waiting.remove(ticket)
+            self.running[ticket.cost_class] += 1
+            self.users[ticket.user] = self.users.get(ticket.user, 0) + 1
+            ticket.granted = True
+            granted.append(ticket)
+        return granted
+
+    def _publish(self, granted: list) -> None:
+        # Gauges aktualisieren und die zugelassenen Statements wecken (auch aus einem anderen Event-Loop)
+        for name in cost_classes:
+            metrics.admission_queue_depth.set(sum(t.cost_class == name for t in self.waiting), name)
+            metrics.admission_running.set(self.running[name], name)
+        for ticket in granted:
+            ticket.future.get_loop().call_soon_threadsafe(_wake, ticket.future)
+
+    async def acquire(self, user: str, cost_class: str, timeout: float = queue_timeout) -> Ticket:
+        """
+        Warte auf einen Platz.
+        :param timeout: Maximale Wartezeit in Sekunden.
+        :return: Das Ticket, das mit release wieder freigegeben wird.
+        """
+        ticket = Ticket(user, cost_class, next(self._seq))
+        with self._lock:
+            self.waiting.append(ticket)
+            granted = self._dispatch()
+            full = not ticket.granted and len(self.waiting) > self.max_queue
+            if full:
+                self.waiting.remove(ticket)
+            position = self.waiting.index(ticket) + 1 if ticket in self.waiting else 0
+            self._publish(granted)
+        if ticket.granted:
+            metrics.admission_outcomes.inc("admitted", cost_class)
+            metrics.admission_wait_seconds.observe(0.0, cost_class)
+            return ticket
+        if full:
+            metrics.admission_outcomes.inc("full", cost_class)
+            raise Rejected(f"The database is busy: {self.max_queue} statements are already waiting for execution. Please try again later.")
+        await progress.emit("execute_queued", {"cost_class": cost_class, "position": position, "running": sum(self.running.values())})
+        try:
+            await asyncio.wait_for(ticket.future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not ticket.granted:
+                    self.waiting.remove(ticket)
+                    self._publish([])
+            if not ticket.granted:
+                metrics.admission_outcomes.inc("cancelled" if isinstance(e, asyncio.CancelledError) else "timeout", cost_class)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise Rejected(f"The database is busy: the query waited {timeout:.1f}s for one of {self.max_concurrent} execution slots. "
+                               "Please try again later.") from None
+            # Der Platz wurde gerade noch vergeben
+            if isinstance(e, asyncio.CancelledError):
+                self.release(ticket)
+                raise
+        metrics.admission_outcomes.inc("queued", cost_class)
+        metrics.admission_wait_seconds.observe(time.monotonic() - ticket.enqueued, cost_class)
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            self.running[ticket.cost_class] -= 1
+            self.users[ticket.user] -= 1
+            if not self.users[ticket.user]:
+                del self.users[ticket.user]
+            self._publish(self._dispatch())
+
+    def state(self) -> dict:
+        """
+        Laufende und wartende Statements pro Klasse und Nutzer.
+        """
+        with self._lock:
+            return {"running": dict(self.running), "users": dict(self.users),
+                    "waiting": {name: sum(t.cost_class == name for t in self.waiting) for name in cost_classes}}
+
+
+scheduler = Scheduler()
+
+
+@contextlib.asynccontextmanager
+async def slot(cost: Optional[float], timeout: Optional[float] = None):
+    """
+    Warte auf einen Platz für ein Statement und gib ihn nach der Ausführung wieder frei.
+    :param cost: Die geschätzten Kosten aus dem Plan (None = unbekannt).
+    :param timeout: Maximale Wartezeit in Sekunden, höchstens queue_timeout (z.B. das statement_timeout).
+    :return: Die Kostenklasse des Statements.
+    """
+    name = cost_class(cost)
+    if not enabled:
+        yield name
+        return
+    ticket = await scheduler.acquire(current_user(), name, min(queue_timeout, timeout) if timeout else queue_timeout)
+    try:
+        yield name
+    finally:
+        scheduler.release(ticket)
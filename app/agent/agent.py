@@ -1,15 +1,18 @@
 # Diese Datei wurde mit der Dokumentation von https://python.langchain.com/docs/introduction/ und 
 # https://langchain-ai.github.io/langgraph/concepts/why-langgraph/ erstellt.
 # Selbstdefinierte Imports
-import os
+import asyncio
+import functools
+import logging
 from typing import Literal
-from langchain_mistralai import ChatMistralAI
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-import re
-from agent.schema import arrivals, departures, station, trainnames, holidays, engine
-from sqlalchemy import text
-import pandas as pd
+from agent import admission, cancellation, hedging, llm, metrics, offload, planner, progress, repair, router, schema_linking
+from agent.schema import asnapshot, schema_prompt
+from agent.executor import execute_query
+from agent.compaction import compact_result, supervisor_token_budget
+from agent.result import row_count
+from agent.sql_cache import get_cache
+from agent.result_cache import cached_query
+from agent.sql_memory import get_memory, few_shot, memory_k
 from types import SimpleNamespace
 
 # Mit Hilfe der Dokumentation von LangGraph und Langchain geschrieben
@@ -18,9 +21,7 @@ from langgraph.graph import StateGraph, MessagesState, START, END
 from typing_extensions import TypedDict
 from langchain_core.output_parsers import JsonOutputParser
 
-mistral_model = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
-gemma_model = os.getenv("GOOGLE_MODEL", "gemma-3-27b-it")
-openai_model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini-2025-04-14")
+logger = logging.getLogger(__name__)
 
 class GraphState(TypedDict):
     messages: MessagesState
@@ -32,13 +33,37 @@ class GraphState(TypedDict):
     error: str
     error_count: int
     intrepreted: bool
+    data_question: str
+    answered_question: str
+    routed_question: str
+    supervisor_calls: int
+    supervisor_saved: int
+    supervisor_retries: int
+    full_schema_question: str
+    deadline: float
+    deadline_key: str
 
 
 # Supervisor zum handeln ob Querry oder Interpretation gemacht werden soll
-def supervisor(state: GraphState) -> Command[Literal["query_agent", "interpretation_agent", END]]:
+async def supervisor(state: GraphState) -> Command[Literal["query_agent", "interpretation_agent", END]]:
+    counts = router.counters(state)
+    # Schneller Pfad: Wenn der Zustand den nächsten Schritt eindeutig bestimmt, wird kein LLM aufgerufen
+    next_agent = router.route(state)
+    if next_agent is not None:
+        counts["supervisor_saved"] += 1
+        router.report(counts, next_agent)
+        metrics.supervisor_decisions.inc("rule", next_agent)
+        await progress.emit("route", {"next_agent": next_agent, "llm": False})
+        return Command(goto=next_agent), counts
+    if state["config"]["model_query"] == "dryrun":
+        next_agent = router.fallback(state)
+        router.report(counts, next_agent)
+        metrics.supervisor_decisions.inc("fallback", next_agent)
+        await progress.emit("route", {"next_agent": next_agent, "llm": False})
+        return Command(goto=next_agent), counts
     question = state["question"]
     try:
-        data = state["data"]
+        data = compact_result(state["data"], supervisor_token_budget)
     except:
         data = {}
     try:
@@ -56,53 +81,50 @@ def supervisor(state: GraphState) -> Command[Literal["query_agent", "interpretat
     Answer: {answer}\n
     Decide wether to create a query and get new data from the database or to end if already everything is answered or to interpret the data already available.\n
     Answer with a json like {json_answer}.\n"""
-    if state["config"]["model_query"] == "mistral":
-        response = ChatMistralAI(
-            model_name=mistral_model,
-            temperature=0.15,
-        ).invoke(template.format(question=question, data=data, answer=answer, json_answer=json_answer))
-    elif state["config"]["model_query"] == "openai":
-        response = ChatOpenAI(
-            model=openai_model,
-            temperature=0.15,
-        ).invoke(template.format(question=question, data=data, answer=answer, json_answer=json_answer))
-    elif state["config"]["model_query"] == "google":
-        response = ChatGoogleGenerativeAI(
-            model=gemma_model,
-            temperature=0.15,
-        ).invoke(template.format(question=question, data=data, answer=answer, json_answer=json_answer))
+    if llm.has_provider(state["config"]["model_query"]):
+        response = await llm.ainvoke(state["config"]["model_query"], template.format(question=question, data=data, answer=answer, json_answer=json_answer))
     else:
         raise ValueError("Unknown model for query agent")
+    counts["supervisor_calls"] += 1
     parser = JsonOutputParser()
     raw = response.content if hasattr(response, "content") else str(response)
     raw = raw.replace("'", '"')
     try:
         parsed_dict = parser.parse(raw)
         next_agent = parsed_dict["next_agent"]
+        if next_agent not in router.next_agents:
+            raise ValueError(f"Unknown next agent: {next_agent}")
     except Exception as e:
-        return Command(goto="supervisor")
+        # Begrenzte Anzahl an Wiederholungen, danach deterministisch entscheiden
+        counts["supervisor_retries"] += 1
+        if counts["supervisor_retries"] <= router.max_retries:
+            metrics.supervisor_retries.inc()
+            return Command(goto="supervisor"), counts
+        next_agent = router.fallback(state)
+        source = "fallback"
+    else:
+        source = "llm"
 
-    return Command(goto=next_agent)
+    router.report(counts, next_agent)
+    metrics.supervisor_decisions.inc(source, next_agent)
+    await progress.emit("route", {"next_agent": next_agent, "llm": True})
+    return Command(goto=next_agent), counts
 
-def query_agent(state: GraphState) -> Command[Literal["supervisor",  "query_agent", END]]:
-    question = state["question"]
-    try:
-        query = state["query"]
-    except:
-        query = ""
-    try:
-        error = state["error"]
-    except:
-        error = ""
-    template = f"""You are a query agent for a timescale database tsb15. You build a query base on the user question execute it and if nesseary correct errors in the query.
+def query_prompt(question: str, query: str, error: str, examples: str, schema: str) -> str:
+    """
+    Baue den Prompt des Query Agents.
+    :param examples: Formatierte Gold-Beispiele (few_shot) oder ein leerer String.
+    :param schema: Beschreibung der Tabellen (schema_prompt, ggf. durch das Schema-Linking reduziert).
+    """
+    if examples:
+        examples = f"""Verified example queries for similar questions:
+{examples}
+    """
+    return f"""You are a query agent for a timescale database tsb15. You build a query base on the user question execute it and if nesseary correct errors in the query.
     The timescale database has the following tables in schema oebb: 
-    - {arrivals.name}: {arrivals.columns._all_columns}
-    - {departures.name}: {departures.columns._all_columns}
-    - {station.name}: {station.columns._all_columns}
-    - {trainnames.name}: {trainnames.columns._all_columns}
-    - {holidays.name}: {holidays.columns._all_columns}
+{schema}
     Use if needed the timescale hypertable feature to query the data like time_bucket, time_bucket_gapfill, stats_agg(1D), stats_agg(2D), etc.
-    The user question is: {question}
+    {examples}    The user question is: {question}
     The last query was: {query}
     The last error of that query was: {error}
     The query should be in english.
@@ -112,102 +134,185 @@ def query_agent(state: GraphState) -> Command[Literal["supervisor",  "query_agen
     - The arrivalstatus and departurestatus have following values: 'Ausfall', 'Neu' or Null. It does not contain anyother values. Only use them if nessecary.
     - arrivalmintues and departuremintues are the delay in minutes.
     """
-    if state["config"]["model_query"] == "mistral":
-        response = ChatMistralAI(
-            model_name=mistral_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_query"] == "openai":
-        response = ChatOpenAI(
-            model=openai_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_query"] == "google":
-        response = ChatGoogleGenerativeAI(
-            model=gemma_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_query"] == "dryrun":
-        response = SimpleNamespace(content="SELECT * FROM oebb.arrivals LIMIT 10; -- Das ist ein Testlauf. Die Antwort ist statisch und es wird kein LLM verwendet.")
+
+async def query_agent(state: GraphState) -> Command[Literal["supervisor",  "query_agent", END]]:
+    question = state["question"]
+    try:
+        query = state["query"]
+    except:
+        query = ""
+    try:
+        error = state["error"]
+    except:
+        error = ""
+    # Zeitbudget pro Frage (und Chainlit-Nachricht), bei einer neuen Frage beginnen auch die Versuche von vorn
+    _, message = cancellation.current()
+    deadline_key = f"{message}:{question}"
+    if state.get("deadline_key") != deadline_key:
+        state["deadline"] = cancellation.new_deadline(state["config"].get("question_budget", cancellation.question_budget))
+        state["error_count"] = 0
+    budget = {'deadline': state["deadline"], 'deadline_key': deadline_key, 'error_count': state["error_count"]}
+
+    async def stop(answer: str, outcome: str):
+        metrics.record_outcome(outcome, state.get("error_count"))
+        # Ohne Interpretation Agent wird keine Antwort gestreamt, die App zeigt sie über das Event an
+        await progress.emit("answer", {"answer": answer, "outcome": outcome})
+        return Command(goto=END), {**budget, 'error_count': state.get("error_count"), 'answer': answer, 'answered_question': question}
+
+    if cancellation.registry.is_cancelled():
+        return await stop("The question was cancelled.", "cancelled")
+    if cancellation.expired(state["deadline"]):
+        return await stop("The time budget for this question was exceeded. Please ask a more specific question.", "budget")
+    # Schema-Snapshot ggf. in einem Thread laden (falls er beim Start der App nicht geladen werden konnte)
+    await asnapshot()
+    # Ähnliche Gold-Beispiele aus dem SQL-Gedächtnis als Few-Shot-Beispiele
+    k = state["config"].get("sql_memory_k", memory_k)
+    exclude = question if state["config"].get("sql_memory_leave_one_out") else None
+    examples = few_shot(get_memory().search(question, k, exclude=exclude))
+    # Schema-Linking: nur die relevanten Tabellen und Spalten, nach einer unbekannten Spalte oder Tabelle wieder alles
+    selection = None
+    if state["config"].get("schema_linking", schema_linking.linking) and state.get("full_schema_question") != question:
+        selection = await schema_linking.alink(question)
+    template = query_prompt(question, query, error, examples, schema_prompt(indent="    ", selection=selection))
+    # Semantischer Cache: bei einer sicheren Übereinstimmung wird das verifizierte SQL ohne LLM verwendet,
+    # außer es ist genau die Abfrage, die beim letzten Versuch fehlgeschlagen ist
+    cached_sql = None
+    use_cache = state["config"].get("cache", True)
+    if use_cache and state["config"]["model_query"] != "dryrun":
+        cached_sql = get_cache().lookup(question)
+        if cached_sql is not None and cached_sql == query:
+            cached_sql = None
+
+    # Jede Wiederholung mit kürzerem statement_timeout, die Ausführung endet spätestens mit dem Zeitbudget
+    timeout = cancellation.attempt_timeout(state["error_count"] + 1, state["deadline"], state["config"].get("statement_timeout"))
+
+    repairs = {}
+
+    async def execute(sql: str) -> dict:
+        # Kostenprüfung mit EXPLAIN (agent.planner), in Benchmarks über die Konfiguration abschaltbar
+        run_query = functools.partial(execute_query, timeout=timeout, plan_gate=state["config"].get("plan_gate", planner.plan_gate))
+        return await cached_query(sql, run_query) if use_cache else await run_query(sql)
+
+    async def run(sql: str) -> dict:
+        # Mechanische Fehler zuerst lokal reparieren (agent.repair), erst danach wird das LLM erneut gefragt
+        if state["config"].get("sql_repair", repair.enabled):
+            repairs[sql] = repair.Repairer(execute, state["config"]["model_query"])
+            return await asyncio.wait_for(repairs[sql].run(sql), cancellation.remaining(state["deadline"]))
+        return await asyncio.wait_for(execute(sql), cancellation.remaining(state["deadline"]))
+
+    def repaired(sql: str) -> str:
+        # Die zuletzt ausgeführte (ggf. reparierte) Abfrage
+        return repairs[sql].sql if sql in repairs and repairs[sql].sql else sql
+
+    # Hedging: mehrere Provider gleichzeitig, die erste ausführbare Abfrage mit Ergebnis gewinnt
+    providers = hedging.providers_for(state["config"]) if cached_sql is None else []
+    hedged = None
+    if providers:
+        try:
+            hedged = await hedging.race(providers, template, run)
+        except hedging.HedgeFailed as e:
+            # Für den nächsten Versuch die Abfrage und den Fehler des primären Providers (sonst des ersten mit Abfrage)
+            hedged = next((c for c in e.candidates if c.query), e.candidates[0])
+        parsed_sql = repaired(hedged.query)
+        source = f"hedge:{hedged.provider}"
     else:
-        raise ValueError("Unknown model for query agent")
-    
-    m = re.search(r'```(?:\w+)?\s*(.*?)```', response.content, re.DOTALL)
-    parsed_sql = m.group(1).strip() if m else response.content.strip()
+        if cached_sql is not None:
+            response = SimpleNamespace(content=cached_sql)
+        elif state["config"]["model_query"] == "dryrun":
+            response = SimpleNamespace(content="SELECT * FROM oebb.arrivals LIMIT 10; -- Das ist ein Testlauf. Die Antwort ist statisch und es wird kein LLM verwendet.")
+        elif llm.has_provider(state["config"]["model_query"]):
+            response = await llm.ainvoke(state["config"]["model_query"], template)
+        else:
+            raise ValueError("Unknown model for query agent")
+        parsed_sql = hedging.parse_sql(response.content)
+        source = "cache" if cached_sql is not None else state["config"]["model_query"]
     state["query"] = parsed_sql
+    await progress.emit("sql", {"query": parsed_sql, "source": source, "attempt": (state.get("error_count") or 0) + 1})
     
     try:
-        statements = [q.strip() for q in query.strip().split(';') if q.strip()]
-        dfs = []
-        timeout = 450000  # Timeout in Millisekunden (7,5 Minuten)
-        with engine.connect() as conn:
-            conn.execute(text(f"SET statement_timeout = {timeout}"))
-            for stmt in statements:
-                compiled = text(stmt).compile(bind=conn)
-                df = pd.read_sql_query(compiled, con=conn)
-                dfs.append(df)
-        if not dfs:
-            state["data"] = []
-        combined_df = pd.concat(dfs, ignore_index=True)
-        state["data"] = combined_df.to_dict(orient="records")
-        if len(df) == 0:
+        if hedged is None:
+            state["data"] = await run(parsed_sql)
+            if repaired(parsed_sql) != parsed_sql:
+                parsed_sql = state["query"] = repaired(parsed_sql)
+                await progress.emit("sql", {"query": parsed_sql, "source": "repair", "attempt": (state.get("error_count") or 0) + 1})
+        elif hedged.error is None or hedged.error == hedging.no_results:
+            state["data"] = hedged.data or []
+        else:
+            # Der ursprüngliche Fehler, damit z.B. eine Ablehnung der Zulassungskontrolle erkannt wird
+            raise hedged.exception or RuntimeError(hedged.error)
+        await progress.emit("result", progress.preview(state["data"]))
+        if row_count(state["data"]) == 0:
             state["error"] = "The query returned no results."
             state["data"] = []
+            metrics.query_attempts.inc("no_results")
             try:
                 state["error_count"] += 1
             except:
                 state["error_count"] = 1
             if state["error_count"] > 3:
-                return  Command(goto="interpretation_agent"), {'data': state["data"], 'question': state["question"], 'query': state["query"]}
-            return Command(goto="query_agent"), {'data': state["data"], 'query': state["query"], 'error': state["error"], 'error_count': state["error_count"]}
+                metrics.record_outcome("no_results", state["error_count"])
+                return  Command(goto="interpretation_agent"), {**budget, 'data': state["data"], 'question': state["question"], 'query': state["query"], 'error_count': state["error_count"]}
+            return Command(goto="query_agent"), {**budget, 'data': state["data"], 'query': state["query"], 'error': state["error"], 'error_count': state["error_count"]}
     except Exception as e:
+        if cancellation.registry.is_cancelled():
+            return await stop("The question was cancelled.", "cancelled")
+        if isinstance(e, asyncio.TimeoutError) or cancellation.expired(state["deadline"]):
+            return await stop("The time budget for this question was exceeded. Please ask a more specific question.", "budget")
+        # Die Datenbank ist ausgelastet, ein weiterer Versuch des LLM würde nur wieder warten
+        if isinstance(e, admission.Rejected):
+            return await stop(str(e), "busy")
+        state["query"] = repaired(state["query"])
         state["error"] = str(e)
         state["data"] = []
+        await progress.emit("error", {"error": state["error"], "query": state["query"]})
+        metrics.query_attempts.inc("error")
         try:
             state["error_count"] += 1
         except:
             state["error_count"] = 1
         if state["error_count"] > 3:
-            state["answer"] = "I encountered too many errors while trying to execute the query. Please try again later."
-            return Command(goto=END)
-        return Command(goto="query_agent"), {'data': state["data"], 'query': state["query"], 'error': state["error"], 'error_count': state["error_count"]}
-    return Command(goto="supervisor"), {'data': state["data"], 'question': state["question"], 'query': state["query"]}
+            return await stop("I encountered too many errors while trying to execute the query. Please try again later.", "failed")
+        update = {**budget, 'data': state["data"], 'query': state["query"], 'error': state["error"], 'error_count': state["error_count"]}
+        if selection is not None and schema_linking.undefined_identifier.search(state["error"]):
+            update['full_schema_question'] = question
+        return Command(goto="query_agent"), update
+    metrics.query_attempts.inc("ok")
+    metrics.record_outcome("success", state.get("error_count"))
+    if use_cache and cached_sql is None and state["config"]["model_query"] != "dryrun":
+        get_cache().store(question, parsed_sql)
+    # Große Ergebnisse in den Bucket auslagern, im Checkpoint bleibt nur das Handle
+    if state["config"].get("offload", offload.enabled):
+        state["data"] = await offload.aoffload(state["data"])
+    return Command(goto="supervisor"), {**budget, 'data': state["data"], 'question': state["question"], 'query': state["query"], 'data_question': state["question"]}
     
-def interpretation_agent(state: GraphState) -> Command[Literal["supervisor"]]:
+async def interpretation_agent(state: GraphState) -> Command[Literal["supervisor"]]:
+    data = state.get("data")
+    try:
+        data = await offload.aload(data)
+    except Exception as e:
+        # Ohne Zugriff auf den Bucket bleibt die Zusammenfassung des Handles
+        logger.warning("Could not load offloaded result: %s", e)
     template = f"""You are an interpretation agent for a timescale database tsb15. You interpret the data from the last query and answer the user question.
     Most delays in the data set are in minutes. Unless otherwise specified, assume that the data is in minutes.
-    The data from the  query is: {state["data"]}
+    The data from the  query is: {compact_result(data)}
     The user question is: {state["question"]}
     The answer should be in the same language as the user question.
     """
-    if state["config"]["model_interpret"] == "mistral":
-        response = ChatMistralAI(
-            model_name=mistral_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_interpret"] == "openai":
-        response = ChatOpenAI(
-            model=openai_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_interpret"] == "google":
-        response = ChatGoogleGenerativeAI(
-            model=gemma_model,
-            temperature=0.15,
-        ).invoke(template)
-    elif state["config"]["model_interpret"] == "dryrun":
+    if state["config"]["model_interpret"] == "dryrun":
         response = SimpleNamespace(content="Das ist ein Testlauf. Die Antwort ist statisch und es wird kein LLM verwendet.")
+    elif llm.has_provider(state["config"]["model_interpret"]):
+        response = await llm.ainvoke(state["config"]["model_interpret"], template)
     else:
         raise ValueError("Unknown model for query agent")
     state["answer"] = response.content
-    return Command(goto="supervisor"), {'answer': state["answer"]}
+    return Command(goto="supervisor"), {'answer': state["answer"], 'answered_question': state["question"]}
 
 # Graph Nodes definieren
 def workflow():
     workflow = StateGraph(GraphState)
-    workflow.add_node(supervisor)
-    workflow.add_node(query_agent)
-    workflow.add_node(interpretation_agent)
+    workflow.add_node(metrics.timed(supervisor))
+    workflow.add_node(metrics.timed(query_agent))
+    workflow.add_node(metrics.timed(interpretation_agent))
     # Graph Edges definieren
     workflow.add_edge(START, "supervisor")
 
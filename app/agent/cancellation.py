@@ -0,0 +1,179 @@
+# Diese Datei wurde mit der Dokumentation von https://www.postgresql.org/docs/current/functions-admin.html#FUNCTIONS-ADMIN-SIGNAL
+# und https://docs.chainlit.io/api-reference/lifecycle-hooks/on-chat-end erstellt.
+# Abbruch laufender Abfragen des Query Agents. Jede Ausführung wird mit der Backend-PID ihrer Verbindung und der
+# Chainlit-Session bzw. Nachricht registriert (aus der configurable des Graph-Laufs). Trennt sich die Session, kommt
+# eine neue Nachricht, drückt der Nutzer auf Stopp oder ist das Zeitbudget der Frage aufgebraucht, wird der Task der
+# Nachricht abgebrochen und die Abfrage serverseitig mit pg_cancel_backend beendet, statt bis zum statement_timeout
+# weiterzulaufen (auf der Engine, über die sie läuft, also ggf. dem Read-Replica). Wiederholungen bekommen ein immer
+# kürzeres statement_timeout.
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+from sqlalchemy import text
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+# Zeitbudget einer Frage in Sekunden über alle Versuche (0 = ohne Budget)
+question_budget = float(os.getenv("QUESTION_BUDGET_SECONDS", "600"))
+# Faktor für das statement_timeout jeder Wiederholung und Untergrenze in Millisekunden
+timeout_decay = float(os.getenv("QUERY_TIMEOUT_DECAY", "0.5"))
+min_timeout = int(os.getenv("QUERY_MIN_TIMEOUT", "30000"))
+application_name = "query_writer"
+
+# Nur die eigene, noch laufende Abfrage abbrechen: die PID könnte sonst schon eine andere Abfrage ausführen
+cancel_sql = """
+SELECT pg_cancel_backend(pid) FROM pg_stat_activity
+WHERE pid = :pid AND application_name = :tag AND state = 'active'
+"""
+
+
+def current() -> tuple:
+    """
+    Session und Nachricht des aktuellen Graph-Laufs (configurable session_id und message_id), sonst "none".
+    """
+    config = var_child_runnable_config.get() or {}
+    configurable = config.get("configurable") or {}
+    return str(configurable.get("session_id") or "none"), str(configurable.get("message_id") or "none")
+
+
+def attempt_timeout(attempt: int, deadline: Optional[float] = None, timeout: Optional[int] = None) -> int:
+    """
+    statement_timeout eines Versuchs: timeout beim ersten Versuch, danach jeweils mal timeout_decay (mindestens
+    min_timeout) und höchstens die verbleibende Zeit bis zur deadline.
+    :param attempt: Nummer des Versuchs ab 1.
+    :return: Das Timeout in Millisekunden.
+    """
+    from agent.executor import statement_timeout
+    timeout = timeout or statement_timeout
+    value = max(min(min_timeout, timeout), int(timeout * timeout_decay ** max(0, attempt - 1)))
+    if deadline is not None:
+        value = min(value, max(1, int(remaining(deadline) * 1000)))
+    return value
+
+
+def new_deadline(budget: float = question_budget) -> Optional[float]:
+    return time.time() + budget if budget > 0 else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """
+    Verbleibende Sekunden bis zur deadline (None = ohne Budget).
+    """
+    return None if deadline is None else deadline - time.time()
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.time() >= deadline
+
+
+class Registry:
+    """
+    Laufende Nachrichten (asyncio-Tasks) und Abfragen (Backend-PIDs) pro Session.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        # application_name -> (Session, Nachricht, PID, Engine), die PIDs von Primary und Replica können sich überschneiden
+        self.statements = {}
+        self.cancelled = set()
+        self._lock = threading.Lock()
+
+    def begin(self, session: str, message: str, task: Optional[asyncio.Task] = None) -> None:
+        with self._lock:
+            self.tasks.setdefault(session, {})[message] = task
+
+    def end(self, session: str, message: str) -> None:
+        with self._lock:
+            self.tasks.get(session, {}).pop(message, None)
+            if not self.tasks.get(session):
+                self.tasks.pop(session, None)
+            self.cancelled.discard((session, message))
+
+    def register(self, pid: int, tag: str, engine=None) -> None:
+        with self._lock:
+            self.statements[tag] = (*current(), pid, engine)
+
+    def unregister(self, tag: str) -> None:
+        with self._lock:
+            self.statements.pop(tag, None)
+
+    def is_cancelled(self, session: Optional[str] = None, message: Optional[str] = None) -> bool:
+        if session is None:
+            session, message = current()
+        return (session, message) in self.cancelled
+
+    def running(self, session: str) -> list:
+        with self._lock:
+            return [(pid, tag, engine) for tag, (s, _, pid, engine) in self.statements.items() if s == session]
+
+    async def cancel_session(self, session: str, reason: str) -> int:
+        """
+        Breche alle Nachrichten einer Session ab: die Tasks und die laufenden Abfragen.
+        :param reason: Grund für die Metrik (superseded, disconnect, stopped).
+        :return: Anzahl der serverseitig abgebrochenen Abfragen.
+        """
+        with self._lock:
+            tasks = self.tasks.pop(session, {})
+            self.cancelled.update((session, message) for message in tasks)
+        for task in tasks.values():
+            if task is not None and task is not asyncio.current_task() and not task.done():
+                task.cancel()
+        # Auch ohne Task (oder wenn der Task den Abbruch nicht rechtzeitig erreicht) auf dem Server abbrechen
+        cancelled = 0
+        for pid, tag, engine in self.running(session):
+            cancelled += await cancel_backend(pid, tag, reason, engine)
+        return cancelled
+
+
+registry = Registry()
+
+
+async def cancel_backend(pid: int, tag: str, reason: str, engine=None) -> bool:
+    """
+    Breche die laufende Abfrage einer Backend-PID mit pg_cancel_backend ab (über eine eigene Verbindung des Pools).
+    :param engine: Die Engine der Abfrage (Standard: agent.schema.async_engine).
+    :return: True, wenn Postgres das Signal gesendet hat.
+    """
+    from agent.schema import async_engine
+    try:
+        async with (engine or async_engine).connect() as conn:
+            sent = bool((await conn.execute(text(cancel_sql), {"pid": pid, "tag": tag})).scalar())
+    except Exception as e:
+        logger.warning("Could not cancel backend %s: %s", pid, e)
+        return False
+    if sent:
+        metrics.query_cancellations.inc(reason)
+        logger.info("Cancelled backend %s (%s)", pid, reason)
+    return sent
+
+
+@contextlib.asynccontextmanager
+async def track(conn, timeout: int, engine=None):
+    """
+    Setze statement_timeout und einen eindeutigen application_name auf der Verbindung und registriere die
+    Backend-PID für die Dauer der Ausführung. Wird der Task abgebrochen (Stopp, Hedging, Zeitbudget), wird auch die
+    Abfrage auf dem Server abgebrochen.
+    :param conn: Die AsyncConnection der Ausführung.
+    :param engine: Die Engine der Verbindung (Standard: agent.schema.async_engine).
+    :return: Die Backend-PID.
+    """
+    tag = f"{application_name}:{uuid.uuid4().hex[:12]}"
+    pid = (await conn.execute(text("SELECT set_config('statement_timeout', :timeout, false), set_config('application_name', :tag, false), pg_backend_pid()"),
+                              {"timeout": str(timeout), "tag": tag})).one()[2]
+    registry.register(pid, tag, engine)
+    try:
+        yield pid
+    except asyncio.CancelledError:
+        await asyncio.shield(cancel_backend(pid, tag, "task", engine))
+        raise
+    finally:
+        registry.unregister(tag)
@@ -0,0 +1,142 @@
+# Diese Datei wurde mit der Dokumentation von https://pandas.pydata.org/docs/reference/frame.html erstellt.
+# Verdichtung von Abfrageergebnissen für Prompts: Statt aller Zeilen wird eine begrenzte Darstellung
+# (Schema, Spaltenstatistiken, Beispielzeilen und ein Zeitreihen-Downsample) innerhalb eines Token-Budgets erzeugt.
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from agent.result import is_columnar, is_offloaded, row_count, to_columns, to_records
+
+# Token-Budget für die Daten im Prompt des Interpretation Agents bzw. des Supervisors
+token_budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+supervisor_token_budget = int(os.getenv("SUPERVISOR_TOKEN_BUDGET", "500"))
+top_k = 5
+quantiles = [0.25, 0.5, 0.75]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Grobe Schätzung der Tokenanzahl (ca. 4 Zeichen pro Token).
+    """
+    return len(text) // 4 + 1
+
+
+def to_frame(data) -> pd.DataFrame:
+    """
+    Wandle ein Abfrageergebnis (Liste von Zeilen) in einen DataFrame um und konvertiere Decimal-Spalten in Zahlen.
+    """
+    df = pd.DataFrame(to_columns(data))
+    for col in df.columns[df.dtypes == object]:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def _datetime_columns(df: pd.DataFrame) -> list:
+    return [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+
+
+def _time_column(df: pd.DataFrame) -> Optional[str]:
+    columns = _datetime_columns(df)
+    return columns[0] if columns else None
+
+
+def _schema(df: pd.DataFrame) -> str:
+    return ", ".join(f"{col} ({dtype})" for col, dtype in df.dtypes.items())
+
+
+def _statistics(df: pd.DataFrame) -> str:
+    lines = []
+    nulls = df.isna().sum()
+    numeric = df.select_dtypes(include="number")
+    if not numeric.empty:
+        stats = numeric.agg(["min", "max", "mean"]).T
+        stats = stats.join(numeric.quantile(quantiles).T.rename(columns=lambda q: f"q{int(q * 100)}"))
+        for col, row in stats.iterrows():
+            values = ", ".join(f"{name}={value:.4g}" for name, value in row.items() if pd.notna(value))
+            lines.append(f"- {col}: {values}, nulls={nulls[col]}")
+    datetimes = _datetime_columns(df)
+    for col in datetimes:
+        lines.append(f"- {col}: min={df[col].min()}, max={df[col].max()}, nulls={nulls[col]}")
+    for col in df.columns.difference(numeric.columns).difference(datetimes):
+        values = df[col].astype(str).where(df[col].notna())
+        counts = values.value_counts().head(top_k)
+        top = ", ".join(f"{value!r}: {count}" for value, count in counts.items())
+        lines.append(f"- {col}: distinct={values.nunique()}, nulls={nulls[col]}, top={{{top}}}")
+    return "\n".join(lines)
+
+
+def _samples(df: pd.DataFrame, n: int) -> str:
+    if n <= 0:
+        return ""
+    # Gleichmäßig verteilte Zeilen inkl. erster und letzter Zeile
+    idx = np.unique(np.linspace(0, len(df) - 1, num=min(n, len(df))).astype(int))
+    rows = df.iloc[idx].copy()
+    for col in _datetime_columns(rows):
+        rows[col] = rows[col].astype(str)
+    return str(rows.to_dict(orient="records"))
+
+
+def _downsample(df: pd.DataFrame, time_col: Optional[str], points: int) -> str:
+    numeric = df.select_dtypes(include="number").columns
+    if time_col is None or numeric.empty or points <= 0 or len(df) <= points:
+        return ""
+    bins = pd.cut(df[time_col], bins=points)
+    # Jeder Bucket wird mit dem ersten Zeitpunkt darin beschriftet
+    grouped = df[[time_col, *numeric]].groupby(bins, observed=True).agg({time_col: "min", **{col: "mean" for col in numeric}})
+    return grouped.set_index(time_col).round(4).to_string()
+
+
+def compact_result(data, budget: int = token_budget) -> str:
+    """
+    Erzeuge eine Darstellung des Abfrageergebnisses, die das Token-Budget einhält.
+    Passt das gesamte Ergebnis in das Budget, wird es unverändert verwendet.
+    :param data: Das Abfrageergebnis (Liste von Zeilen als dict) oder bereits ein String.
+        Von einem ausgelagerten Ergebnis wird nur die Zusammenfassung des Handles verwendet.
+    :param budget: Das Token-Budget.
+    :return: Der Text für den Prompt.
+    """
+    if data is None:
+        return "[]"
+    if is_offloaded(data):
+        data = data["summary"]
+    if isinstance(data, str):
+        return data if estimate_tokens(data) <= budget else data[:budget * 4] + " ... (truncated)"
+    truncated = is_columnar(data) and data["truncated"]
+    # Jede Zeile braucht mindestens ein Token, große Ergebnisse werden daher gar nicht erst formatiert
+    if row_count(data) <= budget:
+        raw = str(to_records(data))
+        if truncated:
+            raw = f"The result was truncated after {row_count(data)} rows because it exceeded the row or size limit.\n{raw}"
+        if estimate_tokens(raw) <= budget:
+            return raw
+
+    df = to_frame(data)
+    time_col = _time_column(df)
+    if time_col is not None:
+        df = df.sort_values(time_col, kind="stable")
+    header = f"The result has {len(df)} rows and {len(df.columns)} columns and was compacted.\nSchema: {_schema(df)}"
+    if truncated:
+        header = f"The result was truncated after {len(df)} rows because it exceeded the row or size limit.\n{header}"
+    statistics = f"Column statistics:\n{_statistics(df)}"
+
+    # Beispielzeilen und Downsample so lange halbieren, bis das Budget eingehalten wird
+    samples, points = 20, 50
+    while True:
+        parts = [header, statistics]
+        downsample = _downsample(df, time_col, points)
+        if downsample:
+            parts.append(f"Mean of numeric columns over time ({time_col}, {points} buckets):\n{downsample}")
+        sample_rows = _samples(df, samples)
+        if sample_rows:
+            parts.append(f"Sample rows: {sample_rows}")
+        text = "\n".join(parts)
+        if estimate_tokens(text) <= budget or (samples == 0 and points == 0):
+            break
+        samples, points = samples // 2, points // 2
+    if estimate_tokens(text) > budget:
+        text = text[:budget * 4] + " ... (truncated)"
+    return text
@@ -0,0 +1,150 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html erstellt.
+# Asynchrone Ausführung der generierten SQL-Abfragen, damit der Event-Loop von Chainlit nicht blockiert wird.
+# Ergebnisse werden über serverseitige Cursor chunkweise gelesen und bei max_rows/max_bytes abgeschnitten.
+# Jede Ausführung ist mit ihrer Backend-PID registriert und kann abgebrochen werden (agent.cancellation).
+# Jedes Statement wartet nach EXPLAIN auf einen Platz der Zulassungskontrolle (agent.admission). Rein lesende
+# Abfragen laufen auf dem Read-Replica, wenn TIMESCALE_REPLICA_URL gesetzt ist.
+import contextlib
+import logging
+import re
+import time
+from sqlalchemy import text
+from agent.schema import async_engine, replica_engine
+from agent.result import ResultCollector, fetch_size, max_rows, max_bytes
+from agent import admission, cancellation, metrics, planner, progress, rollups
+
+logger = logging.getLogger(__name__)
+
+# Timeout in Millisekunden (7,5 Minuten)
+statement_timeout = 450000
+# Nur diese Statements können über einen serverseitigen Cursor (DECLARE ... CURSOR) gelesen werden
+cursor_statement = re.compile(r"^\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*(select|with|values|table)\b", re.IGNORECASE | re.DOTALL)
+# Schreibt ein lesendes Statement trotzdem (SELECT INTO, data-modifying CTEs, Sperren, Sequenzen, Session-Zustand)?
+writing_statement = re.compile(r"\b(insert|update|delete|merge|truncate|into|for\s+(?:no\s+key\s+)?update|for\s+(?:key\s+)?share|nextval|setval|"
+                               r"set_config|pg_advisory\w*|lo_\w+|txid_current)\b", re.IGNORECASE)
+# Sekunden bis zum nächsten Versuch über das Read-Replica, nachdem es nicht erreichbar war
+replica_retry = 30
+_replica_down_until = 0.0
+
+
+def split_statements(query: str) -> list:
+    """
+    Teile eine Abfrage mit mehreren SQL-Statements an den Semikolons auf.
+    """
+    return [q.strip() for q in query.strip().split(';') if q.strip()]
+
+
+def read_only(query: str) -> bool:
+    """
+    Prüfe, ob alle Statements einer Abfrage nur lesen und damit auf dem Read-Replica laufen können.
+    Im Zweifel (z.B. ein Schlüsselwort in einem String) wird die Abfrage als schreibend behandelt.
+    """
+    statements = split_statements(query)
+    return bool(statements) and all(cursor_statement.match(stmt) and not writing_statement.search(stmt) for stmt in statements)
+
+
+@contextlib.asynccontextmanager
+async def connect(query: str):
+    """
+    Verbindung für eine Abfrage: rein lesende Abfragen über das Read-Replica (falls konfiguriert), alle anderen und
+    lesende Abfragen bei einem nicht erreichbaren Replica über die primäre Datenbank.
+    :return: Die AsyncConnection und ihre Engine.
+    """
+    global _replica_down_until
+    engine, target = async_engine, "primary"
+    if replica_engine is not None and read_only(query):
+        engine, target = (replica_engine, "replica") if time.monotonic() >= _replica_down_until else (async_engine, "fallback")
+    try:
+        conn = await engine.connect()
+    except Exception as e:
+        if engine is async_engine:
+            raise
+        logger.warning("Read replica not reachable, using the primary for %ss: %s", replica_retry, e)
+        _replica_down_until = time.monotonic() + replica_retry
+        engine, target = async_engine, "fallback"
+        conn = await engine.connect()
+    metrics.query_routes.inc(target)
+    try:
+        yield conn, engine
+    finally:
+        await conn.close()
+
+
+async def execute_query(query: str, timeout: int = statement_timeout, max_rows: int = max_rows, max_bytes: int = max_bytes, plan_gate: bool = planner.plan_gate, rollup_rewrite: bool = rollups.rollup_rewrite) -> dict:
+    """
+    Führe die gegebene SQL-Abfrage asynchron aus und gebe das Ergebnis spaltenorientiert zurück.
+    Mehrere Statements werden einzeln ausgeführt und die Ergebnisse zusammengeführt.
+    :param query: Die SQL-Abfrage.
+    :param timeout: Das statement_timeout in Millisekunden.
+    :param max_rows: Maximale Anzahl an Zeilen, danach wird das Ergebnis als truncated markiert.
+    :param max_bytes: Maximale (geschätzte) Größe des Ergebnisses in Bytes.
+    :param plan_gate: Jedes Statement vorher mit EXPLAIN prüfen (wirft planner.PlanRejected).
+    :param rollup_rewrite: Passende Statements auf die Continuous Aggregates (agent.rollups) umschreiben.
+    :return: Das Ergebnis im Format von agent.result.
+    :raises admission.Rejected: Kein Platz in der Zulassungskontrolle innerhalb der Wartezeit.
+    """
+    collector = ResultCollector(max_rows, max_bytes)
+    started = time.perf_counter()
+    # Höchstens so lange auf einen Platz warten, wie das Statement laufen dürfte
+    wait = timeout / 1000
+    async with connect(query) as (conn, engine), cancellation.track(conn, timeout, engine):
+        for index, stmt in enumerate(split_statements(query)):
+            await progress.emit("execute_start", {"statement": index})
+            if not cursor_statement.match(stmt):
+                async with admission.slot(None, wait):
+                    result = await conn.execute(text(stmt))
+                    rows = result.fetchall() if result.returns_rows else None
+                if rows is not None and not collector.add(list(result.keys()), rows):
+                    break
+                continue
+            rewritten = await rollups.prepare(conn, stmt) if rollup_rewrite else None
+            if rewritten is not None:
+                stmt = rewritten
+            # Der Plan liefert auch die Kostenklasse für die Zulassungskontrolle
+            plan = None
+            if plan_gate:
+                plan = await planner.check(conn, stmt)
+            elif admission.enabled:
+                plan = await planner.explain(conn, stmt)
+            async with admission.slot(plan and plan["cost"], wait):
+                start = time.perf_counter()
+                result = await conn.stream(text(stmt), execution_options={"max_row_buffer": fetch_size})
+                keys = list(result.keys())
+                collector.add(keys, [])
+                async for partition in result.partitions(fetch_size):
+                    if not collector.add(keys, partition):
+                        break
+                    await progress.emit("execute_progress", {"statement": index, "rows": collector.rows})
+                await result.close()
+            rollups.record(rewritten is not None, time.perf_counter() - start)
+            if collector.truncated:
+                break
+    seconds = time.perf_counter() - started
+    metrics.sql_seconds.observe(seconds)
+    metrics.sql_rows.observe(collector.rows)
+    await progress.emit("execute_end", {"rows": collector.rows, "truncated": collector.truncated, "seconds": seconds})
+    return collector.result()
+
+
+def execute_query_sync(query: str, engine, timeout: int = statement_timeout, max_rows: int = max_rows, max_bytes: int = max_bytes) -> dict:
+    """
+    Synchrone Variante von execute_query für die Validierungsskripte.
+    :param engine: Die synchrone SQLAlchemy-Engine.
+    """
+    collector = ResultCollector(max_rows, max_bytes)
+    with engine.connect() as conn:
+        conn.execute(text(f"SET statement_timeout = {timeout}"))
+        for stmt in split_statements(query):
+            options = {"stream_results": True, "max_row_buffer": fetch_size} if cursor_statement.match(stmt) else {}
+            result = conn.execution_options(**options).execute(text(stmt))
+            if not result.returns_rows:
+                continue
+            keys = list(result.keys())
+            collector.add(keys, [])
+            for partition in result.partitions(fetch_size):
+                if not collector.add(keys, partition):
+                    break
+            result.close()
+            if collector.truncated:
+                break
+    return collector.result()
@@ -0,0 +1,194 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.python.org/3/library/asyncio-task.html erstellt.
+# Hedging für den Query Agent: Die Frage wird gleichzeitig (optional gestaffelt) an mehrere Provider geschickt.
+# Jede Antwort wird sofort ausgeführt, verwendet wird die erste Abfrage, die fehlerfrei läuft und Zeilen liefert.
+# Die übrigen Aufrufe (LLM und Datenbank) werden abgebrochen. Gewinne und Latenzen werden pro Provider gezählt.
+import asyncio
+import logging
+import os
+import re
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from agent import llm
+from agent.result import row_count
+
+logger = logging.getLogger(__name__)
+
+hedge = os.getenv("QUERY_HEDGE", "0") == "1"
+hedge_providers = [p.strip() for p in os.getenv("QUERY_HEDGE_PROVIDERS", "mistral,openai,google").split(",") if p.strip()]
+# Verzögerung in Sekunden, bevor die weiteren Provider gestartet werden (0 = alle sofort). Liefert der primäre
+# Provider vorher ein gültiges Ergebnis, werden die anderen gar nicht erst aufgerufen, schlägt er vorher fehl,
+# starten sie sofort.
+hedge_delay = float(os.getenv("QUERY_HEDGE_DELAY", "0"))
+no_results = "The query returned no results."
+
+
+def parse_sql(content: str) -> str:
+    """
+    Entferne einen Markdown-Codeblock um die Abfrage.
+    """
+    m = re.search(r'```(?:\w+)?\s*(.*?)```', content, re.DOTALL)
+    return m.group(1).strip() if m else content.strip()
+
+
+def providers_for(config: dict) -> list:
+    """
+    Provider für eine Frage: der gewählte model_query zuerst, danach die weiteren konfigurierten Provider.
+    :return: Liste der Provider oder eine leere Liste, wenn Hedging nicht aktiv ist (oder nur ein Provider verfügbar).
+    """
+    primary = config["model_query"]
+    if not config.get("query_hedge", hedge) or primary == "dryrun":
+        return []
+    others = config.get("query_hedge_providers") or hedge_providers
+    if isinstance(others, str):
+        others = [p.strip() for p in others.split(",") if p.strip()]
+    providers = [primary] + [p for p in others if p != primary and llm.has_provider(p)]
+    return providers if len(providers) > 1 else []
+
+
+class Candidate:
+    """
+    Ergebnis eines Providers: die generierte Abfrage und entweder die Daten oder der Fehler.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.query = ""
+        self.data = None
+        self.error = None
+        self.exception = None
+        self.seconds = None
+        self.started = False
+
+
+class HedgeFailed(Exception):
+    """
+    Keiner der Provider hat eine ausführbare Abfrage mit Ergebnis geliefert.
+    :param candidates: Die Kandidaten in der Reihenfolge der Provider (der primäre zuerst).
+    """
+
+    def __init__(self, candidates: list):
+        self.candidates = candidates
+        super().__init__("; ".join(f"{c.provider}: {c.error}" for c in candidates))
+
+
+async def _candidate(candidate: Candidate, prompt: str, run: Callable[[str], Awaitable[dict]], delay: float, release: asyncio.Event, start: float) -> Candidate:
+    if delay:
+        try:
+            await asyncio.wait_for(release.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    candidate.started = True
+    try:
+        # Tag "hedge": die App streamt die Tokens paralleler Kandidaten nicht, nur das SQL des Gewinners
+        response = await llm.ainvoke(candidate.provider, prompt, config={"tags": ["hedge"]})
+        candidate.query = parse_sql(response.content)
+        candidate.data = await run(candidate.query)
+        if row_count(candidate.data) == 0:
+            candidate.error = no_results
+    except Exception as e:
+        candidate.error = str(e)
+        candidate.exception = e
+    candidate.seconds = time.perf_counter() - start
+    return candidate
+
+
+async def race(providers: list, prompt: str, run: Callable[[str], Awaitable[dict]], delay: float = hedge_delay) -> Candidate:
+    """
+    Schicke den Prompt an alle Provider und führe die Antworten aus, sobald sie eintreffen.
+    :param providers: Provider in der Reihenfolge der Priorität (der primäre zuerst, ohne Verzögerung).
+    :param prompt: Der fertige Prompt des Query Agents.
+    :param run: Ausführung einer Abfrage (z.B. execute_query), in Benchmarks auch ein Fake ohne Datenbank.
+    :param delay: Verzögerung für alle Provider außer dem ersten.
+    :return: Der erste Kandidat mit Daten.
+    :raises HedgeFailed: Wenn alle Kandidaten fehlgeschlagen sind oder keine Zeilen geliefert haben.
+    """
+    start = time.perf_counter()
+    release = asyncio.Event()
+    candidates = [Candidate(p) for p in providers]
+    tasks = [asyncio.create_task(_candidate(c, prompt, run, delay if i else 0, release, start), name=f"hedge-{c.provider}")
+             for i, c in enumerate(candidates)]
+    pending = set(tasks)
+    winner = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done and task.result().error is None:
+                    winner = task.result()
+                    break
+            # Ein Fehlschlag startet die verzögerten Provider sofort
+            release.set()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    record(providers, winner, candidates)
+    if winner is None:
+        raise HedgeFailed(candidates)
+    return winner
+
+
+_stats = {"races": 0, "failed": 0, "wins": {}, "started": {}}
+_latencies = {}
+_savings = deque(maxlen=1000)
+
+
+def record(providers: list, winner: Optional[Candidate], candidates: list) -> None:
+    """
+    Zähle die gestarteten Provider, den Gewinner und die Latenzen der erfolgreichen Kandidaten. Die Ersparnis ist
+    die Laufzeit des primären Providers minus die des Gewinners. Wurde der primäre Provider abgebrochen, wird die
+    mediane Laufzeit seiner erfolgreichen Läufe als Schätzung verwendet.
+    """
+    _stats["races"] += 1
+    for candidate in candidates:
+        if candidate.started:
+            _stats["started"][candidate.provider] = _stats["started"].get(candidate.provider, 0) + 1
+    finished = [c for c in candidates if c.seconds is not None]
+    for candidate in finished:
+        if candidate.error is None:
+            _latencies.setdefault(candidate.provider, deque(maxlen=1000)).append(candidate.seconds)
+    if winner is None:
+        _stats["failed"] += 1
+        return
+    _stats["wins"][winner.provider] = _stats["wins"].get(winner.provider, 0) + 1
+    if winner.provider == providers[0]:
+        _savings.append(0.0)
+        return
+    primary = candidates[0]
+    if primary.seconds is not None:
+        # Der primäre Provider war fertig, aber fehlerhaft oder ohne Zeilen: ohne Hedging wäre ein weiterer Versuch nötig
+        reference = primary.seconds + (statistics.median(_latencies[providers[0]]) if _latencies.get(providers[0]) else primary.seconds)
+    elif _latencies.get(providers[0]):
+        reference = statistics.median(_latencies[providers[0]])
+    else:
+        return
+    _savings.append(max(0.0, reference - winner.seconds))
+    logger.info("Hedged query won by %s after %.2fs (primary %s)", winner.provider, winner.seconds, providers[0])
+
+
+def stats() -> dict:
+    """
+    Gewinnrate und mediane Latenz pro Provider sowie die geschätzte Ersparnis pro Frage.
+    """
+    result = {"races": _stats["races"], "failed": _stats["failed"], "providers": {}}
+    for provider, started in _stats["started"].items():
+        latencies = _latencies.get(provider)
+        result["providers"][provider] = {
+            "started": started,
+            "wins": _stats["wins"].get(provider, 0),
+            "win_rate": _stats["wins"].get(provider, 0) / _stats["races"],
+            "median_seconds": statistics.median(latencies) if latencies else None,
+        }
+    result["median_saved_seconds"] = statistics.median(_savings) if _savings else None
+    result["mean_saved_seconds"] = statistics.mean(_savings) if _savings else None
+    return result
+
+
+def reset_stats() -> None:
+    _stats.update({"races": 0, "failed": 0, "wins": {}, "started": {}})
+    _latencies.clear()
+    _savings.clear()
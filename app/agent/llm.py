@@ -0,0 +1,106 @@
+# Diese Datei wurde mit der Dokumentation von https://python.langchain.com/docs/concepts/chat_models/ erstellt.
+# Prozessweite Registry der Chat-Modelle: Jedes konfigurierte Modell wird genau einmal erstellt,
+# damit der HTTP-Client (und damit die Verbindungen) über alle Hops einer Frage wiederverwendet wird.
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from agent import metrics
+
+mistral_model = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
+gemma_model = os.getenv("GOOGLE_MODEL", "gemma-3-27b-it")
+openai_model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini-2025-04-14")
+temperature = 0.15
+
+
+def _mistral() -> BaseChatModel:
+    from langchain_mistralai import ChatMistralAI
+    return ChatMistralAI(model_name=mistral_model, temperature=temperature)
+
+
+def _openai() -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=openai_model, temperature=temperature)
+
+
+def _google() -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=gemma_model, temperature=temperature)
+
+
+def _scripted() -> BaseChatModel:
+    # Geskriptetes Modell für Benchmarks (SCRIPTED_LLM_SCRIPT), siehe agent.scripted
+    from agent.scripted import from_script
+    return from_script()
+
+
+_factories: Dict[str, Callable[[], BaseChatModel]] = {
+    "mistral": _mistral,
+    "openai": _openai,
+    "google": _google,
+    "scripted": _scripted,
+}
+_models: Dict[str, BaseChatModel] = {}
+_lock = threading.Lock()
+
+
+def register_provider(name: str, factory: Callable[[], BaseChatModel]) -> None:
+    """
+    Registriere einen (zusätzlichen) Provider, z.B. einen lokalen Fake-Provider für Benchmarks.
+    Eine bereits erstellte Instanz mit demselben Namen wird verworfen.
+    :param name: Der Name, unter dem der Provider in model_query/model_interpret ausgewählt wird.
+    :param factory: Funktion ohne Argumente, die das Chat-Modell erstellt.
+    """
+    with _lock:
+        _factories[name] = factory
+        _models.pop(name, None)
+
+
+def has_provider(name: str) -> bool:
+    return name in _factories
+
+
+def get_model(name: str) -> BaseChatModel:
+    """
+    Gebe die geteilte Instanz des Chat-Modells zurück und erstelle sie beim ersten Aufruf.
+    :param name: Der Name des Providers (mistral, openai, google, ...).
+    :return: Das Chat-Modell.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            if name not in _factories:
+                raise ValueError(f"Unknown model provider: {name}")
+            _models[name] = _factories[name]()
+        return _models[name]
+
+
+async def ainvoke(name: str, prompt: str, **kwargs):
+    """
+    Rufe das Modell des Providers asynchron auf.
+    :param name: Der Name des Providers.
+    :param prompt: Der fertig formatierte Prompt.
+    :return: Die Antwort des Modells (AIMessage).
+    """
+    model = get_model(name)
+    start = time.perf_counter()
+    try:
+        response = await model.ainvoke(prompt, **kwargs)
+    except Exception:
+        metrics.record_llm(name, time.perf_counter() - start, error=True)
+        raise
+    metrics.record_llm(name, time.perf_counter() - start, response)
+    return response
+
+
+def reset_models() -> None:
+    """
+    Verwerfe alle erstellten Instanzen (z.B. nach einer Änderung der Umgebungsvariablen oder in Benchmarks).
+    """
+    with _lock:
+        _models.clear()
@@ -0,0 +1,245 @@
+# Diese Datei wurde mit der Dokumentation von https://prometheus.io/docs/instrumenting/exposition_formats/ erstellt.
+# Prozessinterne Metriken des Agenten: Dauer der Knoten, Latenz und Tokens pro Provider, Wiederholungen, Ergebnis
+# des Query Agents (nach error_count) sowie Ausführungszeit und Zeilen der SQL-Abfragen. Die Werte werden als
+# Histogramme, Zähler und Gauges im Prometheus-Textformat ausgegeben (ohne zusätzliche Abhängigkeit) und zusätzlich über
+# ein rollierendes Fenster der letzten Beobachtungen zusammengefasst (Median, p95).
+import bisect
+import functools
+import math
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+enabled = os.getenv("METRICS", "1") == "1"
+# Anzahl der letzten Beobachtungen pro Serie für die rollierende Zusammenfassung
+window = int(os.getenv("METRICS_WINDOW", "1000"))
+prefix = "t2tsdb"
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+row_buckets = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _escape(value) -> str:
+    # Backslash, Anführungszeichen und Zeilenumbruch müssen im Exposition-Format maskiert werden
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Zähler pro Kombination von Labels.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = f"{prefix}_{name}"
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        if not enabled:
+            return
+        with _lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+    def summary(self) -> dict:
+        return {"/".join(map(str, labels)) or "total": value for labels, value in sorted(self.series.items())}
+
+
+class Gauge:
+    """
+    Aktueller Wert pro Kombination von Labels (z.B. Länge einer Warteschlange).
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = f"{prefix}_{name}"
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        _metrics.append(self)
+
+    def set(self, value: float, *labels) -> None:
+        if not enabled:
+            return
+        with _lock:
+            self.series[labels] = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+    def summary(self) -> dict:
+        return {"/".join(map(str, labels)) or "total": value for labels, value in sorted(self.series.items())}
+
+
+class Histogram:
+    """
+    Histogramm mit festen Buckets pro Kombination von Labels und einem Fenster der letzten Beobachtungen.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = latency_buckets):
+        self.name = f"{prefix}_{name}"
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        if not enabled:
+            return
+        with _lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0, "recent": deque(maxlen=window)}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {series['sum']}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {series['count']}")
+        return lines
+
+    def summary(self) -> dict:
+        result = {}
+        for labels, series in sorted(self.series.items()):
+            recent = sorted(series["recent"])
+            result["/".join(map(str, labels)) or "total"] = {
+                "count": series["count"],
+                "mean": statistics.mean(recent) if recent else None,
+                "p50": statistics.median(recent) if recent else None,
+                "p95": recent[math.ceil(len(recent) * 0.95) - 1] if recent else None,
+                "max": recent[-1] if recent else None,
+            }
+        return result
+
+
+node_seconds = Histogram("node_seconds", "Duration of a graph node in seconds", ("node",))
+node_errors = Counter("node_errors_total", "Graph node runs that raised an exception", ("node",))
+llm_seconds = Histogram("llm_seconds", "Latency of a model call in seconds", ("provider", "node"))
+llm_tokens = Counter("llm_tokens_total", "Prompt and completion tokens reported by the provider", ("provider", "node", "kind"))
+llm_errors = Counter("llm_errors_total", "Model calls that raised an exception", ("provider", "node"))
+supervisor_decisions = Counter("supervisor_decisions_total", "Supervisor decisions by source (rule, llm, fallback)", ("source", "next_agent"))
+supervisor_retries = Counter("supervisor_retries_total", "Supervisor calls repeated because the answer could not be parsed")
+query_attempts = Counter("query_attempts_total", "Query agent attempts by outcome (ok, no_results, error)", ("outcome",))
+query_outcomes = Counter("query_outcomes_total", "Final outcome of the query agent by error_count", ("outcome", "error_count"))
+sql_seconds = Histogram("sql_seconds", "Execution time of a generated query in seconds")
+sql_rows = Histogram("sql_rows", "Rows returned by a generated query", buckets=row_buckets)
+sql_repairs = Counter("sql_repairs_total", "Failed queries handled by the deterministic repair by outcome and SQLSTATE", ("outcome", "sqlstate"))
+sql_repair_seconds = Histogram("sql_repair_seconds", "Time from a failed query to the successful repaired execution in seconds")
+query_cancellations = Counter("query_cancellations_total", "Queries cancelled on the server by reason (superseded, disconnect, stopped, task)", ("reason",))
+admission_queue_depth = Gauge("admission_queue_depth", "Statements waiting for admission by cost class", ("cost_class",))
+admission_running = Gauge("admission_running", "Admitted statements running against the database by cost class", ("cost_class",))
+admission_wait_seconds = Histogram("admission_wait_seconds", "Time a statement waited for admission in seconds", ("cost_class",))
+admission_outcomes = Counter("admission_outcomes_total", "Admission decisions by outcome (admitted, queued, timeout, full, cancelled) and cost class", ("outcome", "cost_class"))
+query_routes = Counter("query_routes_total", "Executions by connection (primary, replica, fallback)", ("target",))
+offloads = Counter("offloads_total", "Large results written to object storage by outcome (stored, failed)", ("outcome",))
+offload_seconds = Histogram("offload_seconds", "Time to write or read an offloaded result in seconds", ("operation",))
+
+
+def current_node() -> str:
+    """
+    Name des Knotens, in dem der Aufruf stattfindet (aus der Config von LangGraph), sonst "none".
+    """
+    config = var_child_runnable_config.get()
+    if not config:
+        return "none"
+    return (config.get("metadata") or {}).get("langgraph_node", "none")
+
+
+def timed(node):
+    """
+    Dekorator für die Knoten des Graphen: Dauer und Ausnahmen pro Knoten.
+    Name, Signatur und Rückgabetyp (für die Kanten von Command) bleiben erhalten.
+    """
+    @functools.wraps(node)
+    async def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return await node(state)
+        except Exception:
+            node_errors.inc(node.__name__)
+            raise
+        finally:
+            node_seconds.observe(time.perf_counter() - start, node.__name__)
+    return wrapper
+
+
+def record_llm(provider: str, seconds: float, response=None, error: bool = False) -> None:
+    node = current_node()
+    llm_seconds.observe(seconds, provider, node)
+    if error:
+        llm_errors.inc(provider, node)
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        llm_tokens.inc(provider, node, "prompt", amount=usage["input_tokens"])
+    if usage.get("output_tokens"):
+        llm_tokens.inc(provider, node, "completion", amount=usage["output_tokens"])
+
+
+def record_outcome(outcome: str, error_count: Optional[int]) -> None:
+    """
+    Ergebnis des Query Agents für eine Frage (success, no_results, failed, cancelled, budget, busy) mit der Anzahl der Fehlversuche.
+    """
+    query_outcomes.inc(outcome, str(min(error_count or 0, 4)))
+
+
+def render() -> str:
+    """
+    Alle Metriken im Prometheus-Textformat (Version 0.0.4).
+    """
+    with _lock:
+        lines = [line for metric in _metrics for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    """
+    Rollierende Zusammenfassung: Histogramme mit Anzahl, Mittelwert, Median, p95 und Maximum der letzten
+    Beobachtungen, Zähler mit ihrem Stand.
+    """
+    with _lock:
+        return {metric.name[len(prefix) + 1:]: metric.summary() for metric in _metrics}
+
+
+def reset() -> None:
+    with _lock:
+        for metric in _metrics:
+            metric.series.clear()
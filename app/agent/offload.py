@@ -0,0 +1,212 @@
+# Diese Datei wurde mit der Dokumentation von https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html
+# und https://arrow.apache.org/docs/python/parquet.html erstellt.
+# Auslagern großer Abfrageergebnisse aus dem Checkpoint: Der AsyncPostgresSaver serialisiert GraphState["data"] bei
+# jedem Schritt in die Chainlit-Postgres. Ergebnisse ab RESULT_OFFLOAD_MIN_ROWS Zeilen werden daher einmal als
+# Parquet (zstd) in den S3-Bucket (LocalStack, BUCKET_NAME) geschrieben, im Zustand bleibt nur ein Handle mit
+# Spalten, Zeilenanzahl und einer kurzen Zusammenfassung. Die Knoten laden die Daten bei Bedarf über das Handle
+# (mit einem Cache im Speicher, die gerade geschriebenen Ergebnisse sind dort bereits enthalten).
+# Ist RESULT_OFFLOAD_DIR gesetzt, wird statt S3 in dieses Verzeichnis geschrieben (lokale Entwicklung ohne LocalStack).
+# Die Objekte werden nicht gelöscht, ein Ablauf der Objekte unter RESULT_OFFLOAD_PREFIX gehört in eine Lifecycle-Regel.
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain_core.runnables.config import var_child_runnable_config
+
+from agent import metrics
+from agent.result import is_columnar, is_offloaded, row_count
+
+logger = logging.getLogger(__name__)
+
+offload_enabled = os.getenv("RESULT_OFFLOAD", "1") == "1"
+# Ergebnisse mit weniger Zeilen bleiben im Zustand
+min_rows = int(os.getenv("RESULT_OFFLOAD_MIN_ROWS", "1000"))
+prefix = os.getenv("RESULT_OFFLOAD_PREFIX", "results/")
+directory = os.getenv("RESULT_OFFLOAD_DIR", "")
+bucket = os.getenv("BUCKET_NAME", "")
+memory_bytes = int(os.getenv("RESULT_OFFLOAD_MEMORY_BYTES", str(256 * 1024 * 1024)))
+# Zeilen in der Zusammenfassung des Handles (für den Prompt des Supervisors)
+summary_rows = 3
+
+enabled = offload_enabled and bool(directory or bucket)
+
+
+class S3Store:
+    """
+    Objekte im S3-Bucket, mit den Zugangsdaten und dem Endpoint der App (DEV_AWS_ENDPOINT für LocalStack).
+    """
+    name = "s3"
+
+    def __init__(self, bucket: str = bucket):
+        self.bucket = bucket
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.client(
+                    "s3",
+                    endpoint_url=os.getenv("DEV_AWS_ENDPOINT") or None,
+                    aws_access_key_id=os.getenv("APP_AWS_ACCESS_KEY"),
+                    aws_secret_access_key=os.getenv("APP_AWS_SECRET_KEY"),
+                    region_name=os.getenv("APP_AWS_REGION"),
+                )
+            return self._client
+
+    def put(self, key: str, body: bytes) -> None:
+        self.client().put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/vnd.apache.parquet")
+
+    def get(self, key: str) -> bytes:
+        return self.client().get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+class DirectoryStore:
+    """
+    Objekte als Dateien in einem lokalen Verzeichnis.
+    """
+    name = "dir"
+
+    def __init__(self, path: str = directory):
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, *key.split("/"))
+
+    def put(self, key: str, body: bytes) -> None:
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, file)
+
+    def get(self, key: str) -> bytes:
+        with open(self._file(key), "rb") as f:
+            return f.read()
+
+
+class ResultStore:
+    """
+    Schreibt und liest ausgelagerte Ergebnisse, die zuletzt verwendeten Tabellen bleiben im Speicher.
+    """
+
+    def __init__(self, store=None, memory_bytes: int = memory_bytes):
+        self.store = store or (DirectoryStore() if directory else S3Store())
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, table: pa.Table) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= self._memory.pop(key).nbytes
+            if table.nbytes > self.memory_bytes:
+                return
+            self._memory[key] = table
+            self._memory_used += table.nbytes
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+
+    def put(self, data: dict, key: str) -> int:
+        """
+        Schreibe ein Ergebnis (Format aus agent.result) als Parquet.
+        :return: Die Größe des Objekts in Bytes.
+        """
+        table = pa.table(dict(zip(data["columns"], data["values"])))
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression="zstd")
+        body = buffer.getvalue()
+        start = time.perf_counter()
+        self.store.put(key, body)
+        metrics.offload_seconds.observe(time.perf_counter() - start, "put")
+        self._remember(key, table)
+        return len(body)
+
+    def get(self, key: str) -> pa.Table:
+        with self._lock:
+            table = self._memory.get(key)
+            if table is not None:
+                self._memory.move_to_end(key)
+                return table
+        start = time.perf_counter()
+        table = pq.read_table(io.BytesIO(self.store.get(key)))
+        metrics.offload_seconds.observe(time.perf_counter() - start, "get")
+        self._remember(key, table)
+        return table
+
+
+_store: Optional[ResultStore] = None
+
+
+def get_store() -> ResultStore:
+    global _store
+    if _store is None:
+        _store = ResultStore()
+    return _store
+
+
+def _thread_id() -> str:
+    config = var_child_runnable_config.get() or {}
+    return str((config.get("configurable") or {}).get("thread_id") or "none")
+
+
+def summarize(data: dict, rows: int = summary_rows) -> str:
+    """
+    Kurze Beschreibung eines ausgelagerten Ergebnisses: Anzahl der Zeilen, Spalten und die ersten Zeilen.
+    """
+    first = [dict(zip(data["columns"], row)) for _, row in zip(range(rows), zip(*data["values"]))]
+    text = f"The result has {data['rows']} rows with the columns {', '.join(map(str, data['columns']))}."
+    if data["truncated"]:
+        text = f"The result was truncated after {data['rows']} rows because it exceeded the row or size limit. {text}"
+    return f"{text}\nFirst rows: {first}"
+
+
+def offload(data, minimum: int = min_rows):
+    """
+    Lagere ein großes Ergebnis aus. Kleine Ergebnisse und Fehler beim Schreiben lassen das Ergebnis unverändert.
+    :param data: Das Ergebnis im Format von agent.result.
+    :return: Das Handle {"columns", "rows", "truncated", "summary", "offloaded": {"store", "key", "bytes"}} oder data.
+    """
+    if not is_columnar(data) or row_count(data) < minimum:
+        return data
+    key = f"{prefix}{_thread_id()}/{uuid.uuid4().hex}.parquet"
+    try:
+        size = get_store().put(data, key)
+    except Exception as e:
+        metrics.offloads.inc("failed")
+        logger.warning("Could not offload result (%s rows), keeping it in the state: %s", data["rows"], e)
+        return data
+    metrics.offloads.inc("stored")
+    return {"columns": list(data["columns"]), "rows": data["rows"], "truncated": data["truncated"], "summary": summarize(data),
+            "offloaded": {"store": get_store().store.name, "key": key, "bytes": size}}
+
+
+def load(data):
+    """
+    Lade ein ausgelagertes Ergebnis über das Handle, alle anderen Werte werden unverändert zurückgegeben.
+    """
+    if not is_offloaded(data):
+        return data
+    table = get_store().get(data["offloaded"]["key"])
+    values = table.to_pydict()
+    return {"columns": table.column_names, "values": [values[c] for c in table.column_names], "rows": table.num_rows, "truncated": data["truncated"]}
+
+
+async def aoffload(data, minimum: int = min_rows):
+    return await asyncio.to_thread(offload, data, minimum) if is_columnar(data) and row_count(data) >= minimum else data
+
+
+async def aload(data):
+    return await asyncio.to_thread(load, data) if is_offloaded(data) else data
@@ -0,0 +1,146 @@
+# Diese Datei wurde mit der Dokumentation von https://www.postgresql.org/docs/current/sql-explain.html erstellt.
+# Kostenprüfung vor der Ausführung: Jedes Statement wird zuerst mit EXPLAIN (FORMAT JSON) geplant. Pläne über den
+# Schwellwerten werden abgelehnt und der Grund an den Query Agent zurückgegeben, damit dieser die Abfrage umschreibt.
+import json
+import os
+import re
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+plan_gate = os.getenv("PLAN_GATE", "1") == "1"
+max_cost = float(os.getenv("PLAN_MAX_COST", "1e8"))
+max_rows = float(os.getenv("PLAN_MAX_ROWS", "1e7"))
+# Maximale Anzahl an Chunks, die eine Abfrage sequentiell lesen darf (0 = keine Grenze)
+max_seq_chunks = int(os.getenv("PLAN_MAX_SEQ_CHUNKS", "0"))
+# Sequentielle Scans über alle Chunks einer Hypertable (mit mehr als einem Chunk) unabhängig von den Kosten ablehnen.
+# Standardmäßig aus: Fragen über den gesamten Zeitraum (Median, Perzentile), die kein Rollup bedient, brauchen solche Scans
+reject_full_scans = os.getenv("PLAN_REJECT_FULL_SCANS", "0") == "1"
+chunk_pattern = re.compile(r"^_hyper_\d+_\d+_chunk$")
+chunk_map_ttl = 300
+
+chunk_map_sql = """
+SELECT chunk_name, hypertable_name FROM timescaledb_information.chunks WHERE hypertable_schema = 'oebb'
+"""
+
+
+class PlanRejected(Exception):
+    """
+    Der geschätzte Plan überschreitet die Schwellwerte. Die Nachricht erklärt dem Query Agent den Grund.
+    """
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def summarize(plan: dict, chunk_map: dict) -> dict:
+    """
+    Fasse einen Plan aus EXPLAIN (FORMAT JSON) zusammen.
+    :param plan: Das erste Element der EXPLAIN-Ausgabe.
+    :param chunk_map: Chunk-Name -> Hypertable.
+    :return: Kosten, geschätzte Zeilen und gelesene Chunks bzw. Tabellen.
+    """
+    root = plan["Plan"]
+    chunks, seq_chunks, seq_tables = {}, {}, set()
+    for node in _walk(root):
+        relation = node.get("Relation Name")
+        if relation is None:
+            continue
+        sequential = node.get("Node Type") == "Seq Scan"
+        if relation in chunk_map or chunk_pattern.match(relation):
+            hypertable = chunk_map.get(relation, "hypertable")
+            chunks.setdefault(hypertable, set()).add(relation)
+            if sequential:
+                seq_chunks.setdefault(hypertable, set()).add(relation)
+        elif sequential:
+            seq_tables.add(relation)
+    return {
+        "cost": root.get("Total Cost", 0.0),
+        "rows": root.get("Plan Rows", 0.0),
+        "chunks": {h: len(c) for h, c in chunks.items()},
+        "seq_chunks": {h: len(c) for h, c in seq_chunks.items()},
+        "seq_tables": sorted(seq_tables),
+    }
+
+
+def rejection(summary: dict, total_chunks: dict) -> Optional[str]:
+    """
+    Prüfe die Zusammenfassung gegen die Schwellwerte.
+    :param total_chunks: Hypertable -> Anzahl aller Chunks.
+    :return: Der Grund für die Ablehnung oder None.
+    """
+    reasons = []
+    if summary["cost"] > max_cost:
+        reasons.append(f"estimated cost {summary['cost']:.3g} exceeds the limit of {max_cost:.3g}")
+    if summary["rows"] > max_rows:
+        reasons.append(f"estimated {summary['rows']:.3g} result rows exceed the limit of {max_rows:.3g}")
+    for hypertable, count in summary["seq_chunks"].items():
+        if max_seq_chunks and count > max_seq_chunks:
+            reasons.append(f"sequential scan over {count} chunks of {hypertable} exceeds the limit of {max_seq_chunks}")
+        elif reject_full_scans and total_chunks.get(hypertable, 0) > 1 and count >= total_chunks[hypertable]:
+            reasons.append(f"sequential scan over all {count} chunks of {hypertable} (no chunk is excluded by a time filter)")
+    if not reasons:
+        return None
+    # Hinweise, woher die Kosten kommen
+    hints = []
+    for hypertable, count in summary["seq_chunks"].items():
+        total = total_chunks.get(hypertable)
+        scope = "all" if total and count >= total else str(count)
+        hint = "no chunk is excluded, restrict the timestamp column" if scope == "all" else "narrow the time filter on the timestamp column"
+        hints.append(f"sequential scan over {scope} chunks of {hypertable} ({hint})")
+    if summary["seq_tables"]:
+        hints.append(f"sequential scans on {', '.join(summary['seq_tables'])}")
+    message = "The query plan was rejected before execution: " + "; ".join(reasons) + "."
+    if hints:
+        message += " Plan details: " + "; ".join(hints) + "."
+    return message + " Rewrite the query to read less data (time filters, aggregation, correct join conditions, LIMIT)."
+
+
+_chunk_map = {}
+_chunk_map_at = 0.0
+
+
+async def chunk_map(conn) -> dict:
+    """
+    Lese die Zuordnung Chunk -> Hypertable (zwischengespeichert für chunk_map_ttl Sekunden).
+    """
+    global _chunk_map, _chunk_map_at
+    if time.monotonic() - _chunk_map_at < chunk_map_ttl:
+        return _chunk_map
+    try:
+        async with conn.begin_nested():
+            rows = (await conn.execute(text(chunk_map_sql))).fetchall()
+        _chunk_map = {chunk: hypertable for chunk, hypertable in rows}
+    except Exception:
+        # Ohne TimescaleDB gibt es keine Chunks
+        _chunk_map = {}
+    _chunk_map_at = time.monotonic()
+    return _chunk_map
+
+
+async def explain(conn, stmt: str) -> dict:
+    """
+    Plane ein Statement mit EXPLAIN (FORMAT JSON) und gebe die Zusammenfassung zurück.
+    """
+    raw = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {stmt}"))).scalar()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    return summarize(plan, await chunk_map(conn))
+
+
+async def check(conn, stmt: str) -> dict:
+    """
+    Plane ein Statement und wirf PlanRejected, wenn der Plan die Schwellwerte überschreitet.
+    """
+    summary = await explain(conn, stmt)
+    mapping = await chunk_map(conn)
+    total_chunks = {}
+    for hypertable in mapping.values():
+        total_chunks[hypertable] = total_chunks.get(hypertable, 0) + 1
+    reason = rejection(summary, total_chunks)
+    if reason is not None:
+        raise PlanRejected(reason)
+    return summary
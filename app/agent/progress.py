@@ -0,0 +1,49 @@
+# Diese Datei wurde mit der Dokumentation von https://python.langchain.com/docs/how_to/callbacks_custom_events/ erstellt.
+# Fortschritt der Knoten als Custom Events (astream_events, Event "on_custom_event"), damit die App jede Stufe
+# anzeigen kann: Entscheidung des Supervisors, generiertes SQL, Ausführung und eine Vorschau des Ergebnisses.
+# Außerhalb eines Graph-Laufs (z.B. direkter Aufruf von execute_query) passiert nichts.
+import logging
+import os
+from itertools import islice
+
+from langchain_core.callbacks import adispatch_custom_event
+
+from agent.result import is_columnar, is_offloaded, row_count
+
+logger = logging.getLogger(__name__)
+
+# Anzahl der Zeilen in der Vorschau des Ergebnisses
+preview_rows = int(os.getenv("STREAM_PREVIEW_ROWS", "5"))
+
+
+async def emit(name: str, data: dict) -> None:
+    """
+    Sende ein Custom Event an alle astream_events-Konsumenten des aktuellen Laufs.
+    :param name: z.B. route, sql, execute_start, execute_queued, execute_progress, execute_end, result, error, answer.
+    :param data: Die Daten des Events.
+    """
+    try:
+        await adispatch_custom_event(name, data)
+    except RuntimeError:
+        # Kein übergeordneter Lauf (Aufruf außerhalb des Graphen)
+        pass
+    except Exception as e:
+        logger.debug("Could not dispatch progress event %s: %s", name, e)
+
+
+def preview(data, rows: int = preview_rows) -> dict:
+    """
+    Spalten und die ersten Zeilen eines Ergebnisses (spaltenorientiert oder Liste von Zeilen).
+    Von einem ausgelagerten Ergebnis werden nur die Spalten angezeigt.
+    """
+    if is_offloaded(data):
+        columns, first = list(data["columns"]), []
+    elif is_columnar(data):
+        columns = list(data["columns"])
+        first = [list(row) for row in islice(zip(*data["values"]), rows)]
+    else:
+        records = list(data or [])[:rows]
+        columns = list(records[0].keys()) if records else []
+        first = [[r.get(c) for c in columns] for r in records]
+    return {"rows": row_count(data), "columns": columns, "preview": first,
+            "truncated": bool(data.get("truncated")) if isinstance(data, dict) else False}
@@ -0,0 +1,333 @@
+# Diese Datei wurde mit der Dokumentation von https://www.postgresql.org/docs/current/errcodes-appendix.html,
+# https://www.psycopg.org/psycopg3/docs/api/errors.html und https://docs.python.org/3/library/difflib.html erstellt.
+# Deterministische Reparatur fehlgeschlagener Abfragen, bevor der Query Agent das LLM erneut fragt. Anhand des
+# SQLSTATE werden mechanische Fehler lokal behoben und die Abfrage erneut ausgeführt:
+# - 42703 (Spalte unbekannt): Hinweis von Postgres ("Perhaps you meant ...") oder die ähnlichste Spalte der
+#   verwendeten Tabellen; ein Wert in doppelten Anführungszeichen ohne passende Spalte wird zum String-Literal.
+# - 42P01 (Tabelle unbekannt): fehlendes Präfix oebb. oder die ähnlichste Tabelle in oebb.
+# - 42601 (Syntaxfehler): Text bzw. Kommentare nach dem letzten Statement.
+# - 42601 bzw. wenn die Fehlermeldung die Zeichen enthält: Backticks und typografische Anführungszeichen.
+# Ersetzt werden nur Bezeichner außerhalb von String-Literalen und Kommentaren. Erfolgsquote und eingesparte Zeit
+# (Latenz eines LLM-Aufrufs des Query Agents minus Dauer der Reparatur) werden gezählt.
+import difflib
+import logging
+import os
+import re
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from agent import metrics, schema
+from agent.executor import split_statements
+
+logger = logging.getLogger(__name__)
+
+enabled = os.getenv("SQL_REPAIR", "1") == "1"
+# Maximale Anzahl an Reparaturen pro Abfrage (z.B. mehrere Tippfehler nacheinander)
+max_repairs = int(os.getenv("SQL_REPAIR_MAX", "3"))
+# Minimale Ähnlichkeit (difflib) eines Bezeichners mit einer Spalte bzw. Tabelle
+cutoff = float(os.getenv("SQL_REPAIR_CUTOFF", "0.8"))
+
+undefined_column = "42703"
+undefined_table = "42P01"
+syntax_error = "42601"
+repairable = (undefined_column, undefined_table, syntax_error)
+
+token = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|[A-Za-z_][A-Za-z0-9_$]*|\s+|.", re.DOTALL)
+column_message = re.compile(r'column (?:"([^"]+)"|(?:[\w$]+\.)*([\w$]+)) does not exist', re.IGNORECASE)
+relation_message = re.compile(r'relation "([^"]+)" does not exist', re.IGNORECASE)
+hint_column = re.compile(r'reference the column "(?:[\w$]+\.)?([\w$]+)"')
+statement_start = re.compile(r"^\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*(select|with|values|table|explain|show|set)\b", re.IGNORECASE | re.DOTALL)
+smart_quotes = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "´": "'"})
+special_characters = ("‘", "’", "“", "”", "´", "`")
+
+
+def sql_error(error: BaseException):
+    """
+    Der Fehler des Treibers (psycopg) hinter einem Fehler von SQLAlchemy, sonst None.
+    """
+    while error is not None:
+        if getattr(error, "sqlstate", None):
+            return error
+        error = getattr(error, "orig", None) or error.__cause__
+    return None
+
+
+def _tokens(sql: str) -> list:
+    return token.findall(sql)
+
+
+def _is_word(tok: str) -> bool:
+    return tok[:1].isalpha() or tok[:1] == "_"
+
+
+def _unquote(tok: str) -> str:
+    return tok[1:-1].replace('""', '"') if tok.startswith('"') else tok
+
+
+def _literal(tok: str) -> bool:
+    # String-Literal oder Kommentar
+    return tok.startswith(("'", "--", "/*"))
+
+
+def _significant(tokens: list) -> list:
+    # Positionen der Tokens ohne Leerraum und Kommentare
+    return [i for i, tok in enumerate(tokens) if not tok.isspace() and not tok.startswith("--") and not tok.startswith("/*")]
+
+
+def _matches(tok: str, name: str) -> bool:
+    if not (_is_word(tok) or tok.startswith('"')):
+        return False
+    return _unquote(tok) == name or (tok[0] != '"' and tok.lower() == name.lower())
+
+
+def replace_identifier(sql: str, old: str, new: str) -> str:
+    """
+    Ersetze einen Bezeichner (auch in doppelten Anführungszeichen) außerhalb von Literalen und Kommentaren.
+    Aliase nach AS bleiben unverändert, damit sich die Spaltennamen des Ergebnisses nicht ändern. Ist old ein Alias,
+    bleiben auch die Verweise in ORDER BY (die sich auf den Alias beziehen) unverändert.
+    """
+    tokens = _tokens(sql)
+    significant = _significant(tokens)
+    words = [tokens[i].lower() for i in significant]
+    alias = any(words[k - 1] == "as" and _matches(tokens[i], old) for k, i in enumerate(significant) if k)
+    order_by = False
+    for k, i in enumerate(significant):
+        tok = tokens[i]
+        if words[k] == "by" and k and words[k - 1] == "order":
+            order_by = True
+        elif words[k] in ("limit", "offset", ")", ";"):
+            order_by = False
+        if not _matches(tok, old) or (k and words[k - 1] == "as") or (alias and order_by):
+            continue
+        tokens[i] = f'"{new}"' if tok.startswith('"') and new != new.lower() else new
+    return "".join(tokens)
+
+
+def replace_relation(sql: str, old: str, new: str) -> str:
+    """
+    Ersetze eine Tabelle nach FROM bzw. JOIN (unqualifiziert oder mit Schema) durch oebb.new. Andere Vorkommen
+    (z.B. die Spalte station der Tabelle station) bleiben unverändert.
+    """
+    tokens = _tokens(sql)
+    significant = _significant(tokens)
+    for k, i in enumerate(significant):
+        if _unquote(tokens[i]).lower() != old.lower():
+            continue
+        before = [tokens[j].lower() for j in significant[max(0, k - 3):k]]
+        if before[-1:] and before[-1] in ("from", "join"):
+            tokens[i] = f"{schema.schema_name}.{new}"
+        elif len(before) == 3 and before[2] == "." and before[0] in ("from", "join"):
+            tokens[significant[k - 2]] = schema.schema_name
+            tokens[i] = new
+    return "".join(tokens)
+
+
+def referenced_tables(sql: str) -> list:
+    """
+    Tabellen aus oebb, die in der Abfrage vorkommen (mit oder ohne Präfix).
+    """
+    words = {_unquote(tok).lower() for tok in _tokens(sql) if _is_word(tok) or tok.startswith('"')}
+    return [name for name in schema.table_names if name in words]
+
+
+def _columns(tables: list) -> list:
+    current = schema.snapshot()["tables"]
+    return [c["name"] for name in (tables or schema.table_names) for c in current[name]]
+
+
+def _closest(name: str, candidates: list) -> Optional[str]:
+    match = difflib.get_close_matches(name.lower(), [c.lower() for c in candidates], n=1, cutoff=cutoff)
+    if not match:
+        return None
+    return next(c for c in candidates if c.lower() == match[0])
+
+
+def fix_column(sql: str, error) -> Optional[tuple]:
+    m = column_message.search(error.diag.message_primary or "")
+    if not m:
+        return None
+    name = m.group(1) or m.group(2)
+    hinted = hint_column.search(error.diag.message_hint or "")
+    tables = referenced_tables(sql)
+    target = hinted.group(1) if hinted else _closest(name, [c for c in _columns(tables) if c != name])
+    if target is not None and target != name:
+        return replace_identifier(sql, name, target), f"column {name} -> {target}"
+    # "Ausfall" statt 'Ausfall': ein Wert in doppelten Anführungszeichen wird als Spalte gelesen
+    quoted = f'"{name}"'
+    if quoted in sql:
+        tokens = [f"'{name}'" if tok == quoted else tok for tok in _tokens(sql)]
+        return "".join(tokens), f"literal {name}"
+    return None
+
+
+def fix_table(sql: str, error) -> Optional[tuple]:
+    m = relation_message.search(error.diag.message_primary or "")
+    if not m:
+        return None
+    relation = m.group(1)
+    name = relation.split(".")[-1]
+    target = name.lower() if name.lower() in schema.table_names else _closest(name, list(schema.table_names))
+    if target is None:
+        return None
+    fixed = replace_relation(sql, name, target)
+    if fixed == sql:
+        return None
+    return fixed, f"table {relation} -> {schema.schema_name}.{target}"
+
+
+def fix_characters(sql: str) -> Optional[tuple]:
+    """
+    Typografische Anführungszeichen und Backticks (MySQL) außerhalb von String-Literalen, Kommentaren und
+    Bezeichnern in doppelten Anführungszeichen. Sie führen je nach Stelle zu 42601 oder 42703.
+    """
+    fixes = []
+    tokens = [tok if _literal(tok) or tok.startswith('"') else tok.translate(smart_quotes) for tok in _tokens(sql)]
+    if "".join(tokens) != sql:
+        fixes.append("quotes")
+        # Aus ‘Wien Hbf’ werden erst jetzt String-Literale
+        tokens = _tokens("".join(tokens))
+    i = 0
+    while i < len(tokens):
+        end = tokens.index("`", i + 1) if tokens[i] == "`" and "`" in tokens[i + 1:] else None
+        if end is not None and not any(_literal(tok) for tok in tokens[i + 1:end]):
+            name = "".join(tokens[i + 1:end])
+            tokens[i:end + 1] = [name if name == name.lower() else f'"{name}"']
+            if "backticks" not in fixes:
+                fixes.append("backticks")
+        i += 1
+    return ("".join(tokens), ", ".join(fixes)) if fixes else None
+
+
+def _mentions_characters(error) -> bool:
+    # z.B. column "‘wien" does not exist: Postgres liest ‘Wien als Bezeichner
+    return any(c in (error.diag.message_primary or "") for c in special_characters)
+
+
+def fix_syntax(sql: str, error) -> Optional[tuple]:
+    # Erklärungen oder Kommentare nach dem letzten Statement
+    statements = split_statements(sql)
+    kept = [s for s in statements if statement_start.match(s)]
+    if kept and len(kept) < len(statements):
+        return ";\n".join(kept), "trailing text"
+    return None
+
+
+fixers = {undefined_column: fix_column, undefined_table: fix_table, syntax_error: fix_syntax}
+
+
+def repair(sql: str, error: BaseException) -> Optional[tuple]:
+    """
+    Ein Reparaturschritt für einen Fehler.
+    :return: (reparierte Abfrage, Beschreibung) oder None, wenn keine sichere Reparatur möglich ist.
+    """
+    driver_error = sql_error(error)
+    if driver_error is None or driver_error.sqlstate not in fixers:
+        return None
+    try:
+        fixed = None
+        if driver_error.sqlstate == syntax_error or _mentions_characters(driver_error):
+            fixed = fix_characters(sql)
+        return fixed or fixers[driver_error.sqlstate](sql, driver_error)
+    except Exception as e:
+        logger.debug("Repair of %s failed: %s", driver_error.sqlstate, e)
+        return None
+
+
+_stats = {"failures": 0, "repairable": 0, "repaired": 0, "by_sqlstate": {}, "fixes": {}}
+_seconds = deque(maxlen=1000)
+_savings = deque(maxlen=1000)
+
+
+def _llm_seconds(provider: Optional[str]) -> Optional[float]:
+    summary = metrics.llm_seconds.summary().get(f"{provider}/query_agent")
+    return summary["p50"] if summary else None
+
+
+def record(sqlstate: str, repaired: bool, fixes: list, seconds: float, provider: Optional[str]) -> None:
+    """
+    Zähle eine Reparatur. Die Ersparnis ist die mediane Latenz eines LLM-Aufrufs des Query Agents mit diesem
+    Provider (aus agent.metrics) minus der Dauer der Reparatur inkl. erneuter Ausführung.
+    """
+    _stats["repairable"] += 1
+    by_state = _stats["by_sqlstate"].setdefault(sqlstate, {"failures": 0, "repaired": 0})
+    by_state["failures"] += 1
+    metrics.sql_repairs.inc("repaired" if repaired else "failed", sqlstate)
+    if not repaired:
+        return
+    _stats["repaired"] += 1
+    by_state["repaired"] += 1
+    for fix in fixes:
+        kind = fix.split(" ")[0]
+        _stats["fixes"][kind] = _stats["fixes"].get(kind, 0) + 1
+    _seconds.append(seconds)
+    metrics.sql_repair_seconds.observe(seconds)
+    llm = _llm_seconds(provider)
+    if llm is not None:
+        _savings.append(max(0.0, llm - seconds))
+
+
+class Repairer:
+    """
+    Führt eine Abfrage aus und repariert sie bei mechanischen Fehlern bis zu max_repairs Mal.
+    :param execute: Ausführung einer Abfrage (z.B. execute_query über den Ergebnis-Cache).
+    :param provider: Provider des Query Agents (für die geschätzte Ersparnis).
+    """
+
+    def __init__(self, execute: Callable[[str], Awaitable[dict]], provider: Optional[str] = None, limit: int = max_repairs):
+        self.execute = execute
+        self.provider = provider
+        self.limit = limit
+        self.sql = None
+        self.fixes = []
+
+    async def run(self, sql: str) -> dict:
+        """
+        :return: Das Ergebnis der (ggf. reparierten) Abfrage, die ausgeführte Abfrage steht danach in self.sql.
+        :raises: Den Fehler der letzten Ausführung, wenn keine Reparatur möglich war oder sie nicht gereicht hat.
+        """
+        self.sql = sql
+        try:
+            return await self.execute(sql)
+        except Exception as e:
+            error = e
+        _stats["failures"] += 1
+        driver_error = sql_error(error)
+        if driver_error is None or driver_error.sqlstate not in repairable:
+            raise error
+        start = time.perf_counter()
+        for _ in range(self.limit):
+            repaired = repair(self.sql, error)
+            if repaired is None or repaired[0] == self.sql:
+                break
+            self.sql, fix = repaired
+            self.fixes.append(fix)
+            logger.info("Repaired query (%s)", fix)
+            try:
+                data = await self.execute(self.sql)
+            except Exception as e:
+                error = e
+                continue
+            record(driver_error.sqlstate, True, self.fixes, time.perf_counter() - start, self.provider)
+            return data
+        record(driver_error.sqlstate, False, self.fixes, time.perf_counter() - start, self.provider)
+        raise error
+
+
+def stats() -> dict:
+    """
+    Erfolgsquote (bezogen auf Fehler mit reparierbarem SQLSTATE), Reparaturen pro Art und eingesparte Zeit.
+    """
+    result = {key: value for key, value in _stats.items()}
+    result["success_rate"] = _stats["repaired"] / _stats["repairable"] if _stats["repairable"] else 0.0
+    result["median_repair_seconds"] = statistics.median(_seconds) if _seconds else None
+    result["median_saved_seconds"] = statistics.median(_savings) if _savings else None
+    result["total_saved_seconds"] = sum(_savings)
+    return result
+
+
+def reset_stats() -> None:
+    _stats.update({"failures": 0, "repairable": 0, "repaired": 0, "by_sqlstate": {}, "fixes": {}})
+    _seconds.clear()
+    _savings.clear()
@@ -0,0 +1,121 @@
+# Kompakte, spaltenorientierte Darstellung von Abfrageergebnissen.
+# Format: {"columns": [...], "values": [[Werte der Spalte 1], ...], "rows": n, "truncated": bool}
+# Große Ergebnisse können ausgelagert sein (agent.offload), dann fehlt "values" und "offloaded" enthält das Handle.
+import os
+
+# Obergrenzen für ein Abfrageergebnis, damit ein ungefiltertes SELECT * auf einer Hypertable den Speicher nicht sprengt
+max_rows = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+max_bytes = int(os.getenv("QUERY_MAX_BYTES", str(64 * 1024 * 1024)))
+fetch_size = int(os.getenv("QUERY_FETCH_SIZE", "5000"))
+
+
+def unique_keys(keys: list) -> list:
+    """
+    Mache doppelte Spaltennamen eines Statements eindeutig (z.B. SELECT * über einen Join): id, x, id -> id, x, id_1.
+    """
+    seen, unique = set(keys), []
+    counts = {}
+    for key in keys:
+        if key in counts:
+            name = key
+            while name in seen:
+                counts[key] += 1
+                name = f"{key}_{counts[key]}"
+            seen.add(name)
+            unique.append(name)
+        else:
+            counts[key] = 0
+            unique.append(key)
+    return unique
+
+
+class ResultCollector:
+    """
+    Sammelt Zeilen aus mehreren Statements chunkweise in Spalten und stoppt bei max_rows bzw. max_bytes.
+    Spalten, die nur in einzelnen Statements vorkommen, werden wie bei pd.concat mit None aufgefüllt.
+    Doppelte Spaltennamen innerhalb eines Statements werden mit unique_keys eindeutig gemacht.
+    """
+
+    def __init__(self, max_rows: int = max_rows, max_bytes: int = max_bytes):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.columns = {}
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+
+    def add(self, keys: list, rows: list) -> bool:
+        """
+        Füge einen Chunk an Zeilen hinzu.
+        :param keys: Die Spaltennamen des Statements.
+        :param rows: Die Zeilen (Tupel) des Chunks.
+        :return: False, wenn eine Obergrenze erreicht wurde und keine weiteren Zeilen gelesen werden sollen.
+        """
+        if self.truncated:
+            return False
+        keys = unique_keys(keys)
+        if self.max_rows is not None and self.rows + len(rows) > self.max_rows:
+            rows = rows[:self.max_rows - self.rows]
+            self.truncated = True
+        if rows:
+            # Schätzung der Größe anhand der ersten Zeile des Chunks
+            self.bytes += len(str(tuple(rows[0]))) * len(rows)
+        for key in keys:
+            if key not in self.columns:
+                self.columns[key] = [None] * self.rows
+        for i, key in enumerate(keys):
+            self.columns[key].extend(row[i] for row in rows)
+        for key, values in self.columns.items():
+            if key not in keys:
+                values.extend([None] * len(rows))
+        self.rows += len(rows)
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            self.truncated = True
+        return not self.truncated
+
+    def result(self) -> dict:
+        return {"columns": list(self.columns), "values": list(self.columns.values()), "rows": self.rows, "truncated": self.truncated}
+
+
+def is_columnar(data) -> bool:
+    return isinstance(data, dict) and "columns" in data and "values" in data
+
+
+def is_offloaded(data) -> bool:
+    return isinstance(data, dict) and "offloaded" in data
+
+
+def _require_loaded(data) -> None:
+    if is_offloaded(data):
+        raise ValueError("The result is offloaded, load it with agent.offload.load first")
+
+
+def row_count(data) -> int:
+    """
+    Anzahl der Zeilen eines Ergebnisses, egal ob spaltenorientiert, ausgelagert oder als Liste von Zeilen.
+    """
+    if data is None:
+        return 0
+    if is_columnar(data) or is_offloaded(data):
+        return data["rows"]
+    return len(data)
+
+
+def to_records(data) -> list:
+    """
+    Wandle ein spaltenorientiertes Ergebnis in eine Liste von Zeilen (dict) um.
+    """
+    _require_loaded(data)
+    if not is_columnar(data):
+        return data
+    return [dict(zip(data["columns"], row)) for row in zip(*data["values"])]
+
+
+def to_columns(data) -> dict:
+    """
+    Wandle ein Ergebnis in ein dict Spaltenname -> Werte um (z.B. für pd.DataFrame).
+    """
+    _require_loaded(data)
+    if is_columnar(data):
+        return dict(zip(data["columns"], data["values"]))
+    return data
@@ -0,0 +1,261 @@
+# Diese Datei wurde mit der Dokumentation von https://arrow.apache.org/docs/python/ und
+# https://docs.timescale.com/api/latest/informational-views/chunks/ erstellt.
+# Ergebnis-Cache für die Abfragen des Query Agents. Schlüssel ist das kanonisierte SQL, gespeichert wird spaltenorientiert
+# als Arrow-Tabelle im Speicher und als Parquet auf der Festplatte. Einträge werden ungültig, sobald sich die
+# referenzierten Tabellen ändern (Änderungszähler und Chunks der Hypertables) oder die TTL abgelaufen ist.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+cache_dir = os.getenv("RESULT_CACHE_DIR", os.path.join(".cache", "results"))
+cache_ttl = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+memory_bytes = int(os.getenv("RESULT_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+disk_bytes = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Wie lange die abgefragten Wasserstände der Tabellen wiederverwendet werden (Sekunden)
+watermark_interval = float(os.getenv("RESULT_CACHE_WATERMARK_INTERVAL", "5"))
+
+# Nicht-deterministische Funktionen, die aktuelle Zeit (auch als Schlüsselwort ohne Klammern wie current_date) und
+# Zeit-Literale wie 'now'::timestamp: solche Abfragen werden nie gecacht
+volatile = re.compile(r"\b(random|clock_timestamp|timeofday|gen_random_uuid|nextval|setseed|pg_sleep|now|statement_timestamp|transaction_timestamp)\s*\("
+                      r"|\b(current_date|current_time|current_timestamp|localtime|localtimestamp)\b"
+                      r"|'(now|today|tomorrow|yesterday)'", re.IGNORECASE)
+# Nur lesende Abfragen werden gecacht
+read_only = re.compile(r"^(select|with|values|table)\b")
+token = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s]+?(?=--|/\*|['\"\s]|$)|.", re.DOTALL)
+
+# Änderungszähler pro Tabelle; für Hypertables zusätzlich Anzahl und Ende der Chunks
+plain_watermark_sql = """
+SELECT relname, n_tup_ins + n_tup_upd + n_tup_del AS changes
+FROM pg_stat_user_tables WHERE schemaname = 'oebb'
+"""
+hypertable_watermark_sql = """
+SELECT ch.hypertable_name, sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del) AS changes,
+       count(*) AS chunks, max(ch.range_end)::text AS latest
+FROM timescaledb_information.chunks ch
+LEFT JOIN pg_stat_user_tables s ON s.schemaname = ch.chunk_schema AND s.relname = ch.chunk_name
+WHERE ch.hypertable_schema = 'oebb'
+GROUP BY ch.hypertable_name
+"""
+
+
+def canonicalize(sql: str) -> str:
+    """
+    Kanonisiere SQL für den Cache-Schlüssel: Kommentare entfernen, Leerzeichen zusammenfassen, Kleinschreibung
+    außerhalb von String-Literalen und Bezeichnern in Anführungszeichen und kein abschließendes Semikolon.
+    """
+    parts = []
+    for match in token.finditer(sql):
+        part = match.group(0)
+        if part.startswith(("--", "/*")) or part.isspace():
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif part.startswith(("'", '"')):
+            parts.append(part)
+        else:
+            parts.append(part.lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def referenced_tables(canonical: str, known: list) -> list:
+    """
+    Finde die Tabellen aus oebb, die in der (kanonisierten) Abfrage vorkommen.
+    """
+    return sorted({name for name in known if re.search(rf"\b{re.escape(name)}\b", canonical)})
+
+
+def cacheable(canonical: str) -> bool:
+    statements = [s.strip() for s in canonical.split(";") if s.strip()]
+    return bool(statements) and all(read_only.match(s) for s in statements) and not volatile.search(canonical)
+
+
+class ResultCache:
+    """
+    Zweistufiger Cache (Speicher + Parquet auf Festplatte) mit größenbasierter LRU-Verdrängung und TTL.
+    """
+
+    def __init__(self, directory: Optional[str] = cache_dir, ttl: float = cache_ttl, memory_bytes: int = memory_bytes, disk_bytes: int = disk_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(canonical: str) -> str:
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, canonical: str, watermarks: dict) -> Optional[dict]:
+        """
+        Gebe das gecachte Ergebnis zurück, wenn es noch gültig ist.
+        :param watermarks: Aktuelle Wasserstände der Tabellen (Tabelle -> Wert).
+        """
+        key = self.key(canonical)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None and self.directory and os.path.exists(self._path(key)):
+            try:
+                table = pq.read_table(self._path(key))
+                meta = json.loads(table.schema.metadata[b"t2tsdb"])
+                entry = (table, meta)
+                os.utime(self._path(key))
+                self._remember(key, table, meta)
+            except (OSError, ValueError, KeyError, pa.ArrowException) as e:
+                logger.warning("Could not read cached result %s: %s", key, e)
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        table, meta = entry
+        stale = time.time() - meta["created"] > self.ttl or any(watermarks.get(t) != meta["watermarks"].get(t) for t in meta["tables"])
+        if stale:
+            self.invalidations += 1
+            self.misses += 1
+            self.discard(key)
+            return None
+        self.hits += 1
+        values = table.to_pydict()
+        return {"columns": table.column_names, "values": [values[c] for c in table.column_names], "rows": table.num_rows, "truncated": meta["truncated"]}
+
+    def put(self, canonical: str, result: dict, tables: list, watermarks: dict) -> None:
+        """
+        Speichere ein Ergebnis (Format aus agent.result) zusammen mit den Wasserständen der referenzierten Tabellen.
+        """
+        key = self.key(canonical)
+        try:
+            table = pa.table(dict(zip(result["columns"], result["values"])))
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.info("Result of %s is not cacheable: %s", key, e)
+            return
+        meta = {"created": time.time(), "tables": tables, "watermarks": {t: watermarks.get(t) for t in tables}, "truncated": result["truncated"]}
+        table = table.replace_schema_metadata({b"t2tsdb": json.dumps(meta).encode()})
+        self._remember(key, table, meta)
+        if self.directory:
+            try:
+                pq.write_table(table, self._path(key), compression="zstd")
+                self._evict_disk()
+            except (OSError, pa.ArrowException) as e:
+                logger.warning("Could not write cached result %s: %s", key, e)
+
+    def _remember(self, key: str, table: pa.Table, meta: dict) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= self._memory.pop(key)[0].nbytes
+            if table.nbytes > self.memory_bytes:
+                return
+            self._memory[key] = (table, meta)
+            self._memory_used += table.nbytes
+            while self._memory_used > self.memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+
+    def _evict_disk(self) -> None:
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".parquet")]
+        stats = sorted(((os.stat(f).st_mtime, os.stat(f).st_size, f) for f in files))
+        used = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if used <= self.disk_bytes:
+                break
+            os.remove(path)
+            used -= size
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= self._memory.pop(key)[0].nbytes
+        if self.directory and os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                "memory_entries": len(self._memory), "memory_bytes": self._memory_used, "hit_rate": self.hits / total if total else 0.0}
+
+
+_cache = None
+_watermarks = {}
+_watermarks_at = 0.0
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+
+def stats() -> dict:
+    """
+    Treffer, Invalidierungen und Speicherbedarf des Caches seit dem Start.
+    """
+    return get_cache().stats()
+
+
+async def current_watermarks() -> dict:
+    """
+    Lese die Wasserstände aller Tabellen in oebb (höchstens alle watermark_interval Sekunden).
+    """
+    global _watermarks, _watermarks_at
+    if time.monotonic() - _watermarks_at < watermark_interval:
+        return _watermarks
+    from agent.schema import async_engine
+    watermarks = {}
+    async with async_engine.connect() as conn:
+        for name, changes in (await conn.execute(text(plain_watermark_sql))).fetchall():
+            watermarks[name] = str(changes)
+        try:
+            async with conn.begin_nested():
+                rows = (await conn.execute(text(hypertable_watermark_sql))).fetchall()
+            for name, changes, chunks, latest in rows:
+                watermarks[name] = f"{changes}|{chunks}|{latest}"
+        except Exception as e:
+            # Ohne TimescaleDB (z.B. lokale Tests) reichen die Änderungszähler
+            logger.debug("No hypertable watermarks: %s", e)
+    _watermarks, _watermarks_at = watermarks, time.monotonic()
+    return watermarks
+
+
+async def cached_query(query: str, execute) -> dict:
+    """
+    Führe eine Abfrage über den Ergebnis-Cache aus.
+    :param query: Die SQL-Abfrage.
+    :param execute: Coroutine-Funktion, die die Abfrage bei einem Cache-Miss ausführt (z.B. executor.execute_query).
+    :return: Das Ergebnis im Format von agent.result.
+    """
+    from agent.schema import tables
+    canonical = canonicalize(query)
+    if not cacheable(canonical):
+        return await execute(query)
+    cache = get_cache()
+    names = referenced_tables(canonical, [t.name for t in tables])
+    watermarks = await current_watermarks()
+    result = await asyncio.to_thread(cache.get, canonical, watermarks)
+    if result is not None:
+        return result
+    result = await execute(query)
+    await asyncio.to_thread(cache.put, canonical, result, names, watermarks)
+    return result
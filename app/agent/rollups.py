@@ -0,0 +1,527 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.timescale.com/use-timescale/latest/continuous-aggregates/ erstellt.
+# Continuous Aggregates für die Faktentabellen: Aus den bisher generierten Abfragen (Fragenkatalog, SQL-Cache) wird
+# ermittelt, nach welchen Spalten Verspätungen typischerweise aggregiert werden. Dafür werden stündliche Rollups
+# vorgeschlagen und angelegt. Zur Laufzeit werden passende Abfragen auf die Rollups umgeschrieben, aber nur wenn das
+# Ergebnis exakt gleich bleibt (Zeitbuckets ab einer Stunde, Zeitfilter auf volle Stunden, zerlegbare Aggregate).
+# Vorschläge: python -m agent.rollups advise; anlegen: python -m agent.rollups create; Vergleich: ... report --execute
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from sqlalchemy import text
+
+from agent.result_cache import canonicalize
+
+logger = logging.getLogger(__name__)
+
+rollup_rewrite = os.getenv("ROLLUP_REWRITE", "1") == "1"
+# Zeitraum, den die Refresh-Policy der Rollups regelmäßig neu berechnet (spätere Änderungen an den Rohdaten)
+refresh_window = os.getenv("ROLLUP_REFRESH_WINDOW", "3 days")
+min_support = int(os.getenv("ROLLUP_MIN_SUPPORT", "3"))
+max_rollups = int(os.getenv("ROLLUP_MAX_PER_TABLE", "3"))
+views_ttl = 300
+bucket_width = "1 hour"
+
+fact_tables = {
+    "arrivals": {"time": "arrivaltimestamp", "minutes": "arrivalmintues", "dims": ("stationid", "train", "arrivaldate", "arrivalstatus", "planedlaststop")},
+    "departures": {"time": "departuretimestamp", "minutes": "departuremintues", "dims": ("stationid", "train", "departuredate", "departurestatus")},
+}
+# Kurznamen der Dimensionen im Namen der Rollups (Bezeichner in PostgreSQL sind auf 63 Zeichen begrenzt)
+dim_names = {"stationid": "station", "train": "train", "arrivaldate": "date", "departuredate": "date",
+             "arrivalstatus": "status", "departurestatus": "status", "planedlaststop": "laststop"}
+rollup_columns = ("bucket", "n", "n_minutes", "sum_minutes", "min_minutes", "max_minutes")
+
+keywords = r"(?:join|inner|left|right|full|cross|natural|where|group|order|limit|offset|on|using|window|having|union|lateral|fetch)"
+fact_reference = re.compile(rf"\b(from|join)\s+oebb\.(arrivals|departures)\b(?:\s+(?:as\s+)?(?!{keywords}\b)(\w+))?")
+interval = re.compile(r"^(?:interval\s+)?'\s*(\d+)\s*(hours?|h|days?|d|weeks?|w|months?|mons?|years?|y)\s*'(?:::interval)?$")
+truncate_units = {"hour", "day", "week", "month", "quarter", "year", "decade", "century", "millennium"}
+extract_fields = {"hour", "day", "dow", "isodow", "doy", "week", "month", "quarter", "year", "isoyear", "decade", "century", "millennium"}
+# Datum oder Zeitpunkt auf eine volle Stunde, ohne Zeitzonenangabe
+aligned_literal = re.compile(r"^(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}\.\d{1,2}\.\d{4})(?:[ t]\d{1,2}(?::00){0,2})?$", re.IGNORECASE)
+literal = r"(?:(?:date|timestamptz|timestamp(?: with time zone)?)\s+)?'([^']*)'(?:\s*::\s*(?:date|timestamptz|timestamp(?: with time zone)?))?"
+filter_clause = r"(\s*filter\s*\(\s*where\s(?:[^()]|\([^()]*\))*\))?"
+aggregates = re.compile(
+    r"\b(count|sum|avg|min|max|stddev\w*|var\w*|array_agg|string_agg|jsonb?_agg|jsonb?_object_agg|percentile_\w+|mode|"
+    r"bool_\w+|every|corr|covar_\w+|regr_\w+|stats_agg|percentile_agg|uddsketch|tdigest|first|last|histogram|bit_\w+)\s*\("
+)
+
+views_sql = """
+SELECT view_name FROM timescaledb_information.continuous_aggregates WHERE view_schema = 'oebb'
+"""
+# Stündliche Rollups sind nur exakt, wenn die Zeitzone der Sitzung um volle Stunden von UTC abweicht
+timezone_sql = "SELECT extract(timezone FROM now())::int % 3600 = 0"
+
+
+def view_name(table: str, dims) -> str:
+    return f"{table}_1h" + "".join(f"__{dim_names[d]}" for d in fact_tables[table]["dims"] if d in dims)
+
+
+def parse_view_name(name: str) -> Optional[tuple]:
+    """
+    Lese Tabelle und Dimensionen aus dem Namen eines Rollups (z.B. arrivals_1h__station__status).
+    """
+    match = re.match(r"^(arrivals|departures)_1h((?:__\w+?)*)$", name)
+    if not match:
+        return None
+    table = match.group(1)
+    short = [s for s in match.group(2).split("__") if s]
+    dims = tuple(d for d in fact_tables[table]["dims"] if dim_names[d] in short)
+    if len(dims) != len(short):
+        return None
+    return table, dims
+
+
+def ddl(table: str, dims) -> list:
+    """
+    SQL zum Anlegen eines Rollups inklusive Refresh-Policy und initialer Berechnung.
+    """
+    cfg = fact_tables[table]
+    name = view_name(table, dims)
+    dims = [d for d in cfg["dims"] if d in dims]
+    columns = "".join(f", {d}" for d in dims)
+    minutes = cfg["minutes"]
+    return [
+        f"""CREATE MATERIALIZED VIEW IF NOT EXISTS oebb.{name}
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket('{bucket_width}', {cfg['time']}) AS bucket{columns}, count(*) AS n, count({minutes}) AS n_minutes,
+       sum({minutes}) AS sum_minutes, min({minutes}) AS min_minutes, max({minutes}) AS max_minutes
+FROM oebb.{table}
+GROUP BY {', '.join(['bucket', *dims])}
+WITH NO DATA""",
+        f"SELECT add_continuous_aggregate_policy('oebb.{name}', start_offset => INTERVAL '{refresh_window}', "
+        f"end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '1 hour', if_not_exists => true)",
+        f"CALL refresh_continuous_aggregate('oebb.{name}', NULL, NULL)",
+    ]
+
+
+def _parens(sql: str) -> list:
+    """
+    Positionen aller Klammerpaare außerhalb von String-Literalen und Bezeichnern in Anführungszeichen.
+    """
+    pairs, stack, quote = [], [], None
+    for i, char in enumerate(sql):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            stack.append(i)
+        elif char == ")" and stack:
+            pairs.append((stack.pop(), i))
+    return pairs
+
+
+def _scope(sql: str, position: int, pairs: list) -> tuple:
+    """
+    Bereich des SELECT, dessen FROM an der Position steht (innerste Klammer bzw. das Hauptstatement).
+    """
+    enclosing = [(o, c) for o, c in pairs if o < position < c]
+    if enclosing:
+        start, end = max(enclosing)
+        return start + 1, end
+    depth = [0] * (len(sql) + 1)
+    for o, c in pairs:
+        for i in range(o, c + 1):
+            depth[i] += 1
+    for match in re.finditer(r"\bselect\b", sql):
+        if depth[match.start()] == 0:
+            return match.start(), len(sql)
+    return 0, len(sql)
+
+
+def _argument(sql: str, open_paren: int) -> tuple:
+    depth = 0
+    for i in range(open_paren, len(sql)):
+        if sql[i] == "(":
+            depth += 1
+        elif sql[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return sql[open_paren + 1:i], i
+    return sql[open_paren + 1:], len(sql)
+
+
+def _keep_column_names(scope: str, replaced: list) -> str:
+    """
+    Ausdrücke ohne Alias in der SELECT-Liste behalten den Spaltennamen des ursprünglichen Aggregats (z.B. "count").
+    """
+    depth, items, start, end = 0, [], len("select"), len(scope)
+    for m in re.finditer(r"[(),]|\bfrom\b", scope):
+        token = m.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token == ",":
+            items.append((start, m.start()))
+            start = m.end()
+        elif depth == 0 and token == "from":
+            end = m.start()
+            break
+    items.append((start, end))
+    for item_start, item_end in reversed(items):
+        m = re.fullmatch(r"\s*(?:distinct\s+)?\x00(\d+)\x00(\s*::\s*[\w ]+?)?\s*", scope[item_start:item_end])
+        if m:
+            insert = item_start + len(scope[item_start:item_end].rstrip())
+            scope = f"{scope[:insert]} as {replaced[int(m.group(1))][1]}{scope[insert:]}"
+    return scope
+
+
+def _rewrite_scope(scope: str, table: str, alias: str, view: Optional[str], view_dims) -> Optional[str]:
+    """
+    Schreibe ein einzelnes SELECT auf einen Rollup um.
+    :param alias: Alias der Faktentabelle im SELECT.
+    :param view: Name des Rollups (None = nur prüfen, ob ein Rollup mit allen Dimensionen passen würde).
+    :return: Das umgeschriebene SELECT oder None, wenn das Ergebnis nicht exakt gleich wäre.
+    """
+    cfg = fact_tables[table]
+    if not scope.startswith("select") or len(re.findall(r"\bselect\b", scope)) > 1 or re.search(r"\b(union|intersect|except)\b", scope):
+        return None
+    if len(re.findall(r"\boebb\.(arrivals|departures)\b", scope)) > 1 or re.search(r"(select|,)\s*(\w+\.)?\*", scope):
+        return None
+    # Steht die Faktentabelle auf der optionalen Seite eines Outer Joins, zählt count(*) die fehlende Zeile mit
+    if re.search(rf"\bleft\s+(?:outer\s+)?join\s+oebb\.{table}\b|\b(?:right|full)\s+(?:outer\s+)?join\b", scope):
+        return None
+    grouped = re.search(r"\bgroup\s+by\b", scope) is not None
+    if not grouped and re.search(r"\bover\s*\(", scope):
+        return None
+
+    def ref(column: str) -> str:
+        return rf"(?:\b{alias}\.|(?<![\w.\"]))\b{column}\b"
+
+    bucket = f"{alias}.bucket"
+    time_ref = ref(cfg["time"])
+
+    def time_bucket(m):
+        return f"time_bucket({m.group(1)}, {bucket})" if interval.match(m.group(1).strip()) else m.group(0)
+
+    def truncated(m):
+        return f"date_trunc('{m.group(1)}', {bucket})" if m.group(1) in truncate_units else m.group(0)
+
+    def extracted(m):
+        return f"extract({m.group(1)} from {bucket})" if m.group(1) in extract_fields else m.group(0)
+
+    def date_part(m):
+        return f"date_part('{m.group(1)}', {bucket})" if m.group(1) in extract_fields else m.group(0)
+
+    def predicate(m):
+        # Nur >= und < sind bei Literalen auf vollen Stunden exakt (> und <= würden eine ganze Stunde verschieben).
+        # Die Spalte muss allein stehen: kein Ausdruck davor (interval '30 minutes' + ts) und keiner nach dem Literal
+        if not re.search(r"(?:\b(?:where|and|or|on|having|not)|\()\s*$", m.string[:m.start()]):
+            return m.group(0)
+        return f"{bucket} {m.group(1)} {m.group(2)}" if aligned_literal.match(m.group(3).strip()) else m.group(0)
+
+    scope = re.sub(rf"time_bucket\(\s*((?:interval\s+)?'[^']*'(?:::interval)?)\s*,\s*{time_ref}\s*\)", time_bucket, scope)
+    scope = re.sub(rf"date_trunc\(\s*'(\w+)'\s*,\s*{time_ref}\s*\)", truncated, scope)
+    scope = re.sub(rf"extract\(\s*(\w+)\s+from\s+{time_ref}\s*\)", extracted, scope)
+    scope = re.sub(rf"date_part\(\s*'(\w+)'\s*,\s*{time_ref}\s*\)", date_part, scope)
+    scope = re.sub(rf"{time_ref}\s*::\s*date\b", f"{bucket}::date", scope)
+    scope = re.sub(rf"\bdate\(\s*{time_ref}\s*\)", f"date({bucket})", scope)
+    scope = re.sub(rf"\bcast\(\s*{time_ref}\s+as\s+date\s*\)", f"cast({bucket} as date)", scope)
+    scope = re.sub(rf"{time_ref}\s*(>=|<(?![=>]))\s*({literal})(?=\s*(?:\)|\b(?:and|or|group|having|window|order|limit|offset|fetch)\b|$))",
+                   predicate, scope)
+
+    # Zerlegbare Aggregate durch Platzhalter ersetzen; Fensterfunktionen (OVER) bleiben unverändert
+    replaced = []
+    minutes_ref = ref(cfg["minutes"])
+
+    def aggregate(m):
+        if re.match(r"\s*over\b", scope_text[m.end():]):
+            return m.group(0)
+        function, argument, condition = m.group(1), m.group(2), m.group(3) or ""
+        if function == "count" and argument in ("*", "1"):
+            replacement = f"coalesce(sum({alias}.n){condition}, 0)::bigint"
+        elif function == "count":
+            replacement = f"coalesce(sum({alias}.n_minutes){condition}, 0)::bigint"
+        elif function == "sum" and argument not in ("*", "1"):
+            replacement = f"(sum({alias}.sum_minutes){condition})::bigint"
+        elif function == "avg" and argument not in ("*", "1"):
+            replacement = f"((sum({alias}.sum_minutes){condition})::numeric / nullif(sum({alias}.n_minutes){condition}, 0))"
+        elif function in ("min", "max") and argument not in ("*", "1"):
+            replacement = f"{function}({alias}.{function}_minutes){condition}"
+        else:
+            return m.group(0)
+        replaced.append((replacement, function))
+        return f"\x00{len(replaced) - 1}\x00"
+
+    def conditional_count(m):
+        # sum(case when <Bedingung> then 1 else 0 end) bzw. count(case when <Bedingung> then 1 end). Die Summe bleibt
+        # eine Summe über alle Zeilen (NULL ohne Zeilen, 0 ohne Treffer), die Anzahl ist ohne Zeilen 0
+        if re.match(r"\s*(over|filter)\b", scope_text[m.end():]):
+            return m.group(0)
+        if m.group(1):
+            replaced.append((f"sum(case when {m.group(1)} then {alias}.n else 0 end)::bigint", "sum"))
+        else:
+            replaced.append((f"coalesce(sum({alias}.n) filter (where {m.group(2)}), 0)::bigint", "count"))
+        return f"\x00{len(replaced) - 1}\x00"
+
+    condition = r"((?:(?!\b(?:when|then|case)\b)[^()]|\([^()]*\))*?)"
+    scope_text = scope
+    scope = re.sub(rf"\bsum\(\s*case\s+when\s+{condition}\s+then\s+1\s+else\s+0\s+end\s*\)|\bcount\(\s*case\s+when\s+{condition}\s+then\s+1\s+end\s*\)", conditional_count, scope)
+    scope_text = scope
+    scope = re.sub(rf"\b(count|sum|avg|min|max)\(\s*({minutes_ref}|\*|1)\s*\){filter_clause}", aggregate, scope)
+    if not replaced and not grouped and not scope.startswith("select distinct"):
+        # Ohne Gruppierung und ohne Aggregat würde der Rollup andere Zeilen liefern
+        return None
+    # Verbleibende Aggregate dürfen nur Fensterfunktionen, DISTINCT oder MIN/MAX über Dimensionen sein
+    for m in aggregates.finditer(scope):
+        argument, end = _argument(scope, m.end() - 1)
+        rest = scope[end + 1:]
+        rest = rest[re.match(filter_clause, rest).end():]
+        if re.match(r"\s*over\b", rest) or argument.strip().startswith("distinct") or m.group(1) in ("min", "max"):
+            continue
+        return None
+    scope = _keep_column_names(scope, replaced)
+    scope = re.sub(r"\x00(\d+)\x00", lambda m: replaced[int(m.group(1))][0], scope)
+    # Die Rohspalten dürfen nicht mehr vorkommen, alle anderen Spalten der Faktentabelle müssen im Rollup existieren
+    dims = fact_tables[table]["dims"] if view is None else view_dims
+    raw_only = [cfg["time"], cfg["minutes"]] + [d for d in cfg["dims"] if d not in dims]
+    if any(re.search(ref(column), scope) for column in raw_only):
+        return None
+    if any(c not in rollup_columns and c not in dims for c in re.findall(rf"\b{alias}\.(\w+)", scope)):
+        return None
+    target = view or "rollup"
+    return fact_reference.sub(lambda m: f"{m.group(1)} oebb.{target} {alias}", scope, count=1)
+
+
+def _fact_scopes(sql: str) -> list:
+    """
+    Alle SELECTs, die direkt aus einer Faktentabelle lesen: (start, end, table, alias, benötigte Dimensionen).
+    """
+    pairs = _parens(sql)
+    scopes = []
+    for m in fact_reference.finditer(sql):
+        start, end = _scope(sql, m.start(), pairs)
+        table, alias = m.group(2), m.group(3) or m.group(2)
+        scope = sql[start:end].strip()
+        dims = set()
+        for d in fact_tables[table]["dims"]:
+            if re.search(rf"(?:\b{alias}\.|(?<![\w.\"]))\b{d}\b", scope):
+                dims.add(d)
+        scopes.append((start, end, table, alias, dims))
+    return scopes
+
+
+def requirements(sql: str) -> list:
+    """
+    Ermittle für eine Abfrage, welche SELECTs auf einen Rollup umschreibbar wären und welche Dimensionen sie brauchen.
+    :return: Liste von (Tabelle, Dimensionen).
+    """
+    sql = canonicalize(sql)
+    result = []
+    for start, end, table, alias, dims in _fact_scopes(sql):
+        if _rewrite_scope(sql[start:end].strip(), table, alias, None, ()) is not None:
+            result.append((table, tuple(d for d in fact_tables[table]["dims"] if d in dims)))
+    return result
+
+
+def rewrite(sql: str, views: dict) -> Optional[str]:
+    """
+    Schreibe eine Abfrage auf die vorhandenen Rollups um.
+    :param views: Tabelle -> Liste von (Name des Rollups, Dimensionen).
+    :return: Die umgeschriebene Abfrage oder None, wenn kein SELECT passt.
+    """
+    canonical = canonicalize(sql)
+    # Dollar-Quoting erkennt canonicalize nicht als Literal, der Inhalt wäre kleingeschrieben
+    if ";" in canonical or "$" in canonical:
+        return None
+    parts, last, changed = [], 0, False
+    for start, end, table, alias, dims in sorted(_fact_scopes(canonical)):
+        if start < last:
+            continue
+        # Der kleinste Rollup, der alle benötigten Dimensionen enthält
+        candidates = sorted((len(d), name, d) for name, d in views.get(table, []) if dims <= set(d))
+        if not candidates:
+            continue
+        _, name, view_dims = candidates[0]
+        scope = canonical[start:end]
+        rewritten = _rewrite_scope(scope.strip(), table, alias, name, view_dims)
+        if rewritten is None:
+            continue
+        parts.append(canonical[last:start])
+        parts.append(scope[:len(scope) - len(scope.lstrip())] + rewritten + scope[len(scope.rstrip()):])
+        last, changed = end, True
+    if not changed:
+        return None
+    parts.append(canonical[last:])
+    return "".join(parts)
+
+
+def propose(statements: list) -> tuple:
+    """
+    Schlage Rollups aus einer Sammlung von SQL-Abfragen vor.
+    :return: (Vorschläge als Liste von (Tabelle, Dimensionen, Support), Statistik der Muster).
+    """
+    needed = Counter()
+    buckets = Counter()
+    total = 0
+    for sql in statements:
+        total += 1
+        for table, dims in requirements(sql):
+            needed[(table, dims)] += 1
+        for m in re.finditer(r"time_bucket\(\s*(?:interval\s+)?'([^']*)'|date_trunc\(\s*'(\w+)'", canonicalize(sql)):
+            buckets[(m.group(1) or m.group(2)).strip()] += 1
+    proposals = []
+    for (table, dims), support in needed.most_common():
+        if support < min_support:
+            break
+        covered = [p for p in proposals if p[0] == table and set(dims) <= set(p[1])]
+        if covered or sum(1 for p in proposals if p[0] == table) >= max_rollups:
+            continue
+        proposals.append((table, dims, support))
+    coverage = sum(n for (table, dims), n in needed.items() if any(p[0] == table and set(dims) <= set(p[1]) for p in proposals))
+    return proposals, {"statements": total, "rewritable": sum(needed.values()), "covered": coverage,
+                       "patterns": needed, "buckets": buckets}
+
+
+_views = {}
+_views_at = 0.0
+_stats = {"statements": 0, "rewritten": 0, "failed": 0}
+_timings = {"raw": deque(maxlen=1000), "rewritten": deque(maxlen=1000)}
+
+
+def _parse_views(names: list) -> dict:
+    views = {}
+    for name in names:
+        parsed = parse_view_name(name)
+        if parsed is not None:
+            views.setdefault(parsed[0], []).append((name, parsed[1]))
+    return views
+
+
+async def available(conn) -> dict:
+    """
+    Lese die vorhandenen Rollups (zwischengespeichert für views_ttl Sekunden).
+    """
+    global _views, _views_at
+    if time.monotonic() - _views_at < views_ttl:
+        return _views
+    try:
+        async with conn.begin_nested():
+            names = [name for (name,) in (await conn.execute(text(views_sql))).fetchall()]
+            aligned = (await conn.execute(text(timezone_sql))).scalar()
+        _views = _parse_views(names) if aligned else {}
+    except Exception:
+        # Ohne TimescaleDB gibt es keine Continuous Aggregates
+        _views = {}
+    _views_at = time.monotonic()
+    return _views
+
+
+async def prepare(conn, stmt: str) -> Optional[str]:
+    """
+    Schreibe ein Statement auf einen Rollup um und prüfe das Ergebnis mit EXPLAIN.
+    :return: Das umgeschriebene Statement oder None, wenn die Rohdaten gelesen werden müssen.
+    """
+    views = await available(conn)
+    if not views or not any(table in stmt.lower() for table in fact_tables):
+        return None
+    _stats["statements"] += 1
+    rewritten = rewrite(stmt, views)
+    if rewritten is None:
+        return None
+    try:
+        async with conn.begin_nested():
+            await conn.execute(text(f"EXPLAIN {rewritten}"))
+    except Exception as e:
+        _stats["failed"] += 1
+        logger.info("Rollup rewrite rejected by the planner, reading raw data: %s", e)
+        return None
+    _stats["rewritten"] += 1
+    return rewritten
+
+
+def record(rewritten: bool, seconds: float) -> None:
+    _timings["rewritten" if rewritten else "raw"].append(seconds)
+
+
+def stats() -> dict:
+    """
+    Trefferquote der Umschreibung (bezogen auf Statements auf den Faktentabellen) und Laufzeiten.
+    """
+    result = dict(_stats)
+    result["hit_rate"] = _stats["rewritten"] / _stats["statements"] if _stats["statements"] else 0.0
+    for kind, timings in _timings.items():
+        result[f"{kind}_median_seconds"] = statistics.median(timings) if timings else None
+    return result
+
+
+def _workbook_statements(workbooks: list, history: Optional[str]) -> list:
+    import pandas as pd
+    statements = []
+    for workbook in workbooks:
+        df = pd.read_excel(workbook, sheet_name="Questions")
+        for column in ("GoldenSQL", "MistralSQL", "GoogleSQL", "OpenaiSQL"):
+            if column in df:
+                statements.extend(s for s in df[column].dropna() if isinstance(s, str) and s.strip())
+    if history and os.path.exists(history):
+        with open(history, encoding="utf-8") as f:
+            statements.extend(entry["sql"] for _, entry in json.load(f).get("entries", []))
+    return statements
+
+
+def _report(statements: list, engine, execute: bool) -> None:
+    with engine.connect() as conn:
+        names = [name for (name,) in conn.execute(text(views_sql)).fetchall()]
+    views = _parse_views(names)
+    rows = []
+    for sql in statements:
+        rewritten = rewrite(sql, views)
+        row = {"rewritten": rewritten is not None, "raw_seconds": None, "rollup_seconds": None, "equal": None}
+        if execute and rewritten is not None:
+            results = []
+            for key, query in (("raw_seconds", sql), ("rollup_seconds", rewritten)):
+                with engine.connect() as conn:
+                    start = time.perf_counter()
+                    try:
+                        results.append(sorted(map(repr, conn.execute(text(query)).fetchall())))
+                    except Exception as e:
+                        logger.warning("Query failed: %s", e)
+                        results.append(None)
+                    row[key] = time.perf_counter() - start
+            row["equal"] = results[0] is not None and results[0] == results[1]
+        rows.append(row)
+    hits = [r for r in rows if r["rewritten"]]
+    print(f"Rollups: {', '.join(names) or 'none'}")
+    print(f"Rewritten {len(hits)} of {len(rows)} statements ({len(hits) / max(len(rows), 1):.1%})")
+    timed = [r for r in hits if r["equal"] is not None]
+    if timed:
+        raw = statistics.median(r["raw_seconds"] for r in timed)
+        rollup = statistics.median(r["rollup_seconds"] for r in timed)
+        print(f"Median execution raw {raw:.3f}s vs rollup {rollup:.3f}s, identical results {sum(r['equal'] for r in timed)}/{len(timed)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schlage Continuous Aggregates aus den bisherigen Abfragen vor, lege sie an oder vergleiche Laufzeiten.")
+    parser.add_argument("command", choices=["advise", "create", "report"])
+    parser.add_argument("workbooks", nargs="*", default=[os.path.join("..", "questions", "questions.xlsx")])
+    parser.add_argument("--history", default=os.getenv("SQL_CACHE_PATH", os.path.join(".cache", "sql_cache.json")), help="Gespeicherte Abfragen des SQL-Caches")
+    parser.add_argument("--execute", action="store_true", help="report: Roh- und umgeschriebene Abfrage ausführen und vergleichen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    statements = _workbook_statements(args.workbooks, args.history)
+    from agent.schema import engine
+    if args.command == "report":
+        _report(statements, engine, args.execute)
+    else:
+        proposals, summary = propose(statements)
+        print(f"{summary['rewritable']} rollup-compatible SELECTs in {summary['statements']} statements, "
+              f"{summary['covered']} covered by the proposals")
+        print("Buckets: " + ", ".join(f"{b} ({n})" for b, n in summary["buckets"].most_common(8)))
+        for (table, dims), n in summary["patterns"].most_common(10):
+            print(f"  {table} by {', '.join(dims) or 'time only'}: {n}")
+        for table, dims, support in proposals:
+            print(f"\n-- {view_name(table, dims)} (support {support})")
+            statements_ddl = ddl(table, dims)
+            print(";\n".join(statements_ddl) + ";")
+            if args.command == "create":
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    for stmt in statements_ddl:
+                        conn.execute(text(stmt))
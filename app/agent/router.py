@@ -0,0 +1,73 @@
+# Regelbasiertes Routing für den Supervisor. Die meisten Übergänge ergeben sich direkt aus dem GraphState,
+# nur in mehrdeutigen Fällen (z.B. Folgefrage mit Daten/Antwort einer früheren Frage) wird das LLM gefragt.
+import logging
+import os
+from typing import Optional
+
+from langgraph.graph import END
+from agent.result import row_count
+
+logger = logging.getLogger(__name__)
+
+# Maximale Anzahl an erneuten Supervisor-Aufrufen, wenn die Antwort des LLMs nicht geparst werden kann
+max_retries = int(os.getenv("SUPERVISOR_MAX_RETRIES", "2"))
+next_agents = ("query_agent", "interpretation_agent", END)
+
+
+def has_data(state: dict) -> bool:
+    return row_count(state.get("data")) > 0
+
+
+def route(state: dict) -> Optional[str]:
+    """
+    Entscheide den nächsten Knoten anhand des Zustands.
+    :param state: Der aktuelle GraphState.
+    :return: Der nächste Knoten oder None, wenn der Zustand mehrdeutig ist und das LLM entscheiden soll.
+    """
+    question = state.get("question")
+    answer = state.get("answer")
+    if answer:
+        # Antwort zur aktuellen Frage vorhanden -> fertig
+        if state.get("answered_question") == question:
+            return END
+        # Antwort stammt aus einer früheren Frage, aber die Daten sind bereits zur aktuellen Frage geladen
+        if has_data(state) and state.get("data_question") == question:
+            return "interpretation_agent"
+        return None
+    if not has_data(state):
+        return "query_agent"
+    # Daten ohne Herkunft (z.B. von außen übergebene Golden-Daten) oder zur aktuellen Frage -> interpretieren
+    if state.get("data_question", question) == question:
+        return "interpretation_agent"
+    return None
+
+
+def fallback(state: dict) -> str:
+    """
+    Deterministische Entscheidung, wenn das LLM nach max_retries keine gültige Antwort geliefert hat.
+    """
+    if state.get("answer") and state.get("answered_question") == state.get("question"):
+        return END
+    if has_data(state) and state.get("data_question", state.get("question")) == state.get("question"):
+        return "interpretation_agent"
+    return "query_agent"
+
+
+def counters(state: dict) -> dict:
+    """
+    Gebe die Supervisor-Zähler der aktuellen Frage zurück. Bei einer neuen Frage (gleicher Thread) wird neu gezählt.
+    """
+    if state.get("routed_question") != state.get("question"):
+        return {"routed_question": state.get("question"), "supervisor_calls": 0, "supervisor_saved": 0, "supervisor_retries": 0}
+    return {
+        "routed_question": state.get("question"),
+        "supervisor_calls": state.get("supervisor_calls") or 0,
+        "supervisor_saved": state.get("supervisor_saved") or 0,
+        "supervisor_retries": state.get("supervisor_retries") or 0,
+    }
+
+
+def report(counts: dict, next_agent: str) -> None:
+    if next_agent == END:
+        logger.info("Supervisor for question %r: %d LLM calls, %d saved by rules, %d retries",
+                    counts["routed_question"], counts["supervisor_calls"], counts["supervisor_saved"], counts["supervisor_retries"])
@@ -0,0 +1,210 @@
+# Schema-Linking: Auswahl der für eine Frage relevanten Tabellen und Spalten, damit der Prompt des Query Agents nur
+# einen minimalen Ausschnitt des Schemas enthält. Grundlage sind Schlüsselwörter pro Tabelle bzw. Spalte und
+# Stichproben der Werte aus station, trainnames und holidays (z.B. Bahnhöfe, Städte oder Zugtypen in der Frage).
+# Findet die Abfrage eine Spalte oder Tabelle nicht, verwendet der Query Agent wieder das vollständige Schema.
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from agent import schema
+from agent.sql_cache import normalize
+
+logger = logging.getLogger(__name__)
+
+linking = os.getenv("SCHEMA_LINKING", "1") == "1"
+values_path = os.getenv("SCHEMA_VALUES_PATH", os.path.join(".cache", "schema_values.json"))
+# Minimale Länge eines Werts, damit er in der Frage gesucht wird (vermeidet Treffer wie "S" oder "R"). Kurze Werte
+# wie Zugtypen (RJ, WB) müssen als ganzes Wort vorkommen, ab prefix_length auch als Wortanfang ("Linzer" -> "linz").
+min_value_length = 2
+prefix_length = 4
+# Wartezeit in Sekunden, bis nach einem Fehler beim Lesen der Werte ein neuer Versuch erfolgt
+retry_interval = 60
+
+# Schlüsselwörter (normalisierte Wortanfänge) pro Tabelle
+table_keywords = {
+    "arrivals": ("ankunft", "ankünft", "ankomm", "angekommen", "einfahr", "eintreff", "arrival", "arriv"),
+    "departures": ("abfahrt", "abfahr", "abgefahren", "abreise", "departure", "depart"),
+    "station": (
+        "bahnhof", "bahnhöf", "station", "haltestelle", "stadt", "städte", "ort", "gemeinde", "bezirk", "bundesland",
+        "bundesländer", "region", "city", "district", "state", "österreich", "wien", "salzburg", "tirol", "vorarlberg",
+        "voralberg", "kärnt", "steiermark", "steirisch", "burgenland",
+    ),
+    "trainnames": (
+        "zugtyp", "zugart", "zuggattung", "zugname", "zugkategorie", "typ", "gattung", "kategorie", "railjet",
+        "nightjet", "cityjet", "regionalzug", "regionalzüg", "regionalexpress", "fernverkehr", "nahverkehr",
+        "schnellbahn", "s bahn", "traintype",
+    ),
+    "holidays": ("feiertag", "ferien", "holiday", "urlaub", "weihnacht", "ostern", "pfingst", "neujahr", "silvester"),
+}
+# Spalten, die nur bei passenden Schlüsselwörtern in den Prompt kommen. Alle anderen Spalten einer ausgewählten
+# Tabelle (Zeit, Schlüssel, Verspätung) werden immer übernommen.
+status_keywords = ("ausfall", "ausfäll", "ausgefallen", "fällt", "entfall", "entfiel", "storn", "gestrichen", "neu", "status", "cancel")
+column_keywords = {
+    ("arrivals", "arrivalstatus"): status_keywords,
+    ("departures", "departurestatus"): status_keywords,
+    ("arrivals", "planedlaststop"): ("endstation", "endbahnhof", "endhalt", "ziel", "letzte halt", "letzter halt", "richtung", "last stop", "destination"),
+}
+# Ohne Hinweis auf Ankunft oder Abfahrt werden beide Faktentabellen angeboten
+fact_tables = ("arrivals", "departures")
+# Feiertage gelten pro Bundesland und werden über station.state verknüpft
+required_tables = {"holidays": ("station",)}
+# Tabellen mit Werten, die in der Frage vorkommen können
+values_sql = {
+    "station": "SELECT DISTINCT v FROM oebb.station, unnest(ARRAY[station, city, district, state]) AS v WHERE v IS NOT NULL",
+    "trainnames": "SELECT DISTINCT v FROM oebb.trainnames, unnest(ARRAY[trainname, traintype]) AS v WHERE v IS NOT NULL",
+    "holidays": "SELECT DISTINCT name FROM oebb.holidays WHERE name IS NOT NULL",
+}
+undefined_identifier = re.compile(r"undefined(column|table)|(column|relation) \S+ does not exist", re.IGNORECASE)
+
+
+def _mentions(question: str, words: list, keyword: str) -> bool:
+    if " " in keyword:
+        return f" {keyword} " in f" {question} "
+    return any(w.startswith(keyword) for w in words)
+
+
+def read_values(engine=None) -> dict:
+    """
+    Lese die Werte aus station, trainnames und holidays und speichere sie zusammen mit der Schema-Version.
+    """
+    engine = engine or schema.engine
+    values = {}
+    with engine.connect() as conn:
+        for table, sql in values_sql.items():
+            values[table] = sorted({normalize(str(v)) for (v,) in conn.execute(text(sql))} - {""})
+    stored = {"version": schema.schema_version(), "values": values}
+    if values_path:
+        os.makedirs(os.path.dirname(values_path) or ".", exist_ok=True)
+        tmp = f"{values_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stored, f, ensure_ascii=False)
+        os.replace(tmp, values_path)
+    return values
+
+
+class ValueIndex:
+    """
+    Index der Werte je Tabelle: einzelne Wörter als Menge, mehrteilige Werte als Phrasen.
+    """
+
+    def __init__(self, values: dict):
+        self.words = {}
+        self.phrases = {}
+        for table, entries in values.items():
+            for value in entries:
+                if len(value) < min_value_length or value.isdigit():
+                    continue
+                if " " in value:
+                    self.phrases.setdefault(table, set()).add(value)
+                else:
+                    self.words.setdefault(table, set()).add(value)
+
+    def tables(self, question: str, words: list) -> set:
+        """
+        Tabellen, deren Werte in der Frage vorkommen.
+        """
+        found = set()
+        padded = f" {question} "
+        for table, values in self.words.items():
+            if any(w in values or any(w[:n] in values for n in range(prefix_length, len(w))) for w in words):
+                found.add(table)
+        for table, phrases in self.phrases.items():
+            if table not in found and any(f" {p} " in padded for p in phrases):
+                found.add(table)
+        return found
+
+
+_index = None
+_index_version = None
+# Nach einem Fehler gilt der leere Index nur bis zu diesem Zeitpunkt (time.monotonic), danach wird neu gelesen
+_retry_at = None
+_lock = threading.Lock()
+
+
+def _current(version: str) -> bool:
+    return _index is not None and _index_version == version and (_retry_at is None or time.monotonic() < _retry_at)
+
+
+def value_index() -> ValueIndex:
+    """
+    Gebe den Werte-Index für die aktuelle Schema-Version zurück (von der Festplatte, sonst aus der Datenbank).
+    Ist beides nicht verfügbar, arbeitet das Schema-Linking für retry_interval Sekunden nur mit den Schlüsselwörtern.
+    """
+    global _index, _index_version, _retry_at
+    version = schema.schema_version()
+    if _current(version):
+        return _index
+    with _lock:
+        if not _current(version):
+            values = None
+            try:
+                with open(values_path, encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("version") == version:
+                    values = stored["values"]
+            except (OSError, ValueError, TypeError):
+                pass
+            _retry_at = None
+            if values is None:
+                try:
+                    values = read_values()
+                except Exception as e:
+                    logger.warning("Could not read value samples for schema linking, retrying in %ss: %s", retry_interval, e)
+                    values, _retry_at = {}, time.monotonic() + retry_interval
+            _index, _index_version = ValueIndex(values), version
+    return _index
+
+
+async def avalue_index() -> ValueIndex:
+    """
+    Wie value_index, aber das Laden bzw. Lesen der Werte aus der Datenbank läuft in einem Thread.
+    """
+    if _current((await schema.asnapshot())["version"]):
+        return _index
+    return await asyncio.to_thread(value_index)
+
+
+async def alink(question: str) -> Optional[dict]:
+    """
+    Wie link, ohne den Event-Loop beim Aufbau des Werte-Index zu blockieren.
+    """
+    return link(question, await avalue_index())
+
+
+def link(question: str, index: Optional[ValueIndex] = None) -> Optional[dict]:
+    """
+    Wähle die für die Frage relevanten Tabellen und Spalten.
+    :param question: Die Frage des Benutzers.
+    :param index: Der Werte-Index (None = value_index()).
+    :return: Tabelle -> Tupel von Spalten für schema.schema_prompt oder None für das vollständige Schema.
+    """
+    normalized = normalize(question)
+    words = normalized.split()
+    tables = {t for t, keywords in table_keywords.items() if any(_mentions(normalized, words, k) for k in keywords)}
+    tables |= (index or value_index()).tables(normalized, words)
+    if not tables:
+        return None
+    if not tables & set(fact_tables):
+        tables |= set(fact_tables)
+    for table, required in required_tables.items():
+        if table in tables:
+            tables |= set(required)
+    current = schema.snapshot()["tables"]
+    selection = {}
+    for table in schema.table_names:
+        if table not in tables:
+            continue
+        columns = []
+        for column in current[table]:
+            keywords = column_keywords.get((table, column["name"]))
+            if keywords is None or any(_mentions(normalized, words, k) for k in keywords):
+                columns.append(column["name"])
+        selection[table] = tuple(columns)
+    return selection
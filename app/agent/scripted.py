@@ -0,0 +1,136 @@
+# Diese Datei wurde mit der Dokumentation von https://python.langchain.com/docs/how_to/custom_chat_model/ erstellt.
+# Geskriptetes Chat-Modell für Benchmarks ohne Cloud-LLM. Es wird wie dryrun über model_query/model_interpret
+# ausgewählt ("scripted") und antwortet je nach Prompt: Der Supervisor bekommt eine Entscheidung aus Daten und
+# Antwort im Prompt, der Query Agent das SQL aus dem Skript (pro Frage eine Liste, ein Eintrag pro Versuch) und der
+# Interpretation Agent eine statische Antwort. Latenzen pro Rolle simulieren die Antwortzeit eines Providers.
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent.compaction import estimate_tokens
+
+# Skript als JSON: {"questions": {Frage: [SQL Versuch 1, SQL Versuch 2, ...]}, "latency": {Rolle: Sekunden}}
+# oder im Format der Benchmark-Szenarien: {"scenarios": {Name: {"question": Frage, "sql": [...]}}, "latency": {...}}
+script_path = os.getenv("SCRIPTED_LLM_SCRIPT", "")
+default_sql = "SELECT * FROM oebb.arrivals ORDER BY arrivaltimestamp DESC LIMIT 10"
+default_answer = "Das ist eine geskriptete Antwort für Benchmarks."
+question_pattern = re.compile(r"The user question is: (.*?)\n", re.DOTALL)
+last_query_pattern = re.compile(r"The last query was: (.*?)\n\s*The last error of that query was: (.*?)\n\s*The query should", re.DOTALL)
+
+
+def role_of(prompt: str) -> str:
+    if prompt.startswith("You are a supervisor"):
+        return "supervisor"
+    if prompt.startswith("You are a query agent"):
+        return "query"
+    return "interpret"
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat-Modell mit deterministischen Antworten aus einem Skript.
+    """
+
+    questions: dict = {}
+    latency: dict = {}
+    # Zusätzliche Verzögerung pro gestreamtem Token in Sekunden
+    token_latency: float = 0.0
+    answer: str = default_answer
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def respond(self, prompt: str) -> str:
+        """
+        Antwort für einen Prompt. Der Versuch des Query Agents ergibt sich zustandslos aus der letzten Abfrage im
+        Prompt: Steht sie im Skript der Frage, kommt der nächste Eintrag (der letzte Eintrag wiederholt sich).
+        """
+        role = role_of(prompt)
+        if role == "supervisor":
+            answer = re.search(r"Answer: (.*)\n", prompt)
+            data = re.search(r"Data: (.*)\n", prompt)
+            if answer and answer.group(1).strip():
+                return "{'next_agent':'__end__'}"
+            if data and data.group(1).strip() not in ("", "{}", "[]", "None"):
+                return "{'next_agent':'interpretation_agent'}"
+            return "{'next_agent':'query_agent'}"
+        if role == "interpret":
+            return self.answer
+        match = question_pattern.search(prompt)
+        attempts = [a.strip() for a in self.questions.get(match.group(1).strip(), [])] if match else []
+        if not attempts:
+            return f"```sql\n{default_sql}\n```"
+        attempt = 0
+        last = last_query_pattern.search(prompt)
+        if last and last.group(2).strip():
+            previous = last.group(1).strip()
+            if previous in attempts:
+                attempt = attempts.index(previous) + 1
+        return f"```sql\n{attempts[min(attempt, len(attempts) - 1)]}\n```"
+
+    def _prompt(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _usage(self, prompt: str, content: str) -> dict:
+        usage = {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(content)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return usage
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt(messages)
+        time.sleep(self.latency.get(role_of(prompt), 0.0))
+        content = self.respond(prompt)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=self._usage(prompt, content)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self.latency.get(role_of(prompt), 0.0))
+        content = self.respond(prompt)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=self._usage(prompt, content)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        result = self._generate(messages, stop, run_manager, **kwargs)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].message.content,
+                                                         usage_metadata=result.generations[0].message.usage_metadata))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Wortweise wie ein echter Provider, die Nutzung kommt mit dem letzten Chunk
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self.latency.get(role_of(prompt), 0.0))
+        content = self.respond(prompt)
+        for token in re.split(r"(\s+)", content):
+            if not token:
+                continue
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, content)))
+
+
+def from_script(path: str = script_path, **kwargs) -> ScriptedChatModel:
+    """
+    Erstelle das Modell aus einer Skript-Datei (ohne Datei antwortet der Query Agent mit default_sql).
+    """
+    script = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            script = json.load(f)
+    questions = dict(script.get("questions", {}))
+    questions.update({s["question"]: s["sql"] for s in script.get("scenarios", {}).values()})
+    return ScriptedChatModel(questions=questions, latency=script.get("latency", {}), **kwargs)
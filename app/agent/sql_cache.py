@@ -0,0 +1,200 @@
+# Semantischer Cache Frage -> SQL vor dem Query Agent.
+# Fragen werden normalisiert und per TF-IDF über Zeichen-n-Gramme (ohne Netzwerk) mit bereits erfolgreich
+# ausgeführten Fragen verglichen. Nur bei hoher Übereinstimmung wird das gespeicherte SQL direkt verwendet.
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+cache_path = os.getenv("SQL_CACHE_PATH", os.path.join(".cache", "sql_cache.json"))
+cache_size = int(os.getenv("SQL_CACHE_SIZE", "1000"))
+# Minimale Kosinus-Ähnlichkeit für einen Treffer
+cache_threshold = float(os.getenv("SQL_CACHE_THRESHOLD", "0.85"))
+ngram_sizes = (3, 4, 5)
+
+# Füllwörter, die zwischen zwei sonst gleichen Fragen abweichen dürfen
+stopwords = {
+    "der", "die", "das", "den", "dem", "des", "ein", "eine", "einen", "einem", "einer", "und", "oder", "ist", "sind",
+    "es", "gibt", "bitte", "mir", "mal", "wie", "was", "welche", "welcher", "welches", "im", "in", "am", "an", "auf",
+    "bei", "zu", "zum", "zur", "von", "vom", "für", "mit", "the", "a", "an", "of", "is", "are", "please", "what",
+    "which", "how", "in", "on", "at", "for", "to", "me", "show", "zeige", "zeig",
+}
+
+
+def normalize(question: str) -> str:
+    """
+    Normalisiere eine Frage (Unicode, Kleinschreibung, Satzzeichen, Leerzeichen).
+    """
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"[^\w\s.-]", " ", question)
+    question = re.sub(r"(?<!\d)[.-]|[.-](?!\d)", " ", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def ngrams(text: str) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for n in ngram_sizes for i in range(len(padded) - n + 1))
+
+
+# Flexionsendungen, um die sich ein Wort von seinem Gegenstück unterscheiden darf (Verspätung/Verspätungen)
+inflections = {"", "e", "n", "en", "s", "es", "er", "em", "ern"}
+
+
+def _variant(word: str, other: str) -> bool:
+    """
+    Gleicher Wortstamm, nur die Endung unterscheidet sich. Vorsilben wie "un" in "unpünktlich" ändern die Bedeutung.
+    """
+    stem = os.path.commonprefix([word, other])
+    return len(stem) >= 4 and word[len(stem):] in inflections and other[len(stem):] in inflections
+
+
+def _compatible(a: str, b: str) -> bool:
+    """
+    Prüfe, ob zwei ähnliche Fragen dasselbe SQL erwarten lassen: Zahlen müssen gleich sein und jedes abweichende Wort
+    muss ein Füllwort sein oder sich nur in der Flexionsendung unterscheiden. "Linz" vs. "Graz", "pünktlich" vs.
+    "unpünktlich" und ein zusätzliches "nicht" sind kein Treffer.
+    """
+    words_a, words_b = set(a.split()), set(b.split())
+    digits = re.compile(r"\d")
+    if {w for w in words_a if digits.search(w)} != {w for w in words_b if digits.search(w)}:
+        return False
+    return not _unmatched(words_a - words_b, words_b - words_a) and not _unmatched(words_b - words_a, words_a - words_b)
+
+
+def _unmatched(words: set, others: set) -> list:
+    return [w for w in words if w not in stopwords and not any(_variant(w, o) for o in others)]
+
+
+class SemanticSqlCache:
+    """
+    LRU-Cache mit Ähnlichkeitssuche für (Frage, SQL)-Paare, die erfolgreich ausgeführt wurden.
+    :param path: Datei für die Persistenz über Neustarts (None = nur im Speicher).
+    :param version: Schema-Version; Einträge anderer Versionen werden beim Laden verworfen.
+    """
+
+    def __init__(self, path: Optional[str], version: str, size: int = cache_size, threshold: float = cache_threshold):
+        self.path = path
+        self.version = version
+        self.size = size
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._grams = {}
+        self._idf = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load SQL cache %s: %s", self.path, e)
+            return
+        if stored.get("version") != self.version:
+            logger.info("SQL cache %s belongs to schema version %s, starting empty", self.path, stored.get("version"))
+            return
+        for key, entry in stored.get("entries", [])[-self.size:]:
+            self._entries[key] = entry
+            self._grams[key] = ngrams(key)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "entries": list(self._entries.items())}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _vector(self, grams: Counter) -> dict:
+        vector = {g: tf * self._idf.get(g, self._default_idf) for g, tf in grams.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {g: v / norm for g, v in vector.items()}
+
+    def _build_idf(self) -> None:
+        df = Counter(g for grams in self._grams.values() for g in grams)
+        n = len(self._grams)
+        self._idf = {g: math.log((1 + n) / (1 + count)) + 1 for g, count in df.items()}
+        self._default_idf = math.log(1 + n) + 1
+        self._vectors = {key: self._vector(grams) for key, grams in self._grams.items()}
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        Suche das SQL der ähnlichsten gespeicherten Frage.
+        :return: Das SQL bei einem sicheren Treffer, sonst None.
+        """
+        key = normalize(question)
+        with self._lock:
+            best, score = None, 0.0
+            if key in self._entries:
+                best, score = key, 1.0
+            elif self._entries:
+                if self._idf is None:
+                    self._build_idf()
+                vector = self._vector(ngrams(key))
+                for candidate, other in self._vectors.items():
+                    similarity = sum(v * other.get(g, 0.0) for g, v in vector.items())
+                    if similarity > score:
+                        best, score = candidate, similarity
+            if best is not None and score >= self.threshold and _compatible(key, best):
+                self.hits += 1
+                self._entries.move_to_end(best)
+                logger.info("SQL cache hit (%.3f) for %r -> %r", score, question, self._entries[best]["question"])
+                return self._entries[best]["sql"]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, sql: str) -> None:
+        """
+        Speichere ein erfolgreich ausgeführtes (Frage, SQL)-Paar und verdränge bei Bedarf den ältesten Eintrag.
+        """
+        key = normalize(question)
+        with self._lock:
+            self._entries[key] = {"question": question, "sql": sql}
+            self._entries.move_to_end(key)
+            self._grams[key] = ngrams(key)
+            while len(self._entries) > self.size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._grams.pop(evicted, None)
+            self._idf = None
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning("Could not persist SQL cache %s: %s", self.path, e)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "hit_rate": self.hits / total if total else 0.0}
+
+
+_cache = None
+
+
+def get_cache() -> SemanticSqlCache:
+    """
+    Gebe den prozessweiten Cache für die aktuelle Schema-Version zurück.
+    """
+    global _cache
+    from agent.schema import schema_version
+    version = schema_version()
+    if _cache is None or _cache.version != version:
+        _cache = SemanticSqlCache(cache_path, version)
+    return _cache
+
+
+def stats() -> dict:
+    """
+    Treffer des Caches seit dem Start (ohne den Cache und damit das Schema zu laden).
+    """
+    return _cache.stats() if _cache is not None else {"hits": 0, "misses": 0, "size": 0, "hit_rate": 0.0}
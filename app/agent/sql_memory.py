@@ -0,0 +1,201 @@
+# "SQL-Gedächtnis": BM25-Index über den Fragenkatalog mit Gold-SQL. Die ähnlichsten Gold-Beispiele werden
+# dem Prompt des Query Agents als Few-Shot-Beispiele mitgegeben.
+# Der Index wird offline gebaut (python -m agent.sql_memory build ../questions/questions.xlsx) und beim Start
+# per Memory-Mapping geladen. Neue verifizierte Paare werden inkrementell in delta.jsonl angehängt
+# (python -m agent.sql_memory add --question "..." --sql "...").
+import argparse
+import json
+import math
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+from agent.sql_cache import normalize
+
+memory_dir = os.getenv("SQL_MEMORY_DIR", os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "sql_memory")))
+memory_k = int(os.getenv("SQL_MEMORY_K", "3"))
+k1 = 1.5
+b = 0.75
+# Länge des Präfixes als einfacher Ersatz für Stemming (z.B. Verspätung/Verspätungen)
+prefix_length = 6
+
+
+def terms(text: str) -> list:
+    """
+    Zerlege einen Text in Terme: Wörter plus deren Präfix (einfaches Stemming).
+    """
+    words = normalize(text).split()
+    return words + [w[:prefix_length] for w in words if len(w) > prefix_length]
+
+
+def _save(directory: str, name: str, array: np.ndarray) -> None:
+    # Neue Datei schreiben und ersetzen, damit bereits gemappte Dateien nicht abgeschnitten werden
+    tmp = os.path.join(directory, f"{name}.tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, os.path.join(directory, f"{name}.npy"))
+
+
+def build(pairs: list, directory: str = memory_dir) -> None:
+    """
+    Baue den Index aus (Frage, SQL)-Paaren und schreibe ihn in das Verzeichnis (Postings als CSR in .npy-Dateien).
+    """
+    os.makedirs(directory, exist_ok=True)
+    docs = [(q.strip(), s.strip()) for q, s in pairs if isinstance(q, str) and isinstance(s, str) and q.strip() and s.strip()]
+    counts = [Counter(terms(q)) for q, _ in docs]
+    vocabulary = sorted({t for c in counts for t in c})
+    term_ids = {t: i for i, t in enumerate(vocabulary)}
+    postings = [[] for _ in vocabulary]
+    for doc_id, c in enumerate(counts):
+        for t, tf in c.items():
+            postings[term_ids[t]].append((doc_id, tf))
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(p) for p in postings])
+    _save(directory, "indptr", indptr)
+    _save(directory, "doc_ids", np.array([d for p in postings for d, _ in p], dtype=np.int32))
+    _save(directory, "tf", np.array([tf for p in postings for _, tf in p], dtype=np.float32))
+    _save(directory, "doc_len", np.array([sum(c.values()) for c in counts], dtype=np.float32))
+    with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    with open(os.path.join(directory, "docs.jsonl"), "w", encoding="utf-8") as f:
+        for question, sql in docs:
+            f.write(json.dumps({"question": question, "sql": sql}, ensure_ascii=False) + "\n")
+    # Das Delta ist jetzt Teil des Index
+    delta = os.path.join(directory, "delta.jsonl")
+    if os.path.exists(delta):
+        os.remove(delta)
+
+
+class SqlMemory:
+    """
+    BM25-Suche über Gold-Beispiele. Der gebaute Index wird per Memory-Mapping geladen, neue Paare liegen im Speicher
+    und in delta.jsonl, bis der Index neu gebaut wird (rebuild).
+    """
+
+    def __init__(self, directory: str = memory_dir):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.docs = []
+        self._term_ids = {}
+        self._indptr = self._doc_ids = self._tf = np.zeros(0)
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        if os.path.exists(os.path.join(directory, "indptr.npy")):
+            self._indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+            self._doc_ids = np.load(os.path.join(directory, "doc_ids.npy"), mmap_mode="r")
+            self._tf = np.load(os.path.join(directory, "tf.npy"), mmap_mode="r")
+            self._doc_len = np.load(os.path.join(directory, "doc_len.npy"), mmap_mode="r")
+            with open(os.path.join(directory, "vocabulary.json"), encoding="utf-8") as f:
+                self._term_ids = {t: i for i, t in enumerate(json.load(f))}
+            with open(os.path.join(directory, "docs.jsonl"), encoding="utf-8") as f:
+                self.docs = [json.loads(line) for line in f if line.strip()]
+        self._base = len(self.docs)
+        self._delta = []
+        delta = os.path.join(directory, "delta.jsonl")
+        if os.path.exists(delta):
+            with open(delta, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._append(json.loads(line))
+
+    def _append(self, doc: dict) -> None:
+        self.docs.append(doc)
+        self._delta.append(Counter(terms(doc["question"])))
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, question: str, sql: str) -> None:
+        """
+        Füge ein verifiziertes (Frage, SQL)-Paar hinzu (sofort durchsuchbar, persistiert in delta.jsonl).
+        """
+        doc = {"question": question.strip(), "sql": sql.strip()}
+        with self._lock:
+            if any(normalize(d["question"]) == normalize(question) for d in self.docs):
+                return
+            self._append(doc)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, "delta.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+    def rebuild(self) -> None:
+        """
+        Übernimm das Delta in den gebauten Index.
+        """
+        with self._lock:
+            build([(d["question"], d["sql"]) for d in self.docs], self.directory)
+        self.__init__(self.directory)
+
+    def search(self, question: str, k: int = memory_k, exclude: str = None) -> list:
+        """
+        Suche die k ähnlichsten Gold-Beispiele.
+        :param exclude: Frage, die nicht zurückgegeben werden soll (Leave-one-out für die Evaluierung).
+        :return: Liste von dicts mit question, sql und score.
+        """
+        n = len(self.docs)
+        if k <= 0 or n == 0:
+            return []
+        query = set(terms(question))
+        lengths = np.concatenate([np.asarray(self._doc_len), np.array([sum(c.values()) for c in self._delta], dtype=np.float32)])
+        norm = k1 * (1 - b + b * lengths / lengths.mean())
+        scores = np.zeros(n, dtype=np.float64)
+        for t in query:
+            docs, tfs = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            if t in self._term_ids:
+                start, end = self._indptr[self._term_ids[t]], self._indptr[self._term_ids[t] + 1]
+                docs, tfs = np.asarray(self._doc_ids[start:end], dtype=np.int64), np.asarray(self._tf[start:end])
+            delta = [(self._base + i, c[t]) for i, c in enumerate(self._delta) if t in c]
+            if delta:
+                docs = np.concatenate([docs, np.array([d for d, _ in delta], dtype=np.int64)])
+                tfs = np.concatenate([tfs, np.array([tf for _, tf in delta], dtype=np.float32)])
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (k1 + 1) / (tfs + norm[docs])
+        excluded = normalize(exclude) if exclude else None
+        results = []
+        for doc_id in np.argsort(-scores):
+            if scores[doc_id] <= 0 or len(results) >= k:
+                break
+            if excluded is not None and normalize(self.docs[doc_id]["question"]) == excluded:
+                continue
+            results.append({**self.docs[doc_id], "score": float(scores[doc_id])})
+        return results
+
+
+_memory = None
+
+
+def get_memory() -> SqlMemory:
+    global _memory
+    if _memory is None:
+        _memory = SqlMemory()
+    return _memory
+
+
+def few_shot(examples: list) -> str:
+    """
+    Formatiere Gold-Beispiele für den Prompt des Query Agents.
+    """
+    return "\n".join(f"    Question: {e['question']}\n    SQL: {' '.join(e['sql'].split())}" for e in examples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Baue den BM25-Index des SQL-Gedächtnisses aus dem Fragenkatalog.")
+    parser.add_argument("command", choices=["build", "add", "rebuild"])
+    parser.add_argument("workbook", nargs="?", default=os.path.join("..", "questions", "questions.xlsx"))
+    parser.add_argument("--directory", default=memory_dir)
+    parser.add_argument("--question")
+    parser.add_argument("--sql")
+    args = parser.parse_args()
+    if args.command == "build":
+        import pandas as pd
+        df = pd.read_excel(args.workbook, sheet_name="Questions")
+        build(list(zip(df["Frage"], df["GoldenSQL"])), args.directory)
+    elif args.command == "add":
+        if not args.question or not args.sql:
+            parser.error("add requires --question and --sql")
+        SqlMemory(args.directory).add(args.question, args.sql)
+    else:
+        SqlMemory(args.directory).rebuild()
+    print(f"SQL memory with {len(SqlMemory(args.directory))} examples in {args.directory}")
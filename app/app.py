@@ -2,15 +2,19 @@
 # https://langfuse.com/integrations/frameworks/langchain und 
 # https://langchain-ai.github.io/langgraph/concepts/memory/ erstellt.
 
+import asyncio
+import logging
 import chainlit as cl
 from typing import Dict, Optional
-from agent.agent import workflow
 from langchain.schema.runnable.config import RunnableConfig
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-import os
+from fastapi.responses import JSONResponse, PlainTextResponse
+from agent import cancellation, hedging, metrics, repair, result_cache, rollups, schema, schema_linking, sql_cache
 from helpers.chainlit_settings import settings_list
+from helpers import checkpointer, routes
+from helpers.streaming import MessageStream
 from langfuse.langchain import CallbackHandler
 
+logger = logging.getLogger(__name__)
 langfuse_handler = CallbackHandler()
 @cl.oauth_callback
 def oauth_callback(
@@ -33,6 +37,37 @@ def auth_callback(username: str, password: str):
         )
     else:
         return None
+@cl.on_app_startup
+async def on_app_startup():
+    # Pool zur Chainlit-Postgres öffnen und den Graph einmal pro Prozess kompilieren
+    await checkpointer.open_checkpointer()
+    # Schema-Snapshot und Werte-Index des Schema-Linkings vorab in einem Thread laden, damit die erste Frage den
+    # Katalog nicht im Event-Loop liest
+    try:
+        await schema.asnapshot()
+        await schema_linking.avalue_index()
+    except Exception as e:
+        # Ohne Datenbank beim Start wird der Snapshot bei der ersten Frage geladen
+        logger.warning("Could not load the schema snapshot at startup: %s", e)
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    await checkpointer.close_checkpointer()
+
+@routes.get("/healthz")
+async def healthz():
+    status = await checkpointer.health()
+    return JSONResponse(status, status_code=200 if status["status"] == "ok" else 503)
+
+@routes.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@routes.get("/metrics/summary")
+async def metrics_summary():
+    return JSONResponse({**metrics.summary(), "sql_repair": repair.stats(), "sql_cache": sql_cache.stats(),
+                         "result_cache": result_cache.stats(), "rollups": rollups.stats(), "hedging": hedging.stats()})
+
 @cl.on_settings_update
 async def update_state_by_settings(settings: cl.ChatSettings):
     state = cl.user_session.get("state")
@@ -46,31 +81,51 @@ async def on_chat_start():
         settings_list
     ).send()
     cl.user_session.set("state", {"question": "", "generation": "","config": settings})
-    cl.user_session.set("runnable", workflow())
     
     
+@cl.on_chat_end
+async def on_chat_end():
+    # Tab geschlossen oder Verbindung getrennt: laufende Abfragen der Session abbrechen
+    await cancellation.registry.cancel_session(cl.context.session.id, "disconnect")
+
+@cl.on_stop
+async def on_stop():
+    await cancellation.registry.cancel_session(cl.context.session.id, "stopped")
+
 @cl.on_message
 async def on_message(message: cl.Message):
-    runnable = cl.user_session.get("runnable")
+    # Eine neue Nachricht ersetzt die vorherige Frage der Session, deren Abfragen werden abgebrochen
+    session_id = cl.context.session.id
+    await cancellation.registry.cancel_session(session_id, "superseded")
+    cancellation.registry.begin(session_id, message.id, asyncio.current_task())
+    try:
+        await answer(message)
+    finally:
+        cancellation.registry.end(session_id, message.id)
+
+async def answer(message: cl.Message):
+    graph = await checkpointer.get_graph()
     msg = cl.Message(content="")
-    async with AsyncPostgresSaver.from_conn_string(os.environ.get("DATABASE_URL")) as checkpointer:
-        graph = runnable.compile(checkpointer=checkpointer)
-        config = {"configurable": {"thread_id": cl.context.session.thread_id}, "metadata": {
-            "langfuse_user_id": cl.context.session.user.identifier,
-            "langfuse_session_id": cl.context.session.thread_id,
-        }}
-        config = {**config, **cl.user_session.get("state")["config"]}
-        cb = cl.LangchainCallbackHandler(
-                to_ignore=["ChannelRead", "RunnableLambda", "ChannelWrite", "__start__", "_execute", "call_model"])
-        async for chunk in graph.astream_events({"question": message.content, "config": config}, config=RunnableConfig(callbacks=[cb, langfuse_handler], **config),
-                                         stream_mode="chunk", version="v2"):               
-            try:
-                if chunk["metadata"]["langgraph_node"] == "interpretation_agent" and chunk["event"] == "on_chat_model_stream":
-                    
-                    await msg.stream_token(chunk["data"]["chunk"].content)
-            except:
-                pass
-        await msg.send()
+    config = {"configurable": {"thread_id": cl.context.session.thread_id, "session_id": cl.context.session.id, "message_id": message.id,
+                                 "user_id": cl.context.session.user.identifier}, "metadata": {
+        "langfuse_user_id": cl.context.session.user.identifier,
+        "langfuse_session_id": cl.context.session.thread_id,
+    }}
+    config = {**config, **cl.user_session.get("state")["config"]}
+    cb = cl.LangchainCallbackHandler(
+            to_ignore=["ChannelRead", "RunnableLambda", "ChannelWrite", "__start__", "_execute", "call_model"])
+    # Alle Stufen progressiv anzeigen (Supervisor, SQL, Ausführung, Vorschau, Antwort) und Zeiten messen
+    stream = MessageStream(msg, message.content)
+    async for chunk in graph.astream_events({"question": message.content, "config": config}, config=RunnableConfig(callbacks=[cb, langfuse_handler], **config),
+                                     stream_mode="chunk", version="v2"):               
+        await stream.handle(chunk)
+    if not msg.content:
+        # Keine gestreamten Tokens (z.B. Modell ohne Streaming): die Antwort aus dem Zustand des Threads
+        values = (await graph.aget_state(config)).values
+        if values.get("answered_question") == message.content:
+            msg.content = values.get("answer") or ""
+    await msg.send()
+    stream.report()
     
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 # Diese Datei wurde mit der Dokumentation von https://docs.chainlit.io/api-reference/input-widgets/select#attributes erstellt.
-from chainlit.input_widget import Select
+from chainlit.input_widget import Select, Switch
 
 settings_list = [
     Select(
@@ -13,6 +13,12 @@ settings_list = [
         initial_value="mistral",
         description="Wähle das Modell, das der Query Agent verwenden soll."
     ),
+    Switch(
+        id="query_hedge",
+        label="Hedging für den Query Agent",
+        initial=False,
+        description="Sende die Frage gleichzeitig an alle Modelle und verwende die erste ausführbare Abfrage mit Ergebnis."
+    ),
     Select(
         id="model_interpret",
         label="Model für den Interpretation Agent",
@@ -0,0 +1,92 @@
+# Diese Datei wurde mit der Dokumentation von https://www.psycopg.org/psycopg3/docs/advanced/pool.html und
+# https://langchain-ai.github.io/langgraph/how-tos/persistence_postgres/ erstellt.
+# Prozessweiter Checkpointer für die Chainlit-App: Ein Verbindungspool zur Chainlit-Postgres wird beim Start der
+# App geöffnet und der Graph einmal mit dem AsyncPostgresSaver kompiliert. Pro Nachricht fallen damit weder ein
+# Verbindungsaufbau noch ein compile() an.
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from agent.agent import workflow
+
+logger = logging.getLogger(__name__)
+
+pool_min_size = int(os.getenv("CHECKPOINT_POOL_MIN_SIZE", "2"))
+pool_max_size = int(os.getenv("CHECKPOINT_POOL_MAX_SIZE", "10"))
+# Maximale Wartezeit in Sekunden auf eine freie Verbindung bzw. auf den Pool beim Start
+pool_timeout = float(os.getenv("CHECKPOINT_POOL_TIMEOUT", "30"))
+# Verbindungen werden nach max_idle Sekunden ohne Nutzung geschlossen (bis auf min_size)
+pool_max_idle = float(os.getenv("CHECKPOINT_POOL_MAX_IDLE", "600"))
+
+_pool: Optional[AsyncConnectionPool] = None
+_graph = None
+_lock = asyncio.Lock()
+
+
+async def open_checkpointer(conninfo: Optional[str] = None):
+    """
+    Öffne den Pool, lege die Tabellen des Checkpointers an (falls nötig) und kompiliere den Graph.
+    Mehrfache Aufrufe geben den bereits kompilierten Graph zurück.
+    :param conninfo: Verbindung zur Chainlit-Postgres, standardmäßig DATABASE_URL.
+    :return: Der kompilierte Graph.
+    """
+    global _pool, _graph
+    if _graph is not None:
+        return _graph
+    async with _lock:
+        if _graph is None:
+            # Gleiche Verbindungsparameter wie AsyncPostgresSaver.from_conn_string, zusätzlich Prüfung beim Ausleihen
+            pool = AsyncConnectionPool(
+                conninfo or os.environ.get("DATABASE_URL"),
+                min_size=pool_min_size,
+                max_size=pool_max_size,
+                timeout=pool_timeout,
+                max_idle=pool_max_idle,
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+                check=AsyncConnectionPool.check_connection,
+                name="checkpointer",
+                open=False,
+            )
+            await pool.open(wait=True, timeout=pool_timeout)
+            checkpointer = AsyncPostgresSaver(pool)
+            await checkpointer.setup()
+            _pool, _graph = pool, workflow().compile(checkpointer=checkpointer)
+            logger.info("Checkpointer pool opened (min_size=%d, max_size=%d)", pool_min_size, pool_max_size)
+    return _graph
+
+
+async def get_graph():
+    """
+    Gebe den kompilierten Graph zurück (und öffne den Pool, falls der Start der App das nicht getan hat).
+    """
+    return _graph if _graph is not None else await open_checkpointer()
+
+
+async def health() -> dict:
+    """
+    Prüfe den Pool mit einem SELECT 1.
+    :return: Status, Dauer des Round Trips und Kennzahlen des Pools.
+    """
+    if _pool is None:
+        return {"status": "closed"}
+    start = time.perf_counter()
+    try:
+        async with _pool.connection(timeout=5) as conn:
+            await conn.execute("SELECT 1")
+    except Exception as e:
+        return {"status": "error", "error": str(e), "pool": _pool.get_stats()}
+    return {"status": "ok", "seconds": time.perf_counter() - start, "pool": _pool.get_stats()}
+
+
+async def close_checkpointer() -> None:
+    global _pool, _graph
+    async with _lock:
+        if _pool is not None:
+            await _pool.close()
+        _pool, _graph = None, None
@@ -0,0 +1,44 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.chainlit.io/integrations/fastapi und
+# https://fastapi.tiangolo.com/reference/apirouter/ erstellt.
+# Eigene Endpunkte auf der FastAPI-App von Chainlit. Chainlit registriert eine Catch-all-Route für die UI
+# (GET /{full_path:path}), deshalb werden eigene Routen vor diese verschoben. Die Endpunkte sind geschützt: Zugriff
+# mit METRICS_TOKEN als Bearer-Token (Prometheus, Health-Checks) oder als in Chainlit angemeldeter Nutzer.
+import hmac
+import os
+from typing import Callable, Optional
+
+from chainlit.auth import get_current_user, reuseable_oauth
+from chainlit.server import app
+from fastapi import Depends, Request
+
+metrics_token = os.getenv("METRICS_TOKEN")
+
+
+async def require_access(request: Request) -> None:
+    """
+    Prüfe den Zugriff auf einen geschützten Endpunkt, wirft HTTPException (401) ohne gültiges Token bzw. Anmeldung.
+    """
+    authorization: Optional[str] = request.headers.get("Authorization")
+    if metrics_token and authorization and hmac.compare_digest(authorization.encode(), f"Bearer {metrics_token}".encode()):
+        return
+    # Sonst wie die Endpunkte von Chainlit: JWT aus dem Cookie bzw. dem Authorization-Header
+    await get_current_user(await reuseable_oauth(request))
+
+
+def get(path: str, protected: bool = True, **kwargs) -> Callable:
+    """
+    Dekorator wie app.get, die Route wird aber vor der Catch-all-Route von Chainlit eingefügt.
+    :param path: Der Pfad des Endpunkts, z.B. /healthz.
+    :param protected: Zugriff nur mit METRICS_TOKEN oder Anmeldung (require_access).
+    """
+    if protected:
+        kwargs["dependencies"] = [*kwargs.get("dependencies", []), Depends(require_access)]
+
+    def decorator(endpoint: Callable) -> Callable:
+        app.get(path, **kwargs)(endpoint)
+        route = app.router.routes.pop()
+        catch_all = next((i for i, r in enumerate(app.router.routes) if getattr(r, "path", None) == "/{full_path:path}"),
+                         len(app.router.routes))
+        app.router.routes.insert(catch_all, route)
+        return endpoint
+    return decorator
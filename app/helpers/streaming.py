@@ -0,0 +1,186 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.chainlit.io/concepts/step und
+# https://langchain-ai.github.io/langgraph/how-tos/streaming/ erstellt.
+# Progressives Streaming einer Nachricht: Entscheidungen des Supervisors, das SQL während der Generierung, Start und
+# Fortschritt der Ausführung, Anzahl der Zeilen und eine Vorschau werden als Steps angezeigt, die Antwort des
+# Interpretation Agents wie bisher als Tokens. Pro Nachricht werden die Zeit bis zur ersten sichtbaren Ausgabe
+# (TTFB) und die Dauer der einzelnen Stufen geloggt und optional als JSON Lines gespeichert.
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import chainlit as cl
+
+logger = logging.getLogger(__name__)
+
+timings_path = os.getenv("STREAM_TIMINGS_PATH", os.path.join(".cache", "message_timings.jsonl"))
+# Minimaler Abstand zwischen zwei Aktualisierungen des Fortschritts der Ausführung in Sekunden
+progress_interval = float(os.getenv("STREAM_PROGRESS_INTERVAL", "0.25"))
+nodes = ("supervisor", "query_agent", "interpretation_agent")
+# Anzeige im Step der Ausführung, wenn der Query Agent die Frage ohne Interpretation beendet
+stopped = {"cancelled": "Abgebrochen", "budget": "Zeitbudget überschritten", "failed": "Zu viele Fehler",
+           "busy": "Nicht ausgeführt: die Datenbank ist ausgelastet"}
+
+
+def markdown_table(columns: list, rows: list) -> str:
+    def cell(value) -> str:
+        return "" if value is None else str(value).replace("|", "\\|").replace("\n", " ")
+    lines = ["| " + " | ".join(cell(c) for c in columns) + " |", "|" + "---|" * len(columns)]
+    lines += ["| " + " | ".join(cell(v) for v in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+class MessageStream:
+    """
+    Verarbeitet die Events von astream_events (version v2) für eine Nachricht und zeigt sie in Chainlit an.
+    :param msg: Die Nachricht, in die die Antwort des Interpretation Agents gestreamt wird.
+    :param question: Die Frage (nur für das Protokoll der Zeiten).
+    """
+
+    def __init__(self, msg: cl.Message, question: str = ""):
+        self.msg = msg
+        self.question = question
+        self.start = time.perf_counter()
+        self.ttfb: Optional[float] = None
+        self.first_answer_token: Optional[float] = None
+        self.stages = {}
+        self.visits = {}
+        self._runs = {}
+        self._marks = {}
+        self._sql_step: Optional[cl.Step] = None
+        self._execute_step: Optional[cl.Step] = None
+        self._last_progress = 0.0
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.start
+
+    def _add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def _visible(self) -> None:
+        if self.ttfb is None:
+            self.ttfb = self._now()
+
+    async def _step(self, name: str, type: str, output: str = "", language: Optional[str] = None) -> cl.Step:
+        step = cl.Step(name=name, type=type, language=language, show_input=False)
+        step.output = output
+        await step.send()
+        self._visible()
+        return step
+
+    async def handle(self, event: dict) -> None:
+        """
+        Verarbeite ein einzelnes Event. Fehler in der Anzeige brechen den Lauf des Graphen nicht ab.
+        """
+        try:
+            await self._handle(event)
+        except Exception as e:
+            logger.debug("Could not stream event %s: %s", event.get("event"), e)
+
+    async def _handle(self, event: dict) -> None:
+        kind = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if kind in ("on_chain_start", "on_chain_end") and event.get("name") in nodes and node == event.get("name"):
+            if kind == "on_chain_start":
+                self._runs[event["run_id"]] = self._now()
+                self.visits[node] = self.visits.get(node, 0) + 1
+                if node == "query_agent":
+                    self._marks["query_agent"] = self._now()
+            elif event["run_id"] in self._runs:
+                self._add(node, self._now() - self._runs.pop(event["run_id"]))
+        elif kind == "on_chat_model_stream":
+            token = event["data"]["chunk"].content
+            if not token:
+                return
+            if node == "interpretation_agent":
+                if self.first_answer_token is None:
+                    self.first_answer_token = self._now()
+                self._visible()
+                await self.msg.stream_token(token)
+            elif node == "query_agent" and "hedge" not in event.get("tags", []):
+                if self._sql_step is None:
+                    self._sql_step = await self._step("SQL", "llm", language="sql")
+                await self._sql_step.stream_token(token)
+        elif kind == "on_custom_event":
+            await self._custom(event["name"], event["data"])
+
+    async def _custom(self, name: str, data: dict) -> None:
+        if name == "route":
+            source = "LLM" if data["llm"] else "Regel"
+            await self._step("Supervisor", "run", f"→ {data['next_agent']} ({source})")
+        elif name == "sql":
+            # Jeder Versuch zählt ab dem Start des Knotens bzw. dem Ende des vorherigen Versuchs (Reparaturen, Wiederholungen)
+            now = self._now()
+            self._add("sql_generation", now - self._marks.pop("query_agent", now))
+            step = self._sql_step or await self._step("SQL", "llm", language="sql")
+            step.name = f"SQL (Versuch {data['attempt']}, {data['source']})"
+            step.output = data["query"]
+            await step.update()
+            self._sql_step = None
+            self._execute_step = await self._step("Ausführung", "tool", "Abfrage läuft …")
+        elif name == "execute_start":
+            self._marks.setdefault("execution", self._now())
+        elif name == "execute_queued" and self._execute_step is not None:
+            self._execute_step.output = f"Wartet auf die Datenbank … Position {data['position']} ({data['cost_class']}, {data['running']} Abfragen laufen)"
+            await self._execute_step.update()
+        elif name == "execute_end":
+            # Beim Hedging laufen mehrere Kandidaten parallel, ihre Ausführungszeiten werden summiert
+            self._marks.pop("execution", None)
+            self._add("execution", data["seconds"])
+        elif name == "execute_progress" and self._execute_step is not None:
+            if self._now() - self._last_progress >= progress_interval:
+                self._last_progress = self._now()
+                self._execute_step.output = f"Abfrage läuft … {data['rows']} Zeilen gelesen"
+                await self._execute_step.update()
+        elif name == "answer":
+            # Antwort ohne Interpretation Agent (Abbruch, Zeitbudget, zu viele Fehler) direkt in die Nachricht
+            if self._execute_step is not None:
+                self._execute_step.output = stopped.get(data["outcome"], data["outcome"])
+                await self._execute_step.update()
+                self._execute_step = None
+            if self.first_answer_token is None:
+                self._visible()
+                await self.msg.stream_token(data["answer"])
+        elif name in ("result", "error"):
+            # Abgebrochene Ausführung (Fehler ohne execute_end), Treffer im Ergebnis-Cache zählen nicht
+            if "execution" in self._marks:
+                self._add("execution", self._now() - self._marks.pop("execution"))
+            step = self._execute_step or await self._step("Ausführung", "tool")
+            if name == "result":
+                truncated = " (abgeschnitten)" if data["truncated"] else ""
+                output = f"{data['rows']} Zeilen{truncated}"
+                if data["preview"]:
+                    output += "\n\n" + markdown_table(data["columns"], data["preview"])
+            else:
+                output = f"Fehler: {data['error']}"
+            step.output = output
+            await step.update()
+            self._execute_step = None
+            self._marks["query_agent"] = self._now()
+
+    def report(self) -> dict:
+        """
+        Logge die Zeiten der Nachricht und hänge sie an STREAM_TIMINGS_PATH an.
+        """
+        timings = {
+            "time": time.time(),
+            "question": self.question,
+            "total": self._now(),
+            "ttfb": self.ttfb,
+            "first_answer_token": self.first_answer_token,
+            "stages": self.stages,
+            "visits": self.visits,
+        }
+        logger.info("Message timings: ttfb=%s first_answer_token=%s total=%.2fs stages=%s",
+                    f"{self.ttfb:.2f}s" if self.ttfb is not None else None,
+                    f"{self.first_answer_token:.2f}s" if self.first_answer_token is not None else None,
+                    timings["total"], {k: round(v, 3) for k, v in self.stages.items()})
+        if timings_path:
+            try:
+                os.makedirs(os.path.dirname(timings_path) or ".", exist_ok=True)
+                with open(timings_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(timings, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning("Could not write message timings %s: %s", timings_path, e)
+        return timings
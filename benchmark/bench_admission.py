@@ -0,0 +1,109 @@
+# Benchmark: Zulassungskontrolle (agent.admission) gegen die Benchmark-Datenbank. Einige Nutzer schicken parallel
+# teure Aggregationen (mehrere Tabs bzw. Wiederholungen), die übrigen Nutzer stellen nacheinander günstige und mittlere
+# Abfragen mit Denkpause. Gemessen werden pro Modus (ohne und mit Zulassungskontrolle) die Latenz pro Kostenklasse
+# (p50/p95, inkl. Wartezeit), die Anzahl der Abfragen, abgelehnte Abfragen, die maximale Länge der Warteschlange und
+# die maximale Anzahl gleichzeitig aktiver Statements in pg_stat_activity.
+# Die Grenzen der Kostenklassen sind auf die kleine Benchmark-Datenbank abgestimmt (--cheap-cost, --expensive-cost).
+# Ausführen aus dem Ordner benchmark/: python bench_admission.py --seconds 20 --heavy-users 2 --light-users 4
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.append('../app')
+from agent import admission, metrics
+from agent.executor import execute_query
+from agent.schema import async_engine
+from langchain_core.runnables.config import var_child_runnable_config
+
+queries = {
+    "cheap": "SELECT station FROM oebb.station WHERE stationid = {n}",
+    "medium": "SELECT stationid, avg(arrivalmintues) AS delay FROM oebb.arrivals WHERE stationid % 7 = {n} % 7 GROUP BY stationid ORDER BY delay DESC LIMIT 10",
+    "expensive": "SELECT a.stationid, count(*) AS n, avg(a.arrivalmintues + g) AS d FROM oebb.arrivals a, generate_series(1, 20 + {n} % 3) g GROUP BY a.stationid",
+}
+active_sql = "SELECT count(*) FROM pg_stat_activity WHERE application_name LIKE 'query_writer:%' AND state = 'active'"
+
+
+def quantile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else float("nan")
+
+
+async def run_user(user: str, kinds: list, stop: float, latencies: dict, rejected: dict, think: float) -> None:
+    var_child_runnable_config.set({"configurable": {"user_id": user}})
+    rng = random.Random(user)
+    while time.monotonic() < stop:
+        kind = rng.choice(kinds)
+        start = time.perf_counter()
+        try:
+            await execute_query(queries[kind].format(n=rng.randint(1, 300)), timeout=60000, plan_gate=False, rollup_rewrite=False)
+            latencies[kind].append(time.perf_counter() - start)
+        except admission.Rejected:
+            rejected[kind] = rejected.get(kind, 0) + 1
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+
+async def sample(stop: float, peaks: dict) -> None:
+    async with async_engine.connect() as conn:
+        while time.monotonic() < stop:
+            peaks["active"] = max(peaks["active"], (await conn.execute(text(active_sql))).scalar())
+            # pg_stat_activity ist pro Transaktion ein Snapshot
+            await conn.commit()
+            peaks["queue"] = max(peaks["queue"], sum(admission.scheduler.state()["waiting"].values()))
+            await asyncio.sleep(0.05)
+
+
+async def run_mode(mode: str, args) -> dict:
+    admission.enabled = mode == "on"
+    admission.scheduler = admission.Scheduler(args.max_concurrent, args.max_per_user, args.max_expensive, args.max_queue, args.aging)
+    latencies = {kind: [] for kind in queries}
+    rejected, peaks = {}, {"active": 0, "queue": 0}
+    stop = time.monotonic() + args.seconds
+    tasks = [sample(stop, peaks)]
+    for u in range(args.heavy_users):
+        # Jeder schwere Nutzer mit mehreren parallelen Abfragen
+        tasks += [run_user(f"heavy{u}", ["expensive"], stop, latencies, rejected, 0) for _ in range(args.heavy_parallel)]
+    for u in range(args.light_users):
+        tasks.append(run_user(f"light{u}", ["cheap", "cheap", "medium"], stop, latencies, rejected, args.think))
+    await asyncio.gather(*tasks)
+    return {"mode": mode, "latencies": latencies, "rejected": rejected, "peaks": peaks}
+
+
+async def main(args) -> None:
+    admission.cheap_cost = args.cheap_cost
+    admission.expensive_cost = args.expensive_cost
+    results = []
+    for mode in args.modes.split(","):
+        results.append(await run_mode(mode, args))
+    print(f"{'mode':<5} {'class':<10} {'count':>6} {'p50':>9} {'p95':>9} {'rejected':>9}")
+    for r in results:
+        for kind, values in r["latencies"].items():
+            print(f"{r['mode']:<5} {kind:<10} {len(values):>6} {quantile(values, 0.5) * 1000:>7.1f}ms {quantile(values, 0.95) * 1000:>7.1f}ms "
+                  f"{r['rejected'].get(kind, 0):>9}")
+        print(f"{r['mode']:<5} peak active statements {r['peaks']['active']}, peak queue depth {r['peaks']['queue']}")
+    print(f"\nAdmission: {metrics.admission_outcomes.summary()}")
+    for name, s in metrics.admission_wait_seconds.summary().items():
+        print(f"  wait {name:<10} count={s['count']:<5} p50={s['p50'] * 1000:.1f}ms p95={s['p95'] * 1000:.1f}ms")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latenz pro Kostenklasse mit und ohne Zulassungskontrolle.")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--modes", default="off,on")
+    parser.add_argument("--heavy-users", type=int, default=2)
+    parser.add_argument("--heavy-parallel", type=int, default=4, help="Parallele Abfragen pro schwerem Nutzer")
+    parser.add_argument("--light-users", type=int, default=4)
+    parser.add_argument("--think", type=float, default=0.2, help="Mittlere Denkpause der leichten Nutzer in Sekunden")
+    parser.add_argument("--max-concurrent", type=int, default=admission.max_concurrent)
+    parser.add_argument("--max-per-user", type=int, default=admission.max_per_user)
+    parser.add_argument("--max-expensive", type=int, default=admission.max_expensive)
+    parser.add_argument("--max-queue", type=int, default=admission.max_queue)
+    parser.add_argument("--aging", type=float, default=admission.aging)
+    parser.add_argument("--cheap-cost", type=float, default=1e3)
+    parser.add_argument("--expensive-cost", type=float, default=5e4)
+    asyncio.run(main(parser.parse_args()))
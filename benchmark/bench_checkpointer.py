@@ -0,0 +1,80 @@
+# Benchmark: Overhead pro Nachricht in der Chainlit-App, bevor der Graph läuft. Alt: neue Verbindung über
+# AsyncPostgresSaver.from_conn_string und compile() pro Nachricht. Neu: geteilter Pool und einmal kompilierter Graph
+# (helpers.checkpointer). Gemessen wird Setup plus das Lesen des Checkpoints des Threads (aget_state), dazu die Anzahl
+# neuer Verbindungen auf der Chainlit-Postgres (pg_stat_database.sessions, ab Postgres 14).
+# Ausführen aus dem Ordner benchmark/: python bench_checkpointer.py --messages 200 --concurrency 4
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+from dotenv import load_dotenv
+
+sys.path.append('../app')
+
+
+async def old_message(thread_id: str) -> None:
+    from agent.agent import workflow
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    runnable = workflow()
+    async with AsyncPostgresSaver.from_conn_string(os.environ["DATABASE_URL"]) as checkpointer:
+        graph = runnable.compile(checkpointer=checkpointer)
+        await graph.aget_state({"configurable": {"thread_id": thread_id}})
+
+
+async def new_message(thread_id: str) -> None:
+    from helpers import checkpointer
+    graph = await checkpointer.get_graph()
+    await graph.aget_state({"configurable": {"thread_id": thread_id}})
+
+
+async def sessions() -> int:
+    async with await psycopg.AsyncConnection.connect(os.environ["DATABASE_URL"]) as conn:
+        cur = await conn.execute("SELECT sessions FROM pg_stat_database WHERE datname = current_database()")
+        return (await cur.fetchone())[0]
+
+
+async def run(name: str, message, messages: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await message(f"bench-checkpointer-{i % 10}")
+            durations.append((time.perf_counter() - start) * 1000)
+
+    await message("bench-checkpointer-warmup")
+    before = await sessions()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - start
+    # Die Verbindung für die Abfrage von sessions selbst wird abgezogen
+    opened = await sessions() - before - 1
+    durations.sort()
+    p95 = durations[max(0, int(len(durations) * 0.95) - 1)]
+    print(f"{name:<5} mean={statistics.mean(durations):7.2f}ms  median={statistics.median(durations):7.2f}ms  "
+          f"p95={p95:7.2f}ms  messages/s={messages / elapsed:7.1f}  new connections={opened}")
+
+
+async def main(messages: int, concurrency: int) -> None:
+    from helpers import checkpointer
+    start = time.perf_counter()
+    await checkpointer.open_checkpointer()
+    print(f"Startup (pool + setup + compile): {(time.perf_counter() - start) * 1000:.1f}ms")
+    await run("alt", old_message, messages, concurrency)
+    await run("neu", new_message, messages, concurrency)
+    print(await checkpointer.health())
+    await checkpointer.close_checkpointer()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead pro Nachricht mit und ohne geteilten Checkpointer-Pool.")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    load_dotenv('../app/.env')
+    asyncio.run(main(args.messages, args.concurrency))
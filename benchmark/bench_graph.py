@@ -0,0 +1,165 @@
+# Benchmark: kompletter Graph (Supervisor, Query Agent, Interpretation Agent) ohne Cloud-LLM. Die Modelle sind das
+# geskriptete Modell "scripted" (agent.scripted) mit den SQL-Versuchen aus scenarios.json, die Datenbank ist eine
+# lokale TimescaleDB (oder Postgres) mit synthetischen Daten aus generate_oebb.py. Gemessen werden Durchsatz,
+# Latenz-Perzentile pro Szenario, die Zeit pro Knoten (agent.metrics) und in einem zweiten, sequentiellen Durchlauf
+# der Spitzenwert des Python-Speichers pro Lauf (tracemalloc) sowie der maximale RSS des Prozesses. Das Szenario
+# "join" prüft, dass doppelte Spaltennamen eines SELECT * über einen Join ein konsistentes Ergebnis ergeben.
+# Ausführen aus dem Ordner benchmark/ (TIMESCALE_DB_URL zeigt auf die Benchmark-Datenbank):
+#   python generate_oebb.py --rows 1000000 --drop
+#   python bench_graph.py --runs 20 --concurrency 4 --output .cache/bench_graph.csv
+import argparse
+import asyncio
+import csv
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append('../app')
+from agent import llm, metrics
+from agent.agent import workflow
+from agent.result import is_columnar, row_count
+from agent.scripted import from_script
+
+
+def percentile(values: list, q: float):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))]
+
+
+async def run_once(graph, name: str, question: str, config: dict) -> dict:
+    start = time.perf_counter()
+    try:
+        state = await graph.ainvoke({"question": question, "config": config},
+                                    config={"recursion_limit": 50, "configurable": {"thread_id": f"bench-{name}"}})
+        error = None
+    except Exception as e:
+        state, error = {}, f"{type(e).__name__}: {e}"
+    data = state.get("data")
+    # Doppelte Spaltennamen (SELECT * über einen Join) müssen eindeutige, gleich lange Spalten ergeben
+    if error is None and is_columnar(data) and (len(set(data["columns"])) != len(data["columns"])
+                                               or any(len(values) != data["rows"] for values in data["values"])):
+        error = f"Inconsistent result columns: {data['columns']}"
+    return {
+        "scenario": name,
+        "seconds": time.perf_counter() - start,
+        "error": error,
+        "attempts": (state.get("error_count") or 0) + 1 if state else None,
+        "rows": row_count(data) if data else 0,
+        "truncated": bool(data.get("truncated")) if isinstance(data, dict) else False,
+        "answered": bool(state.get("answer")),
+    }
+
+
+async def throughput_pass(graph, scenarios: dict, config: dict, runs: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(name: str, question: str) -> dict:
+        async with semaphore:
+            return await run_once(graph, name, question, config)
+
+    jobs = [(name, s["question"]) for _ in range(runs) for name, s in scenarios.items()]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(name, question) for name, question in jobs))
+    return results, time.perf_counter() - start
+
+
+async def memory_pass(graph, scenarios: dict, config: dict, runs: int) -> dict:
+    """
+    Sequentiell, damit sich die Spitzenwerte der Läufe nicht überlagern.
+    :return: Pro Szenario die Liste der Spitzenwerte in Bytes.
+    """
+    peaks = {name: [] for name in scenarios}
+    tracemalloc.start()
+    try:
+        for _ in range(runs):
+            for name, s in scenarios.items():
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                await run_once(graph, name, s["question"], config)
+                peaks[name].append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def report(results: list, wall: float, peaks: dict) -> list:
+    rows = []
+    print(f"{'scenario':<12}{'runs':>6}{'errors':>8}{'attempts':>10}{'rows':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'mean s':>9}{'peak MiB':>10}")
+    for name in dict.fromkeys(r["scenario"] for r in results):
+        group = [r for r in results if r["scenario"] == name]
+        seconds = [r["seconds"] for r in group]
+        peak = max(peaks.get(name) or [0]) / 2 ** 20
+        row = {
+            "scenario": name,
+            "runs": len(group),
+            "errors": sum(1 for r in group if r["error"]),
+            "attempts": statistics.mean(r["attempts"] or 0 for r in group),
+            "rows": max(r["rows"] for r in group),
+            "truncated": any(r["truncated"] for r in group),
+            "p50": percentile(seconds, 0.5),
+            "p95": percentile(seconds, 0.95),
+            "p99": percentile(seconds, 0.99),
+            "mean": statistics.mean(seconds),
+            "peak_mib": peak,
+        }
+        rows.append(row)
+        print(f"{name:<12}{row['runs']:>6}{row['errors']:>8}{row['attempts']:>10.2f}{row['rows']:>10}{row['p50']:>9.3f}"
+              f"{row['p95']:>9.3f}{row['p99']:>9.3f}{row['mean']:>9.3f}{peak:>10.1f}")
+    print(f"\nThroughput: {len(results) / wall:.2f} runs/s ({len(results)} runs in {wall:.1f}s)")
+    print(f"Max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    for error in dict.fromkeys(r["error"] for r in results if r["error"]):
+        print(f"Error: {error}")
+    print("\nTime per node:")
+    for node, s in metrics.node_seconds.summary().items():
+        print(f"  {node:<22} count={s['count']:<6} p50={s['p50']:.3f}s p95={s['p95']:.3f}s max={s['max']:.3f}s")
+    return rows
+
+
+async def main(path: str, selected: list, runs: int, concurrency: int, warmup: int, memory_runs: int,
+               latency_scale: float, output: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        script = json.load(f)
+    scenarios = {n: s for n, s in script["scenarios"].items() if not selected or n in selected}
+    latency = {role: seconds * latency_scale for role, seconds in script.get("latency", {}).items()}
+    llm.register_provider("scripted", lambda: from_script(path).model_copy(update={"latency": latency}))
+    # Ohne Caches und Few-Shot-Beispiele, damit jeder Lauf die Datenbank und alle Knoten durchläuft. Ohne Kostenprüfung,
+    # sonst würden die Szenarien "large" (SELECT über departures) und "timeseries" (ohne Zeitfilter) abgelehnt
+    config = {"model_query": "scripted", "model_interpret": "scripted", "cache": False, "sql_memory_k": 0, "query_hedge": False,
+              "plan_gate": False}
+    graph = workflow().compile()
+
+    for _ in range(warmup):
+        for name, s in scenarios.items():
+            await run_once(graph, name, s["question"], config)
+    metrics.reset()
+    results, wall = await throughput_pass(graph, scenarios, config, runs, concurrency)
+    peaks = await memory_pass(graph, scenarios, config, memory_runs) if memory_runs else {}
+    rows = report(results, wall, peaks)
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline-Benchmark des Graphen mit geskriptetem Modell und synthetischen Daten.")
+    parser.add_argument("--scenarios", default="scenarios.json")
+    parser.add_argument("--only", default="", help="Kommagetrennte Auswahl an Szenarien")
+    parser.add_argument("--runs", type=int, default=10, help="Läufe pro Szenario im Durchsatz-Durchlauf")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--memory-runs", type=int, default=3, help="Sequentielle Läufe pro Szenario mit tracemalloc (0 = aus)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Faktor für die Latenzen des Modells (0 = keine)")
+    parser.add_argument("--output", default="", help="CSV mit den Ergebnissen pro Szenario")
+    args = parser.parse_args()
+    asyncio.run(main(args.scenarios, [s for s in args.only.split(",") if s], args.runs, args.concurrency, args.warmup,
+                     args.memory_runs, args.latency_scale, args.output))
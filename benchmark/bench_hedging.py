@@ -0,0 +1,123 @@
+# Benchmark: Latenz bis zur ersten ausführbaren Abfrage mit Ergebnis, einmal seriell mit dem primären Provider
+# (bis zu 4 Versuche wie im Query Agent) und einmal mit Hedging über alle Provider (agent.hedging).
+# Die Provider sind lokale Fake-Provider mit eigener Latenz, Streuung und Fehlerrate. Ohne --execute wird die
+# Ausführung simuliert, mit --execute laufen die Abfragen (SELECT 1 ...) über execute_query gegen die Datenbank.
+# Ausführen aus dem Ordner benchmark/: python bench_hedging.py --questions 50 --providers fast:0.3:0.4,steady:0.8:0.05
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+sys.path.append('../app')
+from agent import hedging, llm
+from fake_provider import FakeProvider
+
+ok_sql = "SELECT 1 AS ok"
+error_sql = "SELECT ok FROM oebb.missing_table"
+empty_sql = "SELECT 1 AS ok WHERE false"
+max_attempts = 4
+
+
+def responder(name: str, latency: float, error_rate: float, jitter: float, seed: int):
+    """
+    Antwortfunktion eines Fake-Providers: zusätzliche exponentiell verteilte Latenz, mit error_rate eine fehlerhafte
+    und mit error_rate / 4 eine leere Abfrage.
+    """
+    rng = random.Random(f"{seed}-{name}")
+
+    def respond(prompt: str) -> str:
+        if jitter:
+            time.sleep(rng.expovariate(1 / (latency * jitter)))
+        draw = rng.random()
+        if draw < error_rate:
+            return f"```sql\n{error_sql}\n```"
+        if draw < error_rate * 1.25:
+            return empty_sql
+        return f"```sql\n{ok_sql}\n```"
+    return respond
+
+
+async def simulated_run(sql: str) -> dict:
+    await asyncio.sleep(0.02)
+    if sql == error_sql:
+        raise RuntimeError('relation "oebb.missing_table" does not exist')
+    rows = 0 if sql == empty_sql else 1
+    return {"columns": ["ok"], "values": [[1] * rows], "rows": rows, "truncated": False}
+
+
+async def serial(primary: str, prompt: str, run) -> float:
+    start = time.perf_counter()
+    for _ in range(max_attempts):
+        response = await llm.ainvoke(primary, prompt)
+        try:
+            data = await run(hedging.parse_sql(response.content))
+            if data["rows"]:
+                break
+        except Exception:
+            pass
+    return time.perf_counter() - start
+
+
+async def hedged(providers: list, prompt: str, run, delay: float) -> float:
+    start = time.perf_counter()
+    for _ in range(max_attempts):
+        try:
+            await hedging.race(providers, prompt, run, delay)
+            break
+        except hedging.HedgeFailed:
+            pass
+    return time.perf_counter() - start
+
+
+def report(name: str, durations: list) -> None:
+    durations = sorted(durations)
+    p95 = durations[max(0, int(len(durations) * 0.95) - 1)]
+    print(f"{name:<8} mean={statistics.mean(durations):6.2f}s  median={statistics.median(durations):6.2f}s  p95={p95:6.2f}s")
+
+
+async def main(specs: list, questions: int, delay: float, jitter: float, execute: bool, seed: int) -> None:
+    run = simulated_run
+    if execute:
+        from agent.executor import execute_query
+        run = execute_query
+    servers = []
+    for spec in specs:
+        name, latency, error_rate = spec.split(":")
+        server = FakeProvider(responder(name, float(latency), float(error_rate), jitter, seed), latency=float(latency)).start()
+        llm.register_provider(name, lambda server=server: server.chat_model("openai"))
+        servers.append(server)
+    providers = [spec.split(":")[0] for spec in specs]
+    try:
+        serial_times, hedged_times = [], []
+        for i in range(questions):
+            prompt = f"Frage {i}"
+            serial_times.append(await serial(providers[0], prompt, run))
+            hedged_times.append(await hedged(providers, prompt, run, delay))
+        report("serial", serial_times)
+        report("hedged", hedged_times)
+        stats = hedging.stats()
+        for provider, values in stats["providers"].items():
+            median = f"{values['median_seconds']:.2f}s" if values["median_seconds"] is not None else "-"
+            print(f"{provider:<8} started={values['started']:4d}  wins={values['wins']:4d}  "
+                  f"win_rate={values['win_rate']:.0%}  median={median}")
+        print(f"Races: {stats['races']}, failed: {stats['failed']}, "
+              f"estimated saving per race: median {stats['median_saved_seconds']:.2f}s, mean {stats['mean_saved_seconds']:.2f}s")
+        print(f"LLM requests: {sum(s.requests for s in servers)}, cancelled by the client: {sum(s.cancelled for s in servers)}")
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hedging über mehrere Fake-Provider im Vergleich zum seriellen Query Agent.")
+    parser.add_argument("--providers", default="fast:0.3:0.4,steady:0.8:0.05,jitter:0.5:0.15",
+                        help="name:latenz:fehlerrate, der erste ist der primäre Provider")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--delay", type=float, default=0.0, help="Verzögerung der weiteren Provider in Sekunden")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Mittlere Zusatzlatenz als Anteil der Latenz")
+    parser.add_argument("--execute", action="store_true", help="Abfragen über execute_query gegen die Datenbank ausführen")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.providers.split(","), args.questions, args.delay, args.jitter, args.execute, args.seed))
@@ -0,0 +1,62 @@
+# Benchmark: Overhead pro Hop, wenn das Chat-Modell bei jedem Knoten neu erstellt wird (alt)
+# im Vergleich zur geteilten Instanz aus der Registry (neu). Gemessen gegen den lokalen Fake-Provider.
+# Ausführen aus dem Ordner benchmark/: python bench_llm_registry.py --hops 200 --client mistral
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+sys.path.append('../app')
+from agent import llm
+from fake_provider import FakeProvider
+
+
+async def run_hops(provider: FakeProvider, client: str, hops: int, shared: bool) -> list:
+    """
+    Führe die gegebene Anzahl an Hops aus und gebe die Dauer pro Hop in Millisekunden zurück.
+    :param shared: True für die Registry, False für ein neues Modell pro Hop.
+    """
+    durations = []
+    for _ in range(hops):
+        start = time.perf_counter()
+        if shared:
+            await llm.ainvoke("fake", "Decide the next agent.")
+        else:
+            await provider.chat_model(client).ainvoke("Decide the next agent.")
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name: str, durations: list, connections: int) -> None:
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{name:<10} mean={statistics.mean(durations):7.2f}ms  median={statistics.median(durations):7.2f}ms  "
+          f"p95={p95:7.2f}ms  connections={connections}")
+
+
+async def main(hops: int, client: str) -> None:
+    with FakeProvider(responses="{'next_agent':'query_agent'}") as provider:
+        llm.register_provider("fake", lambda: provider.chat_model(client))
+        # Aufwärmen (Imports, erste Verbindung)
+        await run_hops(provider, client, 3, shared=True)
+        await run_hops(provider, client, 3, shared=False)
+
+        before = provider.connections
+        per_call = await run_hops(provider, client, hops, shared=False)
+        report("pro Hop", per_call, provider.connections - before)
+
+        before = provider.connections
+        shared = await run_hops(provider, client, hops, shared=True)
+        report("Registry", shared, provider.connections - before)
+
+        saved = statistics.mean(per_call) - statistics.mean(shared)
+        print(f"Ersparnis pro Hop: {saved:.2f}ms ({saved / statistics.mean(per_call) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hops", type=int, default=200)
+    parser.add_argument("--client", choices=["openai", "mistral"], default="mistral")
+    args = parser.parse_args()
+    asyncio.run(main(args.hops, args.client))
@@ -0,0 +1,132 @@
+# Benchmark: Größe der Checkpoints und Schreiblatenz pro Schritt mit und ohne Auslagern der Ergebnisse (agent.offload).
+# Der Graph läuft wie in bench_graph.py mit dem geskripteten Modell gegen die Benchmark-Datenbank, aber mit einem
+# AsyncPostgresSaver auf DATABASE_URL. Gemessen werden pro Lauf die Bytes des Threads in checkpoints, checkpoint_blobs
+# und checkpoint_writes, die Dauer jedes aput/aput_writes (Schreiben eines Schritts) und das Laden des Zustands
+# (aget_state, wie beim Öffnen eines Threads in der App). Die Threads des Benchmarks werden danach gelöscht.
+# Ausführen aus dem Ordner benchmark/ (LocalStack läuft, BUCKET_NAME gesetzt, oder --dir für ein lokales Verzeichnis):
+#   python bench_offload.py --runs 5 --only large,happy
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+sys.path.append('../app')
+
+size_sql = """
+SELECT (SELECT coalesce(sum(pg_column_size(checkpoint) + pg_column_size(metadata)), 0) FROM checkpoints WHERE thread_id = %(t)s)
+     + (SELECT coalesce(sum(octet_length(blob)), 0) FROM checkpoint_blobs WHERE thread_id = %(t)s)
+     + (SELECT coalesce(sum(octet_length(blob)), 0) FROM checkpoint_writes WHERE thread_id = %(t)s) AS bytes
+"""
+
+
+def timed_saver(pool, durations: dict):
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    class TimedSaver(AsyncPostgresSaver):
+        async def aput(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super().aput(*args, **kwargs)
+            finally:
+                durations["aput"].append(time.perf_counter() - start)
+
+        async def aput_writes(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super().aput_writes(*args, **kwargs)
+            finally:
+                durations["aput_writes"].append(time.perf_counter() - start)
+
+    return TimedSaver(pool)
+
+
+def ms(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] * 1000 if values else float("nan")
+
+
+async def run_mode(pool, mode: str, scenarios: dict, config: dict, runs: int) -> list:
+    from agent.agent import workflow
+    from agent.result import row_count
+    durations = {"aput": [], "aput_writes": []}
+    saver = timed_saver(pool, durations)
+    await saver.setup()
+    graph = workflow().compile(checkpointer=saver)
+    config = {**config, "offload": mode == "offload"}
+    rows = []
+    for name, s in scenarios.items():
+        sizes, loads, seconds, result_rows = [], [], [], 0
+        durations["aput"].clear()
+        durations["aput_writes"].clear()
+        threads = []
+        for i in range(runs):
+            thread = f"bench-offload-{mode}-{name}-{uuid.uuid4().hex[:8]}"
+            threads.append(thread)
+            runnable = {"recursion_limit": 50, "configurable": {"thread_id": thread}}
+            start = time.perf_counter()
+            state = await graph.ainvoke({"question": s["question"], "config": config}, config=runnable)
+            seconds.append(time.perf_counter() - start)
+            result_rows = row_count(state.get("data"))
+            start = time.perf_counter()
+            await graph.aget_state(runnable)
+            loads.append(time.perf_counter() - start)
+            async with pool.connection() as conn:
+                sizes.append((await (await conn.execute(size_sql, {"t": thread})).fetchone())["bytes"])
+        for thread in threads:
+            await saver.adelete_thread(thread)
+        rows.append({
+            "mode": mode, "scenario": name, "runs": runs, "rows": result_rows,
+            "checkpoint_kib": statistics.median(sizes) / 1024,
+            "steps": len(durations["aput"]) / runs,
+            "aput_p50_ms": ms(durations["aput"], 0.5), "aput_p95_ms": ms(durations["aput"], 0.95),
+            "writes_p50_ms": ms(durations["aput_writes"], 0.5), "writes_p95_ms": ms(durations["aput_writes"], 0.95),
+            "load_state_ms": statistics.median(loads) * 1000, "run_s": statistics.median(seconds),
+        })
+    return rows
+
+
+async def main(path: str, selected: list, runs: int, modes: list, directory: str) -> None:
+    from agent import llm, metrics, offload
+    from agent.scripted import from_script
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    if directory:
+        offload._store = offload.ResultStore(offload.DirectoryStore(directory))
+    with open(path, encoding="utf-8") as f:
+        script = json.load(f)
+    scenarios = {n: s for n, s in script["scenarios"].items() if not selected or n in selected}
+    llm.register_provider("scripted", lambda: from_script(path).model_copy(update={"latency": {}}))
+    config = {"model_query": "scripted", "model_interpret": "scripted", "cache": False, "sql_memory_k": 0, "query_hedge": False}
+    async with AsyncConnectionPool(os.environ["DATABASE_URL"], max_size=4, open=False,
+                                   kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}) as pool:
+        results = []
+        for mode in modes:
+            results += await run_mode(pool, mode, scenarios, config, runs)
+    print(f"{'mode':<8} {'scenario':<11} {'rows':>7} {'checkpoint':>12} {'steps':>6} {'aput p50/p95':>16} "
+          f"{'writes p50/p95':>16} {'load state':>11} {'run':>7}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['scenario']:<11} {r['rows']:>7} {r['checkpoint_kib']:>9.1f}KiB {r['steps']:>6.1f} "
+              f"{r['aput_p50_ms']:>7.2f}/{r['aput_p95_ms']:<7.2f}ms {r['writes_p50_ms']:>7.2f}/{r['writes_p95_ms']:<7.2f}ms "
+              f"{r['load_state_ms']:>9.2f}ms {r['run_s']:>6.2f}s")
+    print(f"\nOffloads: {metrics.offloads.summary()}")
+    for operation, s in metrics.offload_seconds.summary().items():
+        print(f"  {operation:<4} count={s['count']:<4} p50={s['p50'] * 1000:.1f}ms p95={s['p95'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpoint-Größe und Schreiblatenz mit und ohne ausgelagerte Ergebnisse.")
+    parser.add_argument("--scenarios", default="scenarios.json")
+    parser.add_argument("--only", default="large,happy", help="Kommagetrennte Auswahl an Szenarien")
+    parser.add_argument("--runs", type=int, default=5, help="Läufe pro Szenario und Modus")
+    parser.add_argument("--modes", default="inline,offload")
+    parser.add_argument("--dir", default="", help="Lokales Verzeichnis statt des S3-Buckets")
+    args = parser.parse_args()
+    load_dotenv('../app/.env')
+    asyncio.run(main(args.scenarios, [s for s in args.only.split(",") if s], args.runs,
+                     [m for m in args.modes.split(",") if m], args.dir))
@@ -0,0 +1,96 @@
+# Benchmark: deterministische Reparatur fehlgeschlagener Abfragen (agent.repair) gegen die Benchmark-Datenbank.
+# Aus gültigen Abfragen (scenarios.json) werden typische mechanische Fehler erzeugt (Tippfehler in Spalten und
+# Tabellen, fehlendes Schema, doppelte statt einfacher Anführungszeichen, Backticks, typografische Anführungszeichen,
+# Text nach dem Statement) sowie semantische Fehler, die nicht repariert werden sollen. Gemessen werden die
+# Erfolgsquote pro Fehlerart, die Dauer der Reparatur inkl. erneuter Ausführung und die eingesparte Zeit gegenüber
+# einem weiteren LLM-Aufruf mit --llm-seconds Latenz (plus der fehlgeschlagenen Ausführung, die dabei wiederholt würde).
+# Ausführen aus dem Ordner benchmark/: python bench_repair.py --llm-seconds 2.5
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+import time
+
+sys.path.append('../app')
+from agent import repair
+from agent.executor import execute_query
+
+
+def swap(word: str) -> str:
+    # Zwei benachbarte Buchstaben in der Mitte vertauschen
+    i = len(word) // 2
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+mutations = {
+    "column_typo": lambda sql: re.sub(r"mintues", "minutes", sql),
+    "column_swap": lambda sql: re.sub(r"\b(stationid)\b", lambda m: swap(m.group(1)), sql, count=1),
+    "missing_schema": lambda sql: sql.replace("oebb.", ""),
+    "table_typo": lambda sql: sql.replace("oebb.arrivals", "oebb.arrival").replace("oebb.departures", "oebb.departure"),
+    "double_quoted_literal": lambda sql: re.sub(r"'([A-Za-z][^']*)'", r'"\1"', sql),
+    "backticks": lambda sql: re.sub(r"\bs\.station\b", "s.`station`", sql),
+    "smart_quotes": lambda sql: re.sub(r"'([^']*)'", "‘\\1’", sql),
+    "trailing_text": lambda sql: sql + "; This query returns the requested values.",
+    # Semantische Fehler: hier soll das LLM entscheiden
+    "unknown_column": lambda sql: sql.replace("s.state", "s.bundesland").replace("s.station", "s.bahnhofsname"),
+}
+
+
+async def timed(sql: str) -> tuple:
+    start = time.perf_counter()
+    try:
+        await execute_query(sql, plan_gate=False, rollup_rewrite=False)
+        error = None
+    except Exception as e:
+        error = e
+    return time.perf_counter() - start, error
+
+
+async def main(path: str, llm_seconds: float) -> None:
+    with open(path, encoding="utf-8") as f:
+        scenarios = json.load(f)["scenarios"]
+    # Das große Szenario liefert 100k Zeilen, für die Reparatur reicht ein Ausschnitt
+    queries = [s["sql"][-1] if "LIMIT" in s["sql"][-1] or name != "large" else s["sql"][-1] + " LIMIT 1000"
+               for name, s in scenarios.items()]
+    results = {}
+    for kind, mutate in mutations.items():
+        for sql in queries:
+            broken = mutate(sql)
+            if broken == sql:
+                continue
+            failed_seconds, error = await timed(broken)
+            if error is None:
+                continue
+            repairer = repair.Repairer(lambda q: execute_query(q, plan_gate=False, rollup_rewrite=False))
+            start = time.perf_counter()
+            try:
+                await repairer.run(broken)
+                ok = True
+            except Exception:
+                ok = False
+            seconds = time.perf_counter() - start - failed_seconds
+            results.setdefault(kind, []).append({"ok": ok, "seconds": seconds, "saved": llm_seconds + failed_seconds - seconds if ok else 0.0,
+                                                 "fixes": repairer.fixes})
+    print(f"{'kind':<24} {'cases':>5} {'repaired':>9} {'repair p50':>11} {'saved p50':>10}")
+    total, repaired, saved = 0, 0, []
+    for kind, rows in results.items():
+        ok = [r for r in rows if r["ok"]]
+        total += len(rows)
+        repaired += len(ok)
+        saved += [r["saved"] for r in ok]
+        p50 = f"{statistics.median(r['seconds'] for r in ok) * 1000:.1f}ms" if ok else "-"
+        saved_p50 = f"{statistics.median(r['saved'] for r in ok):.2f}s" if ok else "-"
+        print(f"{kind:<24} {len(rows):>5} {len(ok):>9} {p50:>11} {saved_p50:>10}")
+    print(f"\nSuccess rate: {repaired}/{total} ({repaired / total:.0%}), saved {sum(saved):.1f}s in total "
+          f"(assuming {llm_seconds:.2f}s per LLM round trip)")
+    print(f"Repair stats: {repair.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Erfolgsquote und eingesparte Zeit der deterministischen SQL-Reparatur.")
+    parser.add_argument("--scenarios", default="scenarios.json")
+    parser.add_argument("--llm-seconds", type=float, default=2.5, help="Angenommene Latenz eines LLM-Aufrufs des Query Agents")
+    args = parser.parse_args()
+    asyncio.run(main(args.scenarios, args.llm_seconds))
@@ -0,0 +1,63 @@
+# Benchmark: Prompt-Größe und Generierungslatenz des Query Agents mit vollständigem Schema und mit Schema-Linking.
+# Für jede Frage wird der erste Prompt des Query Agents (ohne Gold-Beispiele) einmal mit dem vollständigen Schema und
+# einmal mit dem reduzierten Schema gebaut. Ohne --model werden nur die Tokens geschätzt, mit --model wird zusätzlich
+# die Generierung (ein LLM-Aufruf, ohne Ausführung) gemessen. Benötigt den Schema-Snapshot oder die Datenbank.
+# Ausführen aus dem Ordner benchmark/: python bench_schema_linking.py --model mistral --limit 20
+import argparse
+import asyncio
+import sys
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append('../app')
+
+
+async def run(question: str, model: str) -> list:
+    from agent import llm, schema_linking
+    from agent.agent import query_prompt
+    from agent.compaction import estimate_tokens
+    from agent.schema import schema_prompt
+    rows = []
+    selection = schema_linking.link(question)
+    for setting, selected in (("full", None), ("linked", selection)):
+        prompt = query_prompt(question, "", "", "", schema_prompt(indent="    ", selection=selected))
+        row = {"question": question, "schema": setting, "tables": len(selected) if selected else 5,
+               "prompt_tokens": estimate_tokens(prompt), "seconds": None}
+        if model:
+            start = time.perf_counter()
+            response = await llm.ainvoke(model, prompt)
+            row["seconds"] = time.perf_counter() - start
+            usage = getattr(response, "usage_metadata", None) or {}
+            row["input_tokens"] = usage.get("input_tokens")
+        rows.append(row)
+    return rows
+
+
+async def main(workbook: str, model: str, limit: int, output: str) -> None:
+    questions = pd.read_excel(workbook, sheet_name="Questions")["Frage"].dropna().tolist()[:limit]
+    rows = []
+    for question in questions:
+        rows.extend(await run(question, model))
+    df = pd.DataFrame(rows)
+    df.to_csv(output, index=False)
+    columns = [c for c in ("prompt_tokens", "input_tokens", "seconds") if c in df and df[c].notna().any()]
+    print(df.groupby("schema")[columns].agg(["mean", "median"]).to_string())
+    paired = df.pivot(index="question", columns="schema", values="prompt_tokens")
+    print(f"Schema linking saves {(1 - paired['linked'].sum() / paired['full'].sum()):.1%} of the prompt tokens "
+          f"({(paired['linked'] < paired['full']).mean():.0%} of the questions use a reduced schema)")
+    if model:
+        latency = df.pivot(index="question", columns="schema", values="seconds")
+        print(f"Median generation latency change per question: {(latency['linked'] - latency['full']).median():+.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workbook", default="../questions/questions.xlsx")
+    parser.add_argument("--model", default=None, help="Provider für die Latenzmessung (z.B. mistral), ohne nur Tokens")
+    parser.add_argument("--limit", type=int, default=101)
+    parser.add_argument("--output", default="schema_linking_results.csv")
+    args = parser.parse_args()
+    load_dotenv('../app/.env')
+    asyncio.run(main(args.workbook, args.model, args.limit, args.output))
@@ -0,0 +1,55 @@
+# Benchmark: Wirkung des SQL-Gedächtnisses (Gold-Beispiele im Prompt) auf Wiederholungen und Latenz pro Frage.
+# Jede Frage wird ohne (k=0) und mit Few-Shot-Beispielen (k) beantwortet. Die Frage selbst wird dabei aus dem
+# Gedächtnis ausgeschlossen (Leave-one-out), Caches sind deaktiviert. Benötigt ein LLM und die Datenbank.
+# Ausführen aus dem Ordner benchmark/: python bench_sql_memory.py --model mistral --k 3 --limit 20
+import argparse
+import asyncio
+import sys
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append('../app')
+
+
+async def run(graph, question: str, model: str, k: int) -> dict:
+    config = {"model_query": model, "model_interpret": "dryrun", "sql_memory_k": k, "sql_memory_leave_one_out": True, "cache": False}
+    start = time.perf_counter()
+    try:
+        state = await graph.ainvoke({"question": question, "config": config}, {"recursion_limit": 40})
+        error_count = state.get("error_count") or 0
+        failed = bool(state.get("error")) and error_count > 3
+    except Exception as e:
+        print(f"Error for question {question!r} with k={k}: {e}")
+        error_count, failed = None, True
+    return {"question": question, "k": k, "retries": error_count, "failed": failed, "seconds": time.perf_counter() - start}
+
+
+async def main(workbook: str, model: str, k: int, limit: int, output: str) -> None:
+    from agent.agent import workflow
+    graph = workflow().compile()
+    questions = pd.read_excel(workbook, sheet_name="Questions")["Frage"].dropna().tolist()[:limit]
+    rows = []
+    for question in questions:
+        for setting in (0, k):
+            rows.append(await run(graph, question, model, setting))
+    df = pd.DataFrame(rows)
+    df.to_csv(output, index=False)
+    summary = df.groupby("k").agg(mean_retries=("retries", "mean"), first_try=("retries", lambda r: (r == 0).mean()),
+                                  failed=("failed", "mean"), mean_seconds=("seconds", "mean"), median_seconds=("seconds", "median"))
+    print(summary.to_string())
+    paired = df.pivot(index="question", columns="k", values="seconds")
+    print(f"Median latency change per question with k={k}: {(paired[k] - paired[0]).median():+.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workbook", default="../questions/questions.xlsx")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=101)
+    parser.add_argument("--output", default="sql_memory_results.csv")
+    args = parser.parse_args()
+    load_dotenv('../app/.env')
+    asyncio.run(main(args.workbook, args.model, args.k, args.limit, args.output))
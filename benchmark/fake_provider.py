@@ -0,0 +1,143 @@
+# Lokaler, OpenAI-kompatibler Fake-Provider für Benchmarks ohne Cloud-LLM.
+# Der Server beantwortet /v1/chat/completions (auch mit stream=true) und zählt TCP-Verbindungen und Requests,
+# damit sich Verbindungswiederverwendung und Overhead pro Hop messen lassen. Vom Client abgebrochene Requests
+# (z.B. beim Hedging) werden als cancelled gezählt.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Union
+
+Responder = Union[str, List[str], Callable[[str], str]]
+
+
+class FakeProvider:
+    """
+    Startet einen lokalen HTTP-Server, der sich wie die OpenAI Chat Completions API verhält.
+    :param responses: Statische Antwort, Liste von Antworten (zyklisch) oder Funktion prompt -> Antwort.
+    :param latency: Künstliche Latenz pro Request in Sekunden.
+    """
+
+    def __init__(self, responses: Responder = "OK", latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.responses = responses
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.cancelled = 0
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _next_response(self, prompt: str) -> str:
+        if callable(self.responses):
+            return self.responses(prompt)
+        if isinstance(self.responses, list):
+            with self._lock:
+                return self.responses[(self.requests - 1) % len(self.responses)]
+        return self.responses
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with provider._lock:
+                    provider.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+                with provider._lock:
+                    provider.requests += 1
+                    provider.prompts.append(prompt)
+                if provider.latency:
+                    time.sleep(provider.latency)
+                content = provider._next_response(prompt)
+                try:
+                    if body.get("stream"):
+                        self._stream(content, body.get("model", "fake"))
+                    else:
+                        self._complete(content, body.get("model", "fake"))
+                except (BrokenPipeError, ConnectionResetError):
+                    with provider._lock:
+                        provider.cancelled += 1
+                    self.close_connection = True
+
+            def _complete(self, content: str, model: str):
+                payload = json.dumps({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": max(1, len(content) // 4), "total_tokens": 1 + max(1, len(content) // 4)},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, content: str, model: str):
+                # Server-Sent Events, ein Chunk pro Wort
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    delta = {"content": word if i == 0 else " " + word}
+                    self._chunk({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                self._chunk({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                self._write(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data: dict):
+                self._write(f"data: {json.dumps(data)}\n\n".encode())
+
+            def _write(self, raw: bytes):
+                self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+
+        return Handler
+
+    def start(self) -> "FakeProvider":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeProvider":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def chat_model(self, client: str = "openai", **kwargs):
+        """
+        Erstelle ein Chat-Modell, das gegen diesen Server spricht.
+        :param client: "openai" (ChatOpenAI) oder "mistral" (ChatMistralAI, eigener HTTP-Client pro Instanz).
+        """
+        if client == "mistral":
+            from langchain_mistralai import ChatMistralAI
+            return ChatMistralAI(model_name="fake", api_key="fake", endpoint=self.url, temperature=0.15, max_retries=0, **kwargs)
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model="fake", api_key="fake", base_url=self.url, temperature=0.15, max_retries=0, **kwargs)
@@ -0,0 +1,160 @@
+# Synthetischer Datensatz für das Schema oebb in einer lokalen TimescaleDB (oder Postgres ohne Erweiterung).
+# Legt station, trainnames, holidays, arrivals und departures mit der Struktur der Produktionsdatenbank an und füllt
+# sie deterministisch (Seed) mit einer wählbaren Anzahl an Zeilen. Mit TimescaleDB werden arrivals und departures
+# zu Hypertables, ohne Erweiterung wird time_bucket über date_bin nachgebildet, damit die Gold-Abfragen laufen.
+# Achtung: --drop löscht das Schema oebb der Ziel-Datenbank, daher nie gegen die Produktionsdatenbank ausführen.
+# Ausführen aus dem Ordner benchmark/: python generate_oebb.py --url postgresql://postgres@localhost:5432/oebb --rows 1000000
+import argparse
+import datetime
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+# Bahnhöfe aus den Fragen (Name, Stadt, Bezirk, Bundesland), weitere werden synthetisch ergänzt
+known_stations = [
+    ("Wien Hbf", "Wien", "Wien", "Wien"), ("Wien Meidling", "Wien", "Wien", "Wien"),
+    ("St. Pölten Hbf", "St. Pölten", "St. Pölten", "Niederösterreich"), ("Linz Hbf", "Linz", "Linz", "Oberösterreich"),
+    ("Wels Hbf", "Wels", "Wels", "Oberösterreich"), ("Salzburg Hbf", "Salzburg", "Salzburg", "Salzburg"),
+    ("Hallein", "Hallein", "Hallein", "Salzburg"), ("Innsbruck Hbf", "Innsbruck", "Innsbruck", "Tirol"),
+    ("Hall in Tirol", "Hall in Tirol", "Innsbruck-Land", "Tirol"), ("Schwaz", "Schwaz", "Schwaz", "Tirol"),
+    ("Bregenz", "Bregenz", "Bregenz", "Vorarlberg"), ("Dornbirn", "Dornbirn", "Dornbirn", "Vorarlberg"),
+    ("Feldkirch", "Feldkirch", "Feldkirch", "Vorarlberg"), ("Bludenz", "Bludenz", "Bludenz", "Vorarlberg"),
+    ("Graz Hbf", "Graz", "Graz", "Steiermark"), ("Klagenfurt Hbf", "Klagenfurt", "Klagenfurt", "Kärnten"),
+    ("Villach Hbf", "Villach", "Villach", "Kärnten"), ("Eisenstadt", "Eisenstadt", "Eisenstadt", "Burgenland"),
+]
+states = ["Wien", "Niederösterreich", "Oberösterreich", "Salzburg", "Tirol", "Vorarlberg", "Steiermark", "Kärnten", "Burgenland"]
+train_types = {"RJ": 0.15, "RJX": 0.08, "WB": 0.04, "IC": 0.05, "ICE": 0.02, "NJ": 0.02, "CJX": 0.12, "REX": 0.17, "R": 0.2, "S": 0.15}
+# Bundesweite Feiertage mit festem Datum (Monat, Tag)
+fixed_holidays = [
+    (1, 1, "Neujahr"), (1, 6, "Heilige Drei Könige"), (5, 1, "Staatsfeiertag"), (8, 15, "Mariä Himmelfahrt"),
+    (10, 26, "Nationalfeiertag"), (11, 1, "Allerheiligen"), (12, 8, "Mariä Empfängnis"), (12, 25, "Christtag"),
+    (12, 26, "Stefanitag"),
+]
+
+ddl = """
+CREATE SCHEMA IF NOT EXISTS oebb;
+CREATE TABLE oebb.station (stationid integer PRIMARY KEY, station text NOT NULL, city text, district text, state text, country text);
+CREATE TABLE oebb.trainnames (trainname text PRIMARY KEY, traintype text);
+CREATE TABLE oebb.holidays (date date NOT NULL, name text, state text[]);
+CREATE TABLE oebb.arrivals (
+    arrivaltimestamp timestamp with time zone NOT NULL, arrivaldate date, stationid integer, train text,
+    arrivalmintues integer, arrivalstatus text, planedlaststop text, platformchanged boolean
+);
+CREATE TABLE oebb.departures (
+    departuretimestamp timestamp with time zone NOT NULL, departuredate date, stationid integer, train text,
+    departuremintues integer, departurestatus text, platformchanged boolean
+);
+"""
+time_bucket_shim = """
+CREATE OR REPLACE FUNCTION public.time_bucket(bucket interval, ts timestamp with time zone) RETURNS timestamp with time zone
+AS $$ SELECT date_bin(bucket, ts, '2000-01-03 00:00:00+00'::timestamptz) $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+"""
+
+
+def stations(count: int, rng: np.random.Generator) -> pd.DataFrame:
+    rows = list(known_stations)
+    for i in range(len(rows), count):
+        state = states[rng.integers(len(states))]
+        rows.append((f"Haltestelle {i}", f"Ort {i % 150}", f"Bezirk {i % 60}", state))
+    df = pd.DataFrame(rows[:max(count, 1)], columns=["station", "city", "district", "state"])
+    df.insert(0, "stationid", np.arange(1, len(df) + 1))
+    df["country"] = np.where(rng.random(len(df)) < 0.97, "AT", "DE")
+    return df
+
+
+def trainnames(count: int, rng: np.random.Generator) -> pd.DataFrame:
+    types = rng.choice(list(train_types), size=count, p=np.array(list(train_types.values())) / sum(train_types.values()))
+    return pd.DataFrame({"trainname": [f"{t} {i + 1}" for i, t in enumerate(types)], "traintype": types})
+
+
+def holidays(start: datetime.date, days: int) -> pd.DataFrame:
+    end = start + datetime.timedelta(days=days)
+    rows = [(datetime.date(year, month, day), name, "{" + ",".join(states) + "}")
+            for year in range(start.year, end.year + 1) for month, day, name in fixed_holidays]
+    return pd.DataFrame(rows, columns=["date", "name", "state"])
+
+
+def events(rows: int, kind: str, start: datetime.date, days: int, station_df: pd.DataFrame, train_df: pd.DataFrame,
+           rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Ankünfte bzw. Abfahrten: Zeitpunkte gleichverteilt (Betrieb 5-24 Uhr), große Bahnhöfe häufiger, Verspätungen
+    überwiegend gering mit langem Ende, etwa 2 % Ausfälle und 1 % neue Züge, 5 % Gleiswechsel.
+    """
+    seconds = rng.integers(0, days * 86400, size=rows)
+    seconds = seconds - seconds % 86400 + 5 * 3600 + (seconds % 86400) * 19 // 24
+    timestamps = pd.Timestamp(start, tz="UTC") + pd.to_timedelta(np.sort(seconds), unit="s")
+    weights = 1 / np.arange(1, len(station_df) + 1) ** 0.8
+    station_ids = rng.choice(station_df["stationid"].to_numpy(), size=rows, p=weights / weights.sum())
+    minutes = np.where(rng.random(rows) < 0.7, rng.integers(0, 3, size=rows), rng.gamma(1.5, 6.0, size=rows).astype(int))
+    status = rng.choice(np.array([None, "Ausfall", "Neu"], dtype=object), size=rows, p=[0.97, 0.02, 0.01])
+    df = pd.DataFrame({
+        f"{kind}timestamp": timestamps,
+        f"{kind}date": timestamps.date,
+        "stationid": station_ids,
+        "train": rng.choice(train_df["trainname"].to_numpy(), size=rows),
+        f"{kind}mintues": minutes,
+        f"{kind}status": status,
+    })
+    if kind == "arrival":
+        df["planedlaststop"] = rng.choice(station_df["station"].to_numpy()[:len(known_stations)], size=rows)
+    df["platformchanged"] = rng.random(rows) < 0.05
+    return df
+
+
+def copy(conn: psycopg.Connection, table: str, df: pd.DataFrame, batch: int = 200000) -> None:
+    columns = ", ".join(df.columns)
+    with conn.cursor() as cur:
+        for offset in range(0, len(df), batch):
+            buffer = io.StringIO()
+            df.iloc[offset:offset + batch].to_csv(buffer, index=False, header=False)
+            with cur.copy(f"COPY oebb.{table} ({columns}) FROM STDIN WITH (FORMAT csv)") as cp:
+                cp.write(buffer.getvalue())
+
+
+def main(url: str, rows: int, station_count: int, train_count: int, start: datetime.date, days: int,
+         chunk_interval: str, seed: int, drop: bool) -> None:
+    rng = np.random.default_rng(seed)
+    begin = time.perf_counter()
+    with psycopg.connect(url, autocommit=True) as conn:
+        if drop:
+            conn.execute("DROP SCHEMA IF EXISTS oebb CASCADE")
+        timescale = conn.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'").fetchone() is not None
+        if timescale:
+            conn.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+        conn.execute(ddl)
+        if timescale:
+            for table, column in (("arrivals", "arrivaltimestamp"), ("departures", "departuretimestamp")):
+                conn.execute(f"SELECT create_hypertable('oebb.{table}', '{column}', chunk_time_interval => interval '{chunk_interval}')")
+        else:
+            conn.execute(time_bucket_shim)
+            print("TimescaleDB is not available: plain tables, time_bucket emulated with date_bin")
+        station_df = stations(station_count, rng)
+        train_df = trainnames(train_count, rng)
+        copy(conn, "station", station_df)
+        copy(conn, "trainnames", train_df)
+        copy(conn, "holidays", holidays(start, days))
+        for kind, table in (("arrival", "arrivals"), ("departure", "departures")):
+            copy(conn, table, events(rows, kind, start, days, station_df, train_df, rng))
+            conn.execute(f"CREATE INDEX ON oebb.{table} (stationid, {kind}timestamp DESC)")
+        conn.execute("ANALYZE")
+    print(f"Generated {rows} arrivals and departures, {len(station_df)} stations, {len(train_df)} trains "
+          f"in {time.perf_counter() - begin:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Erzeuge einen synthetischen oebb-Datensatz für Benchmarks.")
+    parser.add_argument("--url", default=os.getenv("TIMESCALE_DB_URL", "postgresql://postgres@localhost:5432/oebb"))
+    parser.add_argument("--rows", type=int, default=1000000, help="Zeilen pro Faktentabelle")
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--trains", type=int, default=2000)
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2023, 1, 1))
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--chunk-interval", default="7 days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="Vorhandenes Schema oebb vorher löschen")
+    args = parser.parse_args()
+    main(args.url, args.rows, args.stations, args.trains, args.start, args.days, args.chunk_interval, args.seed, args.drop)
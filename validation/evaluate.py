@@ -0,0 +1,294 @@
+# Diese Datei wurde mit der Dokumentation von https://docs.python.org/3/library/sqlite3.html und
+# https://docs.python.org/3/library/asyncio-sync.html erstellt.
+# Gemeinsamer Evaluationslauf für validator_time, validator_sqlsemantic und validator_intrepretation. Die Arbeit ist in
+# Stufen geteilt (generate, time, judge_sql, interpret, judge_interpretation), jede Kombination aus Frage, Modell und
+# Stufe ist eine Einheit mit eigenem Checkpoint in einer SQLite-Datei. Einheiten einer Stufe laufen parallel, begrenzt
+# pro Provider (EVAL_PROVIDER_CONCURRENCY, die Judges über judge.py) und für die Datenbank (EVAL_DB_CONCURRENCY).
+# Abgeschlossene Einheiten werden bei einem erneuten Lauf übersprungen, die Excel-Datei wird erst am Ende exportiert.
+# Ausführen aus dem Ordner validation/:
+#   python evaluate.py --stages generate,time --models mistral
+#   python evaluate.py --stages judge_sql --export ../questions/results.xlsx
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+# Stufen in der Reihenfolge ihrer Abhängigkeiten
+stages = ["generate", "time", "judge_sql", "interpret", "judge_interpretation"]
+models = ["mistral", "google", "openai"]
+store_path = os.getenv("EVAL_STORE", os.path.join("..", "questions", "evaluation.sqlite"))
+# Gleichzeitige Aufrufe des Agenten pro Provider und gleichzeitige Datenbank-Abfragen (Judges: siehe judge.py)
+provider_concurrency = int(os.getenv("EVAL_PROVIDER_CONCURRENCY", "2"))
+db_concurrency = int(os.getenv("EVAL_DB_CONCURRENCY", "4"))
+# Stimmen pro Judge-Modell
+judge_votes = int(os.getenv("EVAL_JUDGE_VOTES", "5"))
+
+schema = """
+CREATE TABLE IF NOT EXISTS units (
+    stage TEXT NOT NULL,
+    question TEXT NOT NULL,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    seconds REAL,
+    finished REAL,
+    PRIMARY KEY (stage, question, model)
+)
+"""
+
+
+def question_key(question: str) -> str:
+    """
+    Stabiler Schlüssel einer Frage, unabhängig von ihrer Zeile in der Excel-Datei.
+    """
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+class Store:
+    """
+    Checkpoints der Einheiten in SQLite. Jede Einheit wird sofort nach ihrem Abschluss geschrieben.
+    :param path: Pfad der SQLite-Datei.
+    """
+
+    def __init__(self, path: str = store_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(schema)
+        self.conn.commit()
+
+    def done(self, stage: str) -> set:
+        rows = self.conn.execute("SELECT question, model FROM units WHERE stage = ? AND status = 'done'", (stage,))
+        return set(rows.fetchall())
+
+    def get(self, stage: str, question: str, model: str):
+        row = self.conn.execute("SELECT result FROM units WHERE stage = ? AND question = ? AND model = ? AND status = 'done'",
+                                (stage, question, model)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, stage: str, question: str, model: str, result=None, error: str = None, seconds: float = None) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (stage, question, model, "error" if error else "done", json.dumps(result, ensure_ascii=False, default=str),
+             error, seconds, time.time()),
+        )
+        self.conn.commit()
+
+    def frame(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT * FROM units", self.conn)
+
+
+class Limits:
+    """
+    Semaphoren pro Provider und für die Datenbank.
+    """
+
+    def __init__(self, providers: int = provider_concurrency, database: int = db_concurrency):
+        self.providers = {}
+        self.provider_limit = providers
+        self.database = asyncio.Semaphore(database)
+
+    def provider(self, name: str) -> asyncio.Semaphore:
+        if name not in self.providers:
+            self.providers[name] = asyncio.Semaphore(self.provider_limit)
+        return self.providers[name]
+
+
+class Evaluation:
+    """
+    Führt die Einheiten der Stufen aus.
+    :param questions: Die Fragen (Spalten Frage und GoldenSQL).
+    :param store: Der Speicher der Checkpoints.
+    :param selected: Die Modelle, deren Einheiten laufen sollen ("golden" für die Golden Query).
+    :param force: Auch abgeschlossene Einheiten erneut ausführen.
+    """
+
+    def __init__(self, questions: pd.DataFrame, store: Store, selected: list = ["golden"] + models, force: bool = False):
+        from app.agent.agent import workflow
+        self.questions = {question_key(row["Frage"]): row for _, row in questions.iterrows()}
+        self.store = store
+        self.selected = selected
+        self.force = force
+        self.limits = Limits()
+        self.graph = workflow().compile().with_config({"run_name": "T2TSDB-Agent"})
+
+    def _config(self, model_query: str, model_interpret: str, session: str) -> dict:
+        # Ohne Auslagern der Ergebnisse (agent.offload), die Daten werden direkt im Store gespeichert, und ohne die
+        # Gold-SQL der eigenen Frage als Few-Shot-Beispiel (agent.sql_memory). Ohne SQL- und Ergebnis-Cache, sonst
+        # bekäme jedes Modell das SQL des vorherigen Modells bzw. früherer Läufe als Treffer
+        return {"model_query": model_query, "model_interpret": model_interpret, "offload": False, "sql_memory_leave_one_out": True,
+                "cache": False,
+                "metadata": {"langfuse_user_id": "admin", "langfuse_session_id": session}}
+
+    async def _invoke(self, state: dict, config: dict) -> dict:
+        from langchain.schema.runnable.config import RunnableConfig
+        from langfuse.langchain import CallbackHandler
+        return await self.graph.ainvoke(state, RunnableConfig(callbacks=[CallbackHandler()], **config))
+
+    def units(self, stage: str) -> list:
+        """
+        Offene Einheiten einer Stufe, deren Voraussetzungen abgeschlossen sind.
+        """
+        done = set() if self.force else self.store.done(stage)
+        candidates = []
+        for key in self.questions:
+            if stage == "judge_interpretation":
+                candidates.append((key, "all"))
+            elif stage in ("generate", "time"):
+                candidates += [(key, m) for m in self.selected]
+            else:
+                candidates += [(key, m) for m in self.selected if m != "golden"]
+        units = []
+        for key, model in candidates:
+            if (key, model) in done:
+                continue
+            if stage in ("time", "judge_sql") and self.store.get("generate", key, model) is None:
+                continue
+            if stage == "judge_sql" and self.store.get("generate", key, "golden") is None:
+                continue
+            if stage == "interpret" and self.store.get("generate", key, "golden") is None:
+                continue
+            if stage == "judge_interpretation" and any(self.store.get("interpret", key, m) is None for m in models):
+                continue
+            units.append((key, model))
+        return units
+
+    async def generate(self, key: str, model: str) -> dict:
+        from app.agent.executor import execute_query
+        from app.agent.result import row_count, to_records
+        row = self.questions[key]
+        if model == "golden":
+            async with self.limits.database:
+                data = await execute_query(row["GoldenSQL"], plan_gate=False, rollup_rewrite=False)
+            return {"sql": row["GoldenSQL"], "data": to_records(data)}
+        async with self.limits.provider(model), self.limits.database:
+            state = await self._invoke({"question": row["Frage"], "config": self._config(model, "dryrun", "testing")},
+                                       self._config(model, "dryrun", "testing"))
+        data = state.get("data")
+        return {"sql": state.get("query"), "data": to_records(data) if row_count(data) else None, "error": state.get("error")}
+
+    async def time(self, key: str, model: str) -> dict:
+        import timing
+        sql = self.store.get("generate", key, model)["sql"]
+        async with self.limits.database:
+            return await timing.time_query(sql)
+
+    async def judge_sql(self, key: str, model: str) -> dict:
+        import validator_sqlsemantic
+        row = self.questions[key]
+        query = self.store.get("generate", key, model)["sql"]
+        return await validator_sqlsemantic.judge_query(row["Frage"], row["GoldenSQL"], query, judge_votes)
+
+    async def interpret(self, key: str, model: str) -> dict:
+        row = self.questions[key]
+        data = self.store.get("generate", key, "golden")["data"]
+        config = self._config("dryrun", model, "testing")
+        async with self.limits.provider(model):
+            state = await self._invoke({"question": row["Frage"], "data": data, "config": config}, config)
+        return {"answer": state["answer"]}
+
+    async def judge_interpretation(self, key: str, model: str) -> dict:
+        import validator_intrepretation
+        row = self.questions[key]
+        data = self.store.get("generate", key, "golden")["data"]
+        texts = [self.store.get("interpret", key, m)["answer"] for m in models]
+        votes = await validator_intrepretation.judge_interpretations(row["Frage"], data, texts, judge_votes)
+        result = {"reasoning": votes["reasoning"]}
+        for index, m in enumerate(models):
+            scores = votes[f"text{index + 1}"]
+            result[m] = {"votes": scores, "score": sum(scores) / len(scores) if scores else None}
+        return result
+
+    async def run_stage(self, stage: str) -> None:
+        units = self.units(stage)
+        progress = tqdm(total=len(units), desc=stage)
+
+        async def unit(key: str, model: str) -> None:
+            start = time.perf_counter()
+            try:
+                result = await getattr(self, stage)(key, model)
+                self.store.put(stage, key, model, result, seconds=time.perf_counter() - start)
+            except Exception as e:
+                self.store.put(stage, key, model, error=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - start)
+            progress.update()
+
+        await asyncio.gather(*(unit(key, model) for key, model in units))
+        progress.close()
+
+
+def export(questions: pd.DataFrame, store: Store, path: str) -> pd.DataFrame:
+    """
+    Schreibe die Ergebnisse mit den Spaltennamen der einzelnen Validatoren in eine Excel-Datei.
+    """
+    from validator_time import time_columns
+    df = questions.copy()
+    units = store.frame()
+    units = units[units["status"] == "done"]
+    rows = {question_key(q): i for i, q in df["Frage"].items()}
+    for unit in units.itertuples():
+        if unit.question not in rows:
+            continue
+        i = rows[unit.question]
+        result = json.loads(unit.result)
+        prefix = unit.model.capitalize()
+        if unit.stage == "generate":
+            if unit.model != "golden":
+                df.at[i, prefix + "SQL"] = result["sql"]
+            df.at[i, prefix + "Daten"] = result["data"]
+        elif unit.stage == "time":
+            for column, key in time_columns.items():
+                df.at[i, prefix + column] = result.get(key)
+        elif unit.stage == "judge_sql":
+            df.at[i, prefix + "SQLSemanticVotes"] = result["votes"]
+            df.at[i, prefix + "SQLSemanticScore"] = result["score"]
+            df.at[i, prefix + "SQLSemanticReasoning"] = result["reasoning"]
+        elif unit.stage == "interpret":
+            df.at[i, prefix + "Interpretation"] = result["answer"]
+        elif unit.stage == "judge_interpretation":
+            for m in models:
+                df.at[i, m.capitalize() + "Votes"] = result[m]["votes"]
+                df.at[i, m.capitalize() + "Score"] = result[m]["score"]
+            df.at[i, "Reasoning"] = result["reasoning"]
+    df.to_excel(path, index=False, engine="openpyxl")
+    return df
+
+
+async def main(args) -> None:
+    questions = pd.read_excel(args.questions, sheet_name="Questions")
+    if args.limit:
+        questions = questions.head(args.limit)
+    # Spalten mit Listen und Texten, damit df.at auch Listen speichern kann
+    questions = questions.astype(object)
+    store = Store(args.store)
+    if args.stages:
+        evaluation = Evaluation(questions, store, [m for m in args.models.split(",") if m], args.force)
+        for stage in [s for s in stages if s in args.stages.split(",")]:
+            await evaluation.run_stage(stage)
+    summary = store.frame().groupby(["stage", "status"]).size()
+    print(summary.to_string())
+    if args.export:
+        export(questions, store, args.export)
+        print(f"Ergebnisse gespeichert in {args.export}")
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append('../')
+    load_dotenv('../app/.env')
+    parser = argparse.ArgumentParser(description="Fortsetzbare, parallele Evaluation in Stufen.")
+    parser.add_argument("--questions", default="../questions/questions.xlsx")
+    parser.add_argument("--store", default=store_path)
+    parser.add_argument("--stages", default=",".join(stages), help=f"Kommagetrennt aus {', '.join(stages)} (leer = nur Export)")
+    parser.add_argument("--models", default=",".join(["golden"] + models), help="Modelle der Einheiten, golden für die Golden Query")
+    parser.add_argument("--limit", type=int, default=0, help="Nur die ersten N Fragen")
+    parser.add_argument("--force", action="store_true", help="Abgeschlossene Einheiten der gewählten Stufen wiederholen")
+    parser.add_argument("--export", default="", help="Excel-Datei, die am Ende aus dem Speicher geschrieben wird")
+    asyncio.run(main(parser.parse_args()))
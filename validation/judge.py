@@ -0,0 +1,217 @@
+# Diese Datei wurde mit der Dokumentation von https://python.langchain.com/docs/how_to/chat_model_rate_limiting/ und
+# https://docs.python.org/3/library/asyncio-sync.html erstellt.
+# Gemeinsamer asynchroner Scheduler für die Judge-Aufrufe von validator_sqlsemantic und validator_intrepretation.
+# Pro Provider begrenzen eine Semaphore die gleichzeitigen Aufrufe und ein Token Bucket die Aufrufe pro Minute.
+# Fehlgeschlagene Aufrufe (auch nicht lesbare Antworten) werden begrenzt mit Backoff und Jitter wiederholt.
+# Jede gelesene Antwort wird unter dem Hash aus Modell, Prompt und Nummer der Stimme auf der Festplatte gespeichert,
+# damit ein erneuter Lauf vorhandene Stimmen sofort liest und nur fehlende Stimmen anfragt.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+judges = ["mistral", "google", "openai"]
+cache_dir = os.getenv("JUDGE_CACHE_DIR", os.path.join(".cache", "judge"))
+# Gleichzeitige Aufrufe pro Provider
+concurrency = int(os.getenv("JUDGE_CONCURRENCY", "3"))
+# Aufrufe pro Minute pro Provider, z.B. "mistral:60,google:30,openai:300" (fehlende Provider ohne Grenze)
+rate_limits = {p.split(":")[0].strip(): float(p.split(":")[1]) for p in os.getenv("JUDGE_RATE_LIMITS", "mistral:60,google:30,openai:300").split(",") if ":" in p}
+max_attempts = int(os.getenv("JUDGE_MAX_ATTEMPTS", "4"))
+# Wartezeit vor dem zweiten Versuch in Sekunden, danach verdoppelt (mit Jitter, höchstens backoff_max)
+backoff = float(os.getenv("JUDGE_BACKOFF", "2"))
+backoff_max = 60.0
+
+
+def _mistral():
+    from langchain_mistralai import ChatMistralAI
+    return ChatMistralAI(model_name="magistral-medium-latest", timeout=600)
+
+
+def _openai():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="o4-mini-2025-04-16", temperature=1)
+
+
+def _google():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.5-pro")
+
+
+factories = {"mistral": _mistral, "openai": _openai, "google": _google}
+model_names = {"mistral": "magistral-medium-latest", "openai": "o4-mini-2025-04-16", "google": "gemini-2.5-pro"}
+
+
+def content_text(response) -> str:
+    """
+    Text einer Antwort. Reasoning-Modelle (z.B. magistral) liefern eine Liste von Teilen, davon zählen die Textteile.
+    """
+    content = response.content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type", "text") == "text")
+    return content
+
+
+def parse_json(text: str) -> dict:
+    return json.loads(text.replace('```json', '').replace('```', ''))
+
+
+class TokenBucket:
+    """
+    Token Bucket mit rate Aufrufen pro Minute. Der Bucket fasst so viele Tokens wie in einer Sekunde (mindestens 1)
+    nachfließen, damit nach einer Pause nicht alle Aufrufe gleichzeitig starten.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate / 60
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """
+    Inhaltsadressierter Speicher der gelesenen Antworten (eine JSON-Datei pro Stimme).
+    """
+
+    def __init__(self, path: str = cache_dir):
+        self.path = path
+
+    @staticmethod
+    def key(model: str, prompt: str, sample: int) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}\0{sample}".encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, model: str, sample: int, response) -> None:
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "sample": sample, "created": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(tmp, file)
+
+
+class Scheduler:
+    """
+    Verteilt die Judge-Aufrufe auf die Provider.
+    :param cache: Der Speicher der Antworten (None = ohne Cache).
+    """
+
+    def __init__(self, cache: Optional[ResponseCache] = None):
+        self.cache = cache
+        self.models = {}
+        self.semaphores = {}
+        self.buckets = {}
+        self.stats = {"cached": 0, "requested": 0, "retries": 0, "failed": 0}
+
+    def _model(self, judge: str):
+        if judge not in self.models:
+            if judge not in factories:
+                raise ValueError(f"Unsupported model: {judge}")
+            self.models[judge] = factories[judge]()
+        return self.models[judge]
+
+    async def _slot(self, judge: str) -> None:
+        if judge in rate_limits:
+            await self.buckets.setdefault(judge, TokenBucket(rate_limits[judge])).acquire()
+
+    async def call(self, judge: str, prompt: str, sample: int, parse: Callable[[str], dict], config: Optional[dict] = None):
+        """
+        Eine Stimme eines Judges: aus dem Cache oder mit höchstens max_attempts Versuchen vom Provider.
+        :param parse: Liest die Antwort (Text) und wirft bei einer ungültigen Antwort eine Ausnahme.
+        :return: Die gelesene Antwort oder None, wenn alle Versuche fehlschlagen.
+        """
+        key = ResponseCache.key(model_names.get(judge, judge), prompt, sample)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["cached"] += 1
+                return cached
+        semaphore = self.semaphores.setdefault(judge, asyncio.Semaphore(concurrency))
+        for attempt in range(max_attempts):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(backoff_max, backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            async with semaphore:
+                await self._slot(judge)
+                self.stats["requested"] += 1
+                try:
+                    response = await self._model(judge).ainvoke(prompt, config=config)
+                    parsed = parse(content_text(response))
+                except Exception as e:
+                    logger.warning("Judge %s (vote %s, attempt %s) failed: %s", judge, sample, attempt + 1, e)
+                    continue
+            if self.cache is not None:
+                self.cache.put(key, model_names.get(judge, judge), sample, parsed)
+            return parsed
+        self.stats["failed"] += 1
+        return None
+
+    async def votes(self, prompt: str, parse: Callable[[str], dict], votes: int = 5, models: list = judges,
+                    config: Optional[dict] = None) -> dict:
+        """
+        votes Stimmen jedes Judges, alle Aufrufe gleichzeitig (begrenzt durch Semaphore und Token Bucket).
+        :return: Judge -> Liste der gelesenen Antworten (fehlgeschlagene Stimmen fehlen).
+        """
+        jobs = [(judge, sample) for judge in models for sample in range(votes)]
+        results = await asyncio.gather(*(self.call(judge, prompt, sample, parse, config) for judge, sample in jobs))
+        collected = {judge: [] for judge in models}
+        for (judge, _), result in zip(jobs, results):
+            if result is not None:
+                collected[judge].append(result)
+        return collected
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """
+    Geteilter Scheduler des Prozesses (mit Cache in JUDGE_CACHE_DIR, leer = ohne Cache).
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(ResponseCache(cache_dir) if cache_dir else None)
+    return _scheduler
+
+
+async def retry(call: Callable, attempts: int = max_attempts, label: str = "call"):
+    """
+    Wiederhole einen asynchronen Aufruf begrenzt mit Backoff und Jitter (z.B. den Graph-Aufruf der Interpretation).
+    :param call: Funktion ohne Argumente, die eine Coroutine liefert.
+    :return: Das Ergebnis des ersten erfolgreichen Versuchs, sonst wird der letzte Fehler geworfen.
+    """
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            logger.warning("%s failed (attempt %s): %s", label, attempt + 1, e)
+            await asyncio.sleep(min(backoff_max, backoff * 2 ** attempt) * random.uniform(0.5, 1.5))
@@ -0,0 +1,289 @@
+# Diese Datei wurde mit der Dokumentation von https://pandas.pydata.org/docs/reference/api/pandas.util.hash_pandas_object.html
+# und https://arrow.apache.org/docs/python/parquet.html erstellt.
+# Precision, Recall und F1 zwischen dem Ergebnis der Golden Query und dem einer generierten Abfrage, vektorisiert statt
+# wie im Notebook "precision und recall.ipynb" über Mengen von Tupeln. Die Spalten werden unabhängig von Name und
+# Reihenfolge zugeordnet (gleicher Name, sonst gleicher Typ mit der größten Überschneidung der Werte), Zahlen auf
+# eine Anzahl Nachkommastellen gerundet und Zeitpunkte auf eine Toleranz abgeschnitten. Jede Zeile wird zu einem
+# 64-Bit-Fingerprint, verglichen werden die Häufigkeiten der Fingerprints (Multimengen, Duplikate zählen mehrfach).
+# Große Ergebnisse können chunkweise aus Parquet oder der Datenbank gelesen werden.
+# Ausführen aus dem Ordner validation/: python precision_recall.py --input ../questions/results.xlsx
+import argparse
+import ast
+import datetime
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+decimals = int(os.getenv("PR_DECIMALS", "2"))
+time_tolerance = os.getenv("PR_TIME_TOLERANCE", "1s")
+# Zeilen pro Spalte, aus denen die Überschneidung für die Zuordnung der Spalten geschätzt wird
+alignment_sample = 10000
+models = {"Mistral": "Mistral", "Google": "Google", "Openai": "OpenAI"}
+
+
+def to_frame(data) -> pd.DataFrame:
+    """
+    Ergebnis als DataFrame: DataFrame, Liste von Zeilen, spaltenorientiertes Ergebnis (agent.result) oder der Text
+    einer Excel-Zelle (repr einer Liste von Dicts mit Timestamp, datetime und nan).
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    if data is None or (isinstance(data, float) and np.isnan(data)):
+        return pd.DataFrame()
+    if isinstance(data, str):
+        names = {"Timestamp": pd.Timestamp, "datetime": datetime, "Decimal": float, "nan": np.nan, "NaT": pd.NaT, "None": None}
+        try:
+            data = ast.literal_eval(data)
+        except (ValueError, SyntaxError):
+            try:
+                data = eval(data, {"__builtins__": {}}, names)
+            except Exception:
+                return pd.DataFrame()
+    if isinstance(data, dict) and "columns" in data and "values" in data:
+        return pd.DataFrame(dict(zip(data["columns"], data["values"])))
+    if not isinstance(data, list):
+        return pd.DataFrame()
+    return pd.DataFrame(data)
+
+
+def kind_of(series: pd.Series) -> str:
+    """
+    Art einer Spalte für die Zuordnung und Normalisierung: number, time oder text.
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "time"
+    values = series.dropna()
+    if values.empty:
+        return "text"
+    if pd.to_numeric(values, errors="coerce").notna().mean() > 0.8:
+        return "number"
+    if values.map(lambda v: isinstance(v, (datetime.date, pd.Timestamp))).mean() > 0.5:
+        return "time"
+    if values.map(type).eq(str).all():
+        parsed = pd.to_datetime(values, errors="coerce", utc=True, format="mixed")
+        if parsed.notna().mean() > 0.5:
+            return "time"
+    return "text"
+
+
+def normalize(series: pd.Series, kind: str, decimals: int = decimals, tolerance: str = time_tolerance) -> np.ndarray:
+    """
+    Spalte als uint64-Hashes vergleichbarer Werte: Zahlen gerundet (als Ganzzahl in Einheiten der letzten
+    Nachkommastelle), Zeitpunkte in UTC auf die Toleranz abgeschnitten, Texte ohne Leerzeichen am Rand.
+    Fehlende Werte werden zu einem gemeinsamen Wert, damit NULL gleich NULL ist.
+    """
+    if kind == "number":
+        values = pd.to_numeric(series, errors="coerce").astype("float64").to_numpy()
+        scaled = np.round(values * 10 ** decimals)
+        missing = ~np.isfinite(scaled)
+        normalized = np.where(missing, 0, scaled).astype("int64")
+    elif kind == "time":
+        parsed = pd.to_datetime(series, errors="coerce", utc=True, format="mixed")
+        missing = parsed.isna().to_numpy()
+        normalized = parsed.dt.floor(tolerance).to_numpy(dtype="datetime64[ns]").view("int64")
+    else:
+        missing = series.isna().to_numpy()
+        normalized = series.astype(str).str.strip().to_numpy(dtype=object)
+    hashed = pd.util.hash_array(normalized, categorize=False)
+    hashed[missing] = np.uint64(0)
+    return hashed
+
+
+def _overlap(a: np.ndarray, b: np.ndarray) -> float:
+    a, b = np.unique(a[:alignment_sample]), np.unique(b[:alignment_sample])
+    if not len(a) or not len(b):
+        return 0.0
+    return len(np.intersect1d(a, b, assume_unique=True)) / min(len(a), len(b))
+
+
+def align(golden: pd.DataFrame, predicted: pd.DataFrame, decimals: int = decimals, tolerance: str = time_tolerance) -> list:
+    """
+    Ordne den Spalten der Golden Query die Spalten der generierten Abfrage zu. Zuerst nach Name (ohne Groß- und
+    Kleinschreibung), danach gierig nach der größten Überschneidung der Werte unter Spalten derselben Art.
+    :return: Liste von Paaren (Spalte golden, Spalte generiert) in der Reihenfolge der Golden Query.
+    """
+    kinds_g = {c: kind_of(golden[c]) for c in golden.columns}
+    kinds_p = {c: kind_of(predicted[c]) for c in predicted.columns}
+    by_name = {str(c).lower(): c for c in predicted.columns}
+    pairs = {}
+    for c in golden.columns:
+        match = by_name.get(str(c).lower())
+        if match is not None and kinds_p[match] == kinds_g[c]:
+            pairs[c] = match
+    rest_g = [c for c in golden.columns if c not in pairs]
+    rest_p = [c for c in predicted.columns if c not in pairs.values()]
+    candidates = []
+    for g in rest_g:
+        for p in rest_p:
+            if kinds_g[g] != kinds_p[p]:
+                continue
+            score = _overlap(normalize(golden[g], kinds_g[g], decimals, tolerance), normalize(predicted[p], kinds_p[p], decimals, tolerance))
+            if score > 0:
+                candidates.append((score, g, p))
+    for score, g, p in sorted(candidates, key=lambda c: -c[0]):
+        if g not in pairs and p not in pairs.values():
+            pairs[g] = p
+    # Wie im Notebook: bleibt pro Art genau eine Spalte auf jeder Seite übrig, gehören sie zusammen
+    for kind in ("number", "time", "text"):
+        left_g = [c for c in golden.columns if c not in pairs and kinds_g[c] == kind]
+        left_p = [c for c in predicted.columns if c not in pairs.values() and kinds_p[c] == kind]
+        if len(left_g) == 1 and len(left_p) == 1:
+            pairs[left_g[0]] = left_p[0]
+    return [(c, pairs[c]) for c in golden.columns if c in pairs]
+
+
+def fingerprints(df: pd.DataFrame, columns: list, kinds: list, decimals: int = decimals, tolerance: str = time_tolerance) -> np.ndarray:
+    """
+    64-Bit-Fingerprint pro Zeile aus den normalisierten Spalten in der gegebenen Reihenfolge.
+    """
+    if df.empty or not columns:
+        return np.zeros(len(df), dtype="uint64")
+    hashed = pd.DataFrame({i: normalize(df[c], k, decimals, tolerance) for i, (c, k) in enumerate(zip(columns, kinds))})
+    return pd.util.hash_pandas_object(hashed, index=False).to_numpy()
+
+
+class Counts:
+    """
+    Häufigkeiten der Fingerprints beider Seiten, die chunkweise ergänzt werden können.
+    Die Zuordnung der Spalten wird aus den ersten Chunks beider Seiten bestimmt und danach beibehalten.
+    """
+
+    def __init__(self, decimals: int = decimals, tolerance: str = time_tolerance, distinct: bool = False, partial: bool = False):
+        self.decimals = decimals
+        self.tolerance = tolerance
+        self.distinct = distinct
+        self.partial = partial
+        self.pairs: Optional[list] = None
+        self.kinds: Optional[list] = None
+        self.golden_columns = 0
+        self.golden = pd.Series(dtype="int64")
+        self.predicted = pd.Series(dtype="int64")
+
+    def prepare(self, golden: pd.DataFrame, predicted: pd.DataFrame) -> None:
+        self.pairs = align(golden, predicted, self.decimals, self.tolerance)
+        self.kinds = [kind_of(golden[g]) for g, _ in self.pairs]
+        self.golden_columns = len(golden.columns)
+
+    def _add(self, counts: pd.Series, df: pd.DataFrame, columns: list) -> pd.Series:
+        if df.empty:
+            return counts
+        chunk = pd.Series(fingerprints(df, columns, self.kinds, self.decimals, self.tolerance)).value_counts()
+        return counts.add(chunk, fill_value=0).astype("int64")
+
+    def add_golden(self, df: pd.DataFrame) -> None:
+        self.golden = self._add(self.golden, df, [g for g, _ in self.pairs])
+
+    def add_predicted(self, df: pd.DataFrame) -> None:
+        self.predicted = self._add(self.predicted, df, [p for _, p in self.pairs])
+
+    def result(self) -> dict:
+        golden, predicted = self.golden, self.predicted
+        if self.distinct:
+            golden, predicted = golden.clip(upper=1), predicted.clip(upper=1)
+        gold_total, pred_total = int(golden.sum()), int(predicted.sum())
+        # Ohne partial muss jede Spalte der Golden Query zugeordnet sein, sonst ist keine Zeile korrekt
+        complete = bool(self.pairs) and (self.partial or len(self.pairs) == self.golden_columns)
+        tp = int(np.minimum(golden, predicted.reindex(golden.index, fill_value=0)).sum()) if complete else 0
+        precision = tp / pred_total if pred_total else 0.0
+        recall = tp / gold_total if gold_total else 0.0
+        return {
+            "tp": tp,
+            "pred_total": pred_total,
+            "gold_total": gold_total,
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "matched_on": self.pairs or [],
+            "column_coverage": len(self.pairs or []) / self.golden_columns if self.golden_columns else 0.0,
+        }
+
+
+def compare(golden, predicted, decimals: int = decimals, tolerance: str = time_tolerance, distinct: bool = False, partial: bool = False) -> dict:
+    """
+    Precision, Recall und F1 eines Ergebnisses gegenüber der Golden Query.
+    :param golden: Ergebnis der Golden Query (alle Formate von to_frame).
+    :param predicted: Ergebnis der generierten Abfrage.
+    :param decimals: Nachkommastellen, auf die Zahlen gerundet werden.
+    :param tolerance: Zeitpunkte werden auf diese Auflösung abgeschnitten (pandas-Frequenz, z.B. "1s", "1min").
+    :param distinct: Wie im Notebook nur unterschiedliche Zeilen zählen statt Multimengen.
+    :param partial: Nur über die zugeordneten Spalten vergleichen, auch wenn Spalten der Golden Query fehlen.
+    :return: tp, pred_total, gold_total, precision, recall, f1, matched_on und column_coverage.
+    """
+    golden, predicted = to_frame(golden), to_frame(predicted)
+    counts = Counts(decimals, tolerance, distinct, partial)
+    counts.prepare(golden, predicted)
+    counts.add_golden(golden)
+    counts.add_predicted(predicted)
+    return counts.result()
+
+
+def compare_chunks(golden: Iterable[pd.DataFrame], predicted: Iterable[pd.DataFrame], decimals: int = decimals,
+                   tolerance: str = time_tolerance, distinct: bool = False, partial: bool = False) -> dict:
+    """
+    Wie compare, aber für große Ergebnisse als Folge von Chunks (z.B. read_parquet_chunks oder read_sql_chunks).
+    Im Speicher liegen nur ein Chunk pro Seite und die Häufigkeiten der Fingerprints.
+    """
+    golden, predicted = iter(golden), iter(predicted)
+    first_golden, first_predicted = next(golden, pd.DataFrame()), next(predicted, pd.DataFrame())
+    counts = Counts(decimals, tolerance, distinct, partial)
+    counts.prepare(first_golden, first_predicted)
+    counts.add_golden(first_golden)
+    counts.add_predicted(first_predicted)
+    for chunk in golden:
+        counts.add_golden(chunk)
+    for chunk in predicted:
+        counts.add_predicted(chunk)
+    return counts.result()
+
+
+def read_parquet_chunks(path: str, batch_size: int = 100000) -> Iterable[pd.DataFrame]:
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def read_sql_chunks(query: str, engine, chunksize: int = 100000) -> Iterable[pd.DataFrame]:
+    """
+    Lese das Ergebnis einer Abfrage über einen serverseitigen Cursor in Chunks.
+    :param engine: Die synchrone SQLAlchemy-Engine.
+    """
+    from sqlalchemy import text
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+        yield from pd.read_sql_query(text(query), conn, chunksize=chunksize)
+
+
+def score_workbook(df: pd.DataFrame, decimals: int = decimals, tolerance: str = time_tolerance, distinct: bool = False,
+                   partial: bool = False) -> pd.DataFrame:
+    """
+    Precision, Recall und F1 für alle Zeilen einer Ergebnis-Tabelle (Spalten GoldenDaten und <Modell>Daten).
+    Die Spaltennamen entsprechen denen des Notebooks (z.B. Precision_OpenAI).
+    """
+    df = df.copy()
+    for model, name in models.items():
+        if f"{model}Daten" not in df.columns:
+            continue
+        scores = [compare(golden, predicted, decimals, tolerance, distinct, partial) for golden, predicted in zip(df["GoldenDaten"], df[f"{model}Daten"])]
+        df[f"Precision_{name}"] = [s["precision"] for s in scores]
+        df[f"Recall_{name}"] = [s["recall"] for s in scores]
+        df[f"F1_{name}"] = [s["f1"] for s in scores]
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precision und Recall der Modelle gegenüber der Golden Query.")
+    parser.add_argument("--input", default="../questions/results_time.xlsx")
+    parser.add_argument("--sheet", default=0)
+    parser.add_argument("--output", default="../questions/questions_with_precision_recall.xlsx")
+    parser.add_argument("--decimals", type=int, default=decimals)
+    parser.add_argument("--tolerance", default=time_tolerance)
+    parser.add_argument("--distinct", action="store_true", help="Nur unterschiedliche Zeilen zählen (wie im Notebook)")
+    parser.add_argument("--partial", action="store_true", help="Auch vergleichen, wenn Spalten der Golden Query fehlen")
+    args = parser.parse_args()
+    scored = score_workbook(pd.read_excel(args.input, sheet_name=args.sheet), args.decimals, args.tolerance, args.distinct, args.partial)
+    scored.to_excel(args.output, index=False, engine="openpyxl")
+    print(scored[[c for c in scored.columns if c.split("_")[0] in ("Precision", "Recall", "F1")]].describe().to_string())
+    print(f"Ergebnisse gespeichert in {args.output}")
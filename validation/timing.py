@@ -0,0 +1,148 @@
+# Diese Datei wurde mit der Dokumentation von https://www.postgresql.org/docs/current/sql-explain.html und
+# https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html erstellt.
+# Zeitmessung der Abfragen für die Validierung: EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) auf wiederverwendeten
+# Verbindungen aus dem Pool der asynchronen Engine. Pro Abfrage zählen die ersten Läufe als kalte Läufe (Aufwärmen,
+# getrennt ausgewiesen), danach folgen die warmen Läufe mit Median, p95 und einem Bootstrap-Konfidenzintervall des
+# Medians sowie den Buffer-Zugriffen (Treffer im Shared Buffer bzw. gelesene Blöcke). Die Läufe einer Abfrage laufen
+# nacheinander, unabhängige Abfragen parallel bis zu TIMING_CONCURRENCY Verbindungen.
+import asyncio
+import json
+import os
+import statistics
+
+import numpy as np
+from sqlalchemy import text
+
+from app.agent.executor import split_statements, statement_timeout
+from app.agent.schema import async_engine
+
+# Warme Läufe pro Abfrage, vorher TIMING_WARMUP kalte Läufe, die nicht in den Median eingehen
+timing_runs = int(os.getenv("TIMING_RUNS", "10"))
+timing_warmup = int(os.getenv("TIMING_WARMUP", "1"))
+# Maximale Anzahl gleichzeitig gemessener Abfragen (1 = keine gegenseitige Beeinflussung, höchstens DB_POOL_SIZE)
+timing_concurrency = int(os.getenv("TIMING_CONCURRENCY", "4"))
+# Konfidenzniveau und Anzahl der Bootstrap-Stichproben für das Intervall des Medians
+confidence = float(os.getenv("TIMING_CONFIDENCE", "0.95"))
+bootstrap_samples = 2000
+
+buffer_keys = {"shared_hit": "Shared Hit Blocks", "shared_read": "Shared Read Blocks", "temp_read": "Temp Read Blocks", "temp_written": "Temp Written Blocks"}
+
+
+def parse_plan(explained) -> dict:
+    """
+    Zeiten und Buffer aus der Ausgabe von EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+    Die Buffer des obersten Knotens enthalten die aller Kindknoten, die der Planung (ab Postgres 13) werden addiert.
+    :param explained: Die erste Spalte der ersten Zeile (Liste mit einem Plan oder JSON-Text).
+    :return: plantime und executiontime in Millisekunden sowie die Buffer in Blöcken.
+    """
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    plan = explained[0]
+    measured = {"plantime": plan.get("Planning Time", 0.0), "executiontime": plan.get("Execution Time", 0.0)}
+    for key, name in buffer_keys.items():
+        measured[key] = plan["Plan"].get(name, 0) + plan.get("Planning", {}).get(name, 0)
+    return measured
+
+
+def _add(total: dict, measured: dict) -> dict:
+    return {key: total.get(key, 0) + value for key, value in measured.items()}
+
+
+async def explain(conn, query: str, timeout: int = statement_timeout) -> dict:
+    """
+    Ein Lauf einer Abfrage auf einer bestehenden Verbindung. Mehrere Statements werden einzeln gemessen und
+    summiert. Die Transaktion wird zurückgerollt, damit Statements mit Änderungen keine Spuren hinterlassen.
+    """
+    total = {}
+    try:
+        await conn.execute(text(f"SET statement_timeout = {timeout}"))
+        for stmt in split_statements(query):
+            result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {stmt}"))
+            total = _add(total, parse_plan(result.scalar()))
+    finally:
+        await conn.rollback()
+    return total
+
+
+def explain_sync(conn, query: str, timeout: int = statement_timeout) -> dict:
+    """
+    Synchrone Variante von explain für eine Verbindung der synchronen Engine.
+    """
+    total = {}
+    try:
+        conn.execute(text(f"SET statement_timeout = {timeout}"))
+        for stmt in split_statements(query):
+            total = _add(total, parse_plan(conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {stmt}")).scalar()))
+    finally:
+        conn.rollback()
+    return total
+
+
+def median_ci(values: list, level: float = confidence, samples: int = bootstrap_samples) -> tuple:
+    """
+    Bootstrap-Konfidenzintervall des Medians (Perzentil-Methode, fester Seed für reproduzierbare Tabellen).
+    """
+    if len(values) < 2:
+        return (values[0], values[0]) if values else (None, None)
+    rng = np.random.default_rng(0)
+    medians = np.median(rng.choice(np.asarray(values), size=(samples, len(values)), replace=True), axis=1)
+    alpha = (1 - level) / 2
+    return float(np.quantile(medians, alpha)), float(np.quantile(medians, 1 - alpha))
+
+
+def summarize(cold: list, warm: list) -> dict:
+    """
+    Fasse die Läufe einer Abfrage zusammen.
+    :param cold: Messungen der Aufwärm-Läufe.
+    :param warm: Messungen der warmen Läufe.
+    :return: Median, p95 und Konfidenzintervall der warmen Läufe, der erste kalte Lauf und die Buffer (Median).
+    """
+    summary = {"runs": len(warm), "warmup": len(cold)}
+    if warm:
+        execution = [m["executiontime"] for m in warm]
+        summary["executiontime"] = statistics.median(execution)
+        summary["executiontime_p95"] = float(np.quantile(execution, 0.95))
+        summary["executiontime_ci_low"], summary["executiontime_ci_high"] = median_ci(execution)
+        summary["plantime"] = statistics.median(m["plantime"] for m in warm)
+        summary["plantime_p95"] = float(np.quantile([m["plantime"] for m in warm], 0.95))
+        for key in buffer_keys:
+            summary[key] = statistics.median(m[key] for m in warm)
+    if cold:
+        summary["cold_executiontime"] = cold[0]["executiontime"]
+        summary["cold_plantime"] = cold[0]["plantime"]
+        summary["cold_shared_read"] = cold[0]["shared_read"]
+    return summary
+
+
+async def time_query(query: str, runs: int = timing_runs, warmup: int = timing_warmup, timeout: int = statement_timeout) -> dict:
+    """
+    Miss eine Abfrage: erst die kalten, dann die warmen Läufe, alle auf derselben Verbindung.
+    :return: Die Zusammenfassung aus summarize.
+    """
+    measurements = []
+    async with async_engine.connect() as conn:
+        for _ in range(warmup + runs):
+            measurements.append(await explain(conn, query, timeout))
+    return summarize(measurements[:warmup], measurements[warmup:])
+
+
+async def time_queries(queries: dict, runs: int = timing_runs, warmup: int = timing_warmup,
+                       concurrency: int = timing_concurrency, timeout: int = statement_timeout) -> dict:
+    """
+    Miss mehrere unabhängige Abfragen parallel (höchstens concurrency gleichzeitig).
+    :param queries: Schlüssel -> SQL-Abfrage.
+    :return: Schlüssel -> Zusammenfassung, bei einem Fehler {"error": ...}.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(query: str) -> dict:
+        async with semaphore:
+            try:
+                return await time_query(query, runs, warmup, timeout)
+            except Exception as e:
+                return {"error": e}
+
+    keys = list(queries)
+    results = await asyncio.gather(*(bounded(queries[key]) for key in keys))
+    return dict(zip(keys, results))
+
@@ -1,4 +1,5 @@
 import sys
+import asyncio
 sys.path.append('../')
 import pandas as pd
 from app.agent.agent import workflow
@@ -6,10 +7,8 @@ from dotenv import load_dotenv
 from langfuse.langchain import CallbackHandler
 from langchain.schema.runnable.config import RunnableConfig
 from tqdm import tqdm
-from langchain_mistralai import ChatMistralAI
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-import json
+import judge
+from evaluate import Store, question_key
 
 def load_excel_data(file_path: str) -> pd.DataFrame:
     """
@@ -17,14 +16,13 @@ def load_excel_data(file_path: str) -> pd.DataFrame:
     """
     return pd.read_excel(file_path, sheet_name="Questions")
 
-def call_reasoning_llm(question: str, daten: list, interpreation: list, model: str) -> str:
+def judge_prompt(question: str, daten: list, interpreation: list) -> str:
     """
-    Rufe das reasoning LLM auf, um die Bewertung der Daten zu erhalten.
+    Prompt für das reasoning LLM, um die Interpretationen der Daten zu bewerten.
     :param question: Die Frage, die beantwortet werden soll.
     :param daten: Die Daten, die bewertet werden sollen.
-    :param model: Das Modell, das verwendet werden soll (mistral, openai, google).
-    :param interpreation: Die Interpretation der Daten von Google, Openai und Mistral.
-    :return: Die Antwort des Modells.
+    :param interpreation: Die Interpretation der Daten von Mistral, Google und Openai.
+    :return: Der fertige Prompt.
     """
     template = """# TASK
 - For each of the three texts, assign a score from 1 (least relevant) to 5 (most relevant) with respect to the Question and the Data. Then provide a short explanation for your scoring.
@@ -48,7 +46,7 @@ Texts to Evaluate:
 
 # EXPECTED OUTPUT FORMAT (JSON-like)
 {json_output}"""
-    formated_template = template.format(
+    return template.format(
         question=question,
         daten=daten,
         interpreation=interpreation,
@@ -61,28 +59,27 @@ Texts to Evaluate:
   "reasoning": "<Brief, explanation for the assigned scores>"
 }"""
     )
-    if model == "mistral":
-        response = ChatMistralAI(
-            model_name="magistral-medium-latest",
-            timeout=600
-        ).invoke(formated_template)
-        scoring = json.loads(response.content[1]['text'].replace('```json', '').replace('```', ''))
-    elif model == "openai":
-        response = ChatOpenAI(
-            model="o4-mini-2025-04-16",
-            temperature=1
-        ).invoke(formated_template)
-        scoring = json.loads(response.content.replace('```json', '').replace('```', ''))
-    elif model == "google":
-        response = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
-        ).invoke(formated_template)
-        scoring = json.loads(response.content.replace('```json', '').replace('```', ''))
-    else:
-        raise ValueError(f"Unsupported model: {model}")
-    
+
+def parse_scores(content: str) -> dict:
+    """
+    Lese die Bewertung ({"scores": {"text1": 1-5, ...}, "reasoning": ...}), ungültige Antworten werfen eine Ausnahme.
+    """
+    scoring = judge.parse_json(content)
+    if "reasoning" not in scoring or not all(1 <= float(scoring["scores"][t]) <= 5 for t in ("text1", "text2", "text3")):
+        raise ValueError(f"Invalid scoring: {scoring}")
     return scoring
 
+async def judge_interpretations(question: str, daten: list, interpreation: list, votes: int = 5) -> dict:
+    """
+    Bewerte die drei Interpretationen mit votes Stimmen jedes reasoning LLMs (über den geteilten Judge-Scheduler).
+    :return: Die Stimmen pro Interpretation (text1, text2, text3) und die Begründungen.
+    """
+    collected = await judge.get_scheduler().votes(judge_prompt(question, daten, interpreation), parse_scores, votes)
+    all_votes = [v for model_votes in collected.values() for v in model_votes]
+    result = {text: [v["scores"][text] for v in all_votes] for text in ("text1", "text2", "text3")}
+    result["reasoning"] = [v["reasoning"] for v in all_votes]
+    return result
+
 def main():
     df = load_excel_data("../questions/questions.xlsx")
     print("Excel-Daten geladen:")
@@ -99,7 +96,12 @@ def main():
     print(df)
     
     graph = workflow().compile().with_config({"run_name": "T2TSDB-Agent"})
+    # Ein Event-Loop für alle Aufrufe, damit die geteilten HTTP-Clients der Modelle gültig bleiben
+    loop = asyncio.new_event_loop()
     langfuse_handler = CallbackHandler()
+    # Interpretationen werden wie in evaluate.py (Stufe interpret) gespeichert und bei einem erneuten Lauf
+    # wiederverwendet, damit der Prompt des Judges gleich bleibt und die Stimmen aus dem Cache kommen
+    store = Store()
     for i, row in tqdm(df.iterrows(), total=df.shape[0], desc="Processing questions"):
         question = row['Frage']
         goldendaten = row["GoldenDaten"]
@@ -107,46 +109,40 @@ def main():
         intrepretation = []
         try:
             for model in ['mistral', 'google', 'openai']:
+                stored = store.get("interpret", question_key(question), model)
+                if stored is not None:
+                    intrepretation.append(stored["answer"])
+                    df.at[i, model.capitalize() + 'Interpretation'] = stored["answer"]
+                    continue
                 config = {
                             "model_query": "dryrun",
                             "model_interpret": model, 
+                            # Ohne die Gold-SQL der eigenen Frage als Few-Shot-Beispiel (agent.sql_memory)
+                            "sql_memory_leave_one_out": True,
+                            # Ohne SQL- und Ergebnis-Cache: sonst bewertet jedes Modell das SQL des vorherigen bzw. früherer Läufe
+                            "cache": False,
                             "metadata": {
                                 "langfuse_user_id": "admin",
                                 "langfuse_session_id": "testing",
                             }
                         }
-                invoked_awnser = None
-                while invoked_awnser is None:
-                    try:
-                        invoked_awnser = graph.invoke({'question': question, 'data': goldendaten, 'config': config},
-                                                     RunnableConfig(callbacks=[langfuse_handler], **config))['answer']
-                    except Exception as e:
-                        print(f"Error invoking graph for question {question} with model {model}: {e}")
-                        continue
+                # Begrenzte Wiederholungen mit Backoff statt einer Endlosschleife
+                invoked = loop.run_until_complete(judge.retry(
+                    lambda: graph.ainvoke({'question': question, 'data': goldendaten, 'config': config},
+                                          RunnableConfig(callbacks=[langfuse_handler], **config)),
+                    label=f"Graph for question {question} with model {model}"))
+                invoked_awnser = invoked['answer']
+                store.put("interpret", question_key(question), model, {"answer": invoked_awnser})
                 intrepretation.append(invoked_awnser)
                 df.at[i, model.capitalize() + 'Interpretation'] = invoked_awnser
         except Exception as e:
             print(f"Error invoking graph for question {question} with model {model}: {e}")
             df.at[i, model.capitalize() + 'Interpretation'] = None
             continue
-        mistral_score = []
-        google_score = []
-        openai_score = []
-        reasoning_scores = []
-        for model in ['mistral', 'google', 'openai']:
-            control_list = []
-            while len(control_list) < 5:
-                try:
-                    model_score = call_reasoning_llm(question, goldendaten, intrepretation, model)
-                    control_list.append(model_score['scores']['text1'] + model_score['scores']['text2'] + model_score['scores']['text3'])
-                    model_score['reasoning'] 
-                    mistral_score.append(model_score['scores']['text1'])
-                    google_score.append(model_score['scores']['text2'])
-                    openai_score.append(model_score['scores']['text3'])
-                    reasoning_scores.append(model_score['reasoning'])
-                except Exception as e:
-                    print(f"Error calling reasoning llm for question {question} with model {model}: {e}")
-                    continue
+        # 5 Stimmen pro reasoning LLM, vorhandene Stimmen kommen aus dem Cache des Judge-Schedulers
+        result = loop.run_until_complete(judge_interpretations(question, goldendaten, intrepretation))
+        mistral_score, google_score, openai_score = result['text1'], result['text2'], result['text3']
+        reasoning_scores = result['reasoning']
         df.at[i, 'MistralVotes'] = mistral_score
         df.at[i, 'GoogleVotes'] = google_score
         df.at[i, 'OpenaiVotes'] = openai_score
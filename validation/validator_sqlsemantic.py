@@ -1,15 +1,12 @@
 import sys
 sys.path.append('../')
 import pandas as pd
-from app.agent.schema import arrivals, departures, station, trainnames, holidays
+from app.agent.schema import schema_prompt
 from dotenv import load_dotenv
 from langfuse.langchain import CallbackHandler
 from tqdm import tqdm
-from langchain_mistralai import ChatMistralAI
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import judge
 
 langfuse_handler = CallbackHandler()
 def load_excel_data(file_path: str) -> pd.DataFrame:
@@ -18,14 +15,13 @@ def load_excel_data(file_path: str) -> pd.DataFrame:
     """
     return pd.read_excel(file_path, sheet_name="Questions")
 
-def call_reasoning_llm(question: str, goldenquery: list, generatedquery: list, model: str) -> str:
+def judge_prompt(question: str, goldenquery: str, generatedquery: str) -> str:
     """
-    Rufe das reasoning LLM auf, um die Bewertung der Daten zu erhalten.
+    Prompt für das reasoning LLM, um die generierte SQL-Abfrage zu bewerten.
     :param question: Die Frage, die beantwortet werden soll.
     :param goldenquery: Die goldene SQL-Abfrage, die als Referenz dient.
     :param generatedquery: Die generierte SQL-Abfrage, die bewertet werden soll.
-    :param model: Das Modell, das verwendet werden soll (mistral, openai, google).
-    :return: Die Antwort des Modells.
+    :return: Der fertige Prompt.
     """
     template = """# TASK
 - Given a natural-language Question, a database Schema with table/column definitions, a Golden SQL query, and a generated SQL query, evaluate how well the generated query matches the intended semantics.
@@ -45,11 +41,7 @@ Question:
 {question}
 
 schema of oebb: 
-- {arrivals.name}: {arrivals.columns._all_columns}
-- {departures.name}: {departures.columns._all_columns}
-- {station.name}: {station.columns._all_columns}
-- {trainnames.name}: {trainnames.columns._all_columns}
-- {holidays.name}: {holidays.columns._all_columns}
+{schema}
 
 Golden Query:
 ```sql
@@ -61,50 +53,39 @@ Generated Query:
 
 # EXPECTED OUTPUT FORMAT (JSON-like)
 {json_output}"""
-    formated_template = template.format(
+    return template.format(
         question=question,
         goldenquery=goldenquery,
         generated_query=generatedquery,
-        arrivals=arrivals,
-        departures=departures,
-        station=station,
-        trainnames=trainnames,
-        holidays=holidays,
+        schema=schema_prompt(),
         json_output="""{"score": <1-5>,
         "reasoning": "<Brief, explanation for the assigned scores>"
         }"""
     )
-    if model == "mistral":
-        response = ChatMistralAI(
-            model_name="magistral-medium-latest",
-            timeout=600
-        ).invoke(formated_template, config={"callbacks": [langfuse_handler],"metadata": {
-            "langfuse_user_id": "admin",
-            "langfuse_session_id": "SQLsemantic_reasoning",
-        }})
-        scoring = json.loads(response.content[1]['text'].replace('```json', '').replace('```', ''))
-    elif model == "openai":
-        response = ChatOpenAI(
-            model="&-2025-04-16",
-            temperature=1
-        ).invoke(formated_template, config={"callbacks": [langfuse_handler],"metadata": {
-            "langfuse_user_id": "admin",
-            "langfuse_session_id": "SQLsemantic_reasoning",
-        }})
-        scoring = json.loads(response.content.replace('```json', '').replace('```', ''))
-    elif model == "google":
-        response = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
-        ).invoke(formated_template, config={"callbacks": [langfuse_handler],"metadata": {
-            "langfuse_user_id": "admin",
-            "langfuse_session_id": "SQLsemantic_reasoning",
-        }})
-        scoring = json.loads(response.content.replace('```json', '').replace('```', ''))
-    else:
-        raise ValueError(f"Unsupported model: {model}")
-    
+
+def parse_score(content: str) -> dict:
+    """
+    Lese die Bewertung ({"score": 1-5, "reasoning": ...}), ungültige Antworten werfen eine Ausnahme.
+    """
+    scoring = judge.parse_json(content)
+    if not 1 <= float(scoring["score"]) <= 5 or "reasoning" not in scoring:
+        raise ValueError(f"Invalid scoring: {scoring}")
     return scoring
 
+async def judge_query(question: str, goldenquery: str, generatedquery: str, votes: int = 5) -> dict:
+    """
+    Bewerte eine generierte SQL-Abfrage mit votes Stimmen jedes reasoning LLMs (über den geteilten Judge-Scheduler).
+    :return: Die Stimmen, der Mittelwert und die Begründungen.
+    """
+    collected = await judge.get_scheduler().votes(judge_prompt(question, goldenquery, generatedquery), parse_score, votes,
+                                                  config={"callbacks": [langfuse_handler], "metadata": {
+                                                      "langfuse_user_id": "admin",
+                                                      "langfuse_session_id": "SQLsemantic_reasoning",
+                                                  }})
+    all_votes = [v for model_votes in collected.values() for v in model_votes]
+    scores = [v["score"] for v in all_votes]
+    return {"votes": scores, "score": sum(scores)/len(scores) if scores else 0, "reasoning": [v["reasoning"] for v in all_votes]}
+
 def main():
     df = load_excel_data("../questions/questions.xlsx")
     print("Excel-Daten geladen:")
@@ -119,37 +100,20 @@ def main():
         df[col] = df[col].astype(object)
     
     
+    loop = asyncio.new_event_loop()
     for i, row in tqdm(df.iterrows(), total=df.shape[0], desc="Processing questions"):
         question = row['Frage']
         goldensql = row["GoldenSQL"]
         for candidate in tqdm(['Mistral','Google','Openai'], desc="Processing candidate queries", leave=False):
             query = row[f"{candidate}SQL"]
-            reasoning_models = ['mistral','google','openai']
-            scores_by_model = {rm: [] for rm in reasoning_models}
-            reasonings_by_model = {rm: [] for rm in reasoning_models}
-            # Folgende WITH-Zeile wurde mithilfe von Copilot erstellt
-            with ThreadPoolExecutor(max_workers=len(reasoning_models)*2) as executor:
-                futures = {
-                    executor.submit(call_reasoning_llm, question, goldensql, query, rm): rm
-                    for rm in reasoning_models
-                    for _ in range(5)
-                }
-                for future in as_completed(futures):
-                    rm = futures[future]
-                    try:
-                        res = future.result()
-                        scores_by_model[rm].append(res['score'])
-                        reasonings_by_model[rm].append(res['reasoning'])
-                    except Exception:
-                        continue
-
-            all_scores = [score for votes in scores_by_model.values() for score in votes]
-            all_reasonings = [r for reasoning_list in reasonings_by_model.values() for r in reasoning_list]
-            df.at[i, f"{candidate}SQLSemanticVotes"] = all_scores
-            df.at[i, f"{candidate}SQLSemanticScore"] = sum(all_scores)/len(all_scores) if all_scores else 0
-            df.at[i, f"{candidate}SQLSemanticReasoning"] = all_reasonings
+            # 5 Stimmen pro reasoning LLM, vorhandene Stimmen kommen aus dem Cache des Judge-Schedulers
+            result = loop.run_until_complete(judge_query(question, goldensql, query))
+            df.at[i, f"{candidate}SQLSemanticVotes"] = result["votes"]
+            df.at[i, f"{candidate}SQLSemanticScore"] = result["score"]
+            df.at[i, f"{candidate}SQLSemanticReasoning"] = result["reasoning"]
         # Speichern der Ergebnisse in einer Excel-Datei
         df.to_excel("../questions/results_sqlsemantic.xlsx", index=False, engine='openpyxl')
+    print(f"Judge-Aufrufe: {judge.get_scheduler().stats}")
 
 if __name__ == "__main__":
     load_dotenv('../app/.env')
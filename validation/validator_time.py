@@ -1,9 +1,12 @@
 import sys
+import asyncio
 sys.path.append('../')
 import pandas as pd
 from app.agent.schema import engine
-from sqlalchemy import text
 from app.agent.agent import workflow
+from app.agent.executor import execute_query_sync
+from app.agent.result import row_count, to_records
+import timing
 from dotenv import load_dotenv
 from langfuse.langchain import CallbackHandler
 from langchain.schema.runnable.config import RunnableConfig
@@ -17,53 +20,36 @@ def load_excel_data(file_path: str) -> pd.DataFrame:
 
 def run_query(query:str, explain:bool=False):
     """
-    Führe die gegebene SQL-Abfrage aus und gebe die Ergebnisse zurück. Falls explain=True, wird die Abfrage nicht ausgeführt, sondern mit EXPLAIN ANALYZE erklärt.
+    Führe die gegebene SQL-Abfrage aus und gebe die Ergebnisse zurück. Falls explain=True, wird die Abfrage nicht ausgeführt, sondern einmal mit EXPLAIN ANALYZE gemessen.
+    Für wiederholte Messungen mit Aufwärmen, Median und Konfidenzintervall siehe timing.time_queries.
     """
     # Timeout in Millisekunden (7,5 Minuten)
     statement_timeout = 450000
     if explain:
-        # Rüfen ob eine Abfrage mehrere SQL-Abfragen enthält
-        # und diese dann einzeln ausführen
-        query_splitted = query.replace('\n', ' ').rsplit('; ')
-        if len(query_splitted) == 1:
-            # Wenn nur eine Abfrage vorhanden ist, dann diese direkt ausgeführt werden
-            prepared_query = f"EXPLAIN ANALYZE {query}"
-            with engine.connect() as conn:
-                conn.execute(text(f"SET statement_timeout = {statement_timeout}"))
-                result = conn.execute(text(prepared_query)).fetchall()
-            try:
-                return  pd.DataFrame([{'plantime': float(result[-6][0].rsplit(':')[1].rsplit(' ')[1]), 'executiontime': float(result[-1][0].rsplit(':')[1].rsplit(' ')[1])}])
-            except:
-                try:
-                    return pd.DataFrame([{'plantime': float(result[-2][0].rsplit(':')[1].rsplit(' ')[1]), 'executiontime': float(result[-1][0].rsplit(':')[1].rsplit(' ')[1])}])
-                except:
-                    raise ValueError("Could not parse the result of EXPLAIN ANALYZE. Please check the query syntax or the database connection.")
-        else:
-            # Wenn mehrere Abfragen vorhanden sind, dann werden diese einzeln ausgeführt und die gesamten Zeiten addiert
-            plantime = []
-            executiontime = []
-            for i, q in enumerate(query_splitted):
-                query = f"EXPLAIN ANALYZE {q}"
-                with engine.connect() as conn:
-                    conn.execute(text(f"SET statement_timeout = {statement_timeout}"))
-                    result = conn.execute(text(query)).fetchall()
-                plantime.append(float(result[-6][0].rsplit(':')[1].rsplit(' ')[1]))
-                executiontime.append(float(result[-1][0].rsplit(':')[1].rsplit(' ')[1]))
-            return pd.DataFrame([{'plantime': sum(plantime), 'executiontime': sum(executiontime)}])
+        # Mehrere SQL-Abfragen werden einzeln gemessen und die Zeiten addiert
+        with engine.connect() as conn:
+            measured = timing.explain_sync(conn, query, statement_timeout)
+        return pd.DataFrame([measured])
     # Unterstützung für mehrere SQL-Abfragen: Query an Semikolon trennen und Ergebnisse zusammenführen
-    statements = [q.strip() for q in query.strip().split(';') if q.strip()]
-    dfs = []
-    with engine.connect() as conn:
-            # Timeout nach den statement_timeout setzen
-            conn.execute(text(f"SET statement_timeout = {statement_timeout}"))
-            for stmt in statements:
-                compiled = text(stmt).compile(bind=conn)
-                df = pd.read_sql_query(compiled, con=conn)
-                dfs.append(df)
-    if not dfs:
-        return []
-    combined_df = pd.concat(dfs, ignore_index=True)
-    return combined_df.to_dict(orient="records")
+    # Die Ergebnisse werden über serverseitige Cursor chunkweise gelesen und bei QUERY_MAX_ROWS/QUERY_MAX_BYTES abgeschnitten
+    result = execute_query_sync(query, engine, timeout=statement_timeout)
+    if result["truncated"]:
+        print(f"Result truncated after {result['rows']} rows")
+    return to_records(result)
+
+# Spalten der Ergebnis-Tabelle pro Abfrage (Präfix Golden, Mistral, Google, Openai) -> Wert aus timing.summarize
+# ExecutionTime und PlanTime sind der Median der warmen Läufe in Millisekunden
+time_columns = {
+    'ExecutionTime': 'executiontime',
+    'PlanTime': 'plantime',
+    'ExecutionTimeP95': 'executiontime_p95',
+    'ExecutionTimeCILow': 'executiontime_ci_low',
+    'ExecutionTimeCIHigh': 'executiontime_ci_high',
+    'ColdExecutionTime': 'cold_executiontime',
+    'SharedHitBlocks': 'shared_hit',
+    'SharedReadBlocks': 'shared_read',
+    'ColdSharedReadBlocks': 'cold_shared_read',
+}
 
 def main():
     langfuse_handler = CallbackHandler()
@@ -79,6 +65,8 @@ def main():
         df[col] = None
         df[col] = df[col].astype(object)
     graph = workflow().compile().with_config({"run_name": "T2TSDB-Agent"})
+    # Ein Event-Loop für alle Aufrufe, damit die geteilten HTTP-Clients der Modelle gültig bleiben
+    loop = asyncio.new_event_loop()
     for i, row in tqdm(df.iterrows(), total=df.shape[0], desc="Processing questions"):
         question = row['Frage']
         golden_query = row["GoldenSQL"]
@@ -86,40 +74,38 @@ def main():
 
         data = run_query(golden_query, explain=False)
         df.at[i, 'GoldenDaten'] = data
-        for x in tqdm(range(10), desc="GoldenSQL explain analyze runs", leave=False):
-            temp_df = pd.DataFrame()
-            time_result = run_query(golden_query, explain=True)
-            temp_df = pd.concat([temp_df, time_result], ignore_index=True)
-        df.at[i, 'GoldenExecutionTime'] = temp_df['executiontime'].mean()
-        df.at[i, 'GoldenPlanTime'] = temp_df['plantime'].mean()
+        queries = {'Golden': golden_query}
         for model in ['mistral','google','openai']:
             config = {
                 "model_query": model,
-                "model_interpret": "dryrun", "metadata": {
+                "model_interpret": "dryrun", "offload": False,
+                # Ohne die Gold-SQL der eigenen Frage als Few-Shot-Beispiel (agent.sql_memory)
+                "sql_memory_leave_one_out": True,
+                # Ohne SQL- und Ergebnis-Cache: sonst bewertet jedes Modell das SQL des vorherigen bzw. früherer Läufe
+                "cache": False, "metadata": {
                     "langfuse_user_id": "admin",
                     "langfuse_session_id": "testing",
                 }
             }
-            invoked_graph = graph.invoke({'question': question, 'config':config}, RunnableConfig(callbacks=[langfuse_handler], **config))
+            invoked_graph = loop.run_until_complete(graph.ainvoke({'question': question, 'config':config}, RunnableConfig(callbacks=[langfuse_handler], **config)))
             df.at[i, model.capitalize()+'SQL'] = invoked_graph['query']
-            if len(invoked_graph['data']) == 0:
+            if row_count(invoked_graph.get('data')) == 0:
                 df.at[i, model.capitalize()+'Daten'] = None
             else:
-                df.at[i, model.capitalize()+'Daten'] = invoked_graph['data']
-            try:
-                for x in tqdm(range(10), desc=f"{model.capitalize()} explain analyze runs", leave=False):
-                    temp_df = pd.DataFrame()
-                    time_result = run_query(invoked_graph['query'], explain=True)
-                    temp_df = pd.concat([temp_df, time_result], ignore_index=True)
-                df.at[i, model.capitalize()+'ExecutionTime'] = temp_df['executiontime'].mean()
-                df.at[i, model.capitalize()+'PlanTime'] = temp_df['plantime'].mean()
-            except Exception as e:
-                print(f"Error executing {model.capitalize()} query for question {question}: {e}")
-                df.at[i, model.capitalize()+'ExecutionTime'] = None
-                df.at[i, model.capitalize()+'PlanTime'] = None
-                if df.at[i, model.capitalize()+'Daten'] is None:
-                    df.at[i, model.capitalize()+'Daten'] = e
+                df.at[i, model.capitalize()+'Daten'] = to_records(invoked_graph['data'])
+            queries[model.capitalize()] = invoked_graph['query']
+        # Zeitmessung der Golden Query und der Abfragen der Modelle, unabhängige Abfragen laufen parallel
+        timings = loop.run_until_complete(timing.time_queries(queries))
+        for prefix, measured in timings.items():
+            if "error" in measured:
+                print(f"Error executing {prefix} query for question {question}: {measured['error']}")
+                df.at[i, prefix+'ExecutionTime'] = None
+                df.at[i, prefix+'PlanTime'] = None
+                if prefix != 'Golden' and df.at[i, prefix+'Daten'] is None:
+                    df.at[i, prefix+'Daten'] = measured['error']
                 continue
+            for column, key in time_columns.items():
+                df.at[i, prefix+column] = measured.get(key)
     # Speichern der Ergebnisse in einer Excel-Datei
         df.to_excel("../questions/results_time.xlsx", index=False, engine='openpyxl')
             